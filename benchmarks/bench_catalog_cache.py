@@ -0,0 +1,91 @@
+# Katalog keshi benchmarki: bitta "browse" sessiyasi uchun MongoDB'ga
+# nechta so'rov ketishini kesh bilan va keshsiz solishtiradi.
+#
+#   MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_catalog_cache.py
+#
+# Ma'lumotlar alohida bazaga yoziladi (MONGO_DB_NAME, standart: sss_bench).
+import asyncio
+import os
+import sys
+import time
+
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "sss_bench")
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+counter = CommandCounter()
+monitoring.register(counter)
+
+import database  # noqa: E402
+
+# listener client yaratilishidan oldin ro'yxatdan o'tishi kerak
+database.init_db()
+
+CATEGORIES = ["Сантехника", "Электр", "Асбоб-ускуналар"]
+PER_CATEGORY = 40
+SESSIONS = 200
+
+
+async def seed():
+    await database.products_col.delete_many({})
+    # Kategoriya reestri (kolleksiya, counter, jarayon xotirasidagi nom <-> id) ham tozalanadi
+    await database.categories_col.delete_many({})
+    await database.counters_col.delete_many({"_id": "category_id"})
+    database._category_ids.clear()
+    database._category_names.clear()
+    for cat in CATEGORIES:
+        for i in range(PER_CATEGORY):
+            await database.add_product(f"{cat} #{i}", f"A-{i}", 1000 + i, "file_id", cat)
+
+
+async def browse_session():
+    # Foydalanuvchi yo'li: do'kon -> kategoriya -> 2 sahifa -> 3 ta mahsulot -> orqaga
+    cats = await database.get_categories()
+    cat = cats[0]["name"]
+    prods, _ = await database.get_products_by_category_paginated(cat, 0, 6)
+    await database.get_products_by_category_paginated(cat, 1, 6)
+    for p in prods[:3]:
+        await database.get_product(str(p["_id"]))
+    await database.get_products_by_category_paginated(cat, 0, 6)
+    await database.get_categories()
+
+
+async def run(cached):
+    database.clear_catalog_cache()
+    counter.count = 0
+    t0 = time.perf_counter()
+    for _ in range(SESSIONS):
+        if not cached:
+            database.clear_catalog_cache()
+        await browse_session()
+    elapsed = time.perf_counter() - t0
+    return counter.count, elapsed
+
+
+async def main():
+    await seed()
+    for label, cached in (("keshsiz", False), ("kesh bilan", True)):
+        ops, elapsed = await run(cached)
+        print(f"{label:>12}: {ops / SESSIONS:6.2f} so'rov/sessiya, {elapsed * 1000 / SESSIONS:7.2f} ms/sessiya")
+    print("kesh statistikasi:", database.get_cache_stats())
+    await database.products_col.delete_many({})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
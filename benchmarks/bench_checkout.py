@@ -0,0 +1,59 @@
+# Checkout stress-testi: yuzlab xaridor bir vaqtda bitta mahsulotni sotib oladi.
+# Omborda STOCK dona bor; oxirida aynan STOCK ta buyurtma yaratilgani va
+# qoldiq hech qachon manfiy bo'lmagani tekshiriladi.
+#
+#   MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 python benchmarks/bench_checkout.py [xaridorlar] [stock]
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "sss_bench")
+
+import database  # noqa: E402
+
+database.init_db()
+
+
+async def main():
+    buyers = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    stock = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    await database.products_col.delete_many({})
+    await database.orders_col.delete_many({})
+    await database.ensure_indexes()
+    pid = str(await database.add_product("Stress", "S-1", 100, "file_id", "Bench"))
+    other = str(await database.add_product("Other", "S-2", 50, "file_id", "Bench"))
+    await database.set_product_stock(pid, stock)
+
+    async def buyer(i):
+        cart = {pid: {"name": "Stress", "price": 100, "qty": 1}, other: {"name": "Other", "price": 50, "qty": 1}}
+        t0 = time.perf_counter()
+        oid, failed = await database.checkout_order(i, "bench", "000", cart, 150, "bench", "bench", "bench", "bench")
+        return oid, failed, time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(buyer(i) for i in range(buyers)))
+    elapsed = time.perf_counter() - t0
+
+    ok = sum(1 for oid, _, _ in results if oid)
+    short = sum(1 for _, failed, _ in results if failed == [pid])
+    latencies = sorted(r[2] for r in results)
+    final = (await database.products_col.find_one({"_id": database.ObjectId(pid)}))["stock"]
+    orders = await database.orders_col.count_documents({})
+
+    print(f"xaridorlar: {buyers}, boshlang'ich stock: {stock}, rejim: "
+          f"{'tranzaksiya' if database._transactions_supported else 'ketma-ket'}")
+    print(f"muvaffaqiyatli: {ok}, 'yetarli emas': {short}, buyurtmalar: {orders}, qoldiq: {final}")
+    print(f"{buyers / elapsed:.0f} checkout/s, p50={latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+
+    await database.products_col.delete_many({})
+    await database.orders_col.delete_many({})
+    if ok != min(buyers, stock) or final != max(0, stock - buyers) or orders != ok:
+        sys.exit("XATO: ombor qoldig'i yoki buyurtmalar soni noto'g'ri")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
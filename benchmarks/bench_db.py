@@ -0,0 +1,189 @@
+# database.py funksiyalarining ma'lumot hajmiga bog'liqligi: 1k, 100k va 1M mahsulot
+# va buyurtmada har bir funksiya indekslarsiz va ensure_indexes() dan keyin o'lchanadi.
+# Kesh har chaqiruvdan oldin tozalanadi — o'lchanadigan narsa MongoDB so'rovining o'zi.
+# Funksiyalar db_call qobig'isiz (__wrapped__) chaqiriladi: xato jimgina default
+# qiymatga aylanmaydi, jadvalda "xato" bo'lib ko'rinadi (masalan, indekssiz katta sort).
+#
+#   MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_db.py [1000,100000,1000000] [takrorlar]
+#
+# Ma'lumotlar alohida bazaga yoziladi (MONGO_DB_NAME, standart: sss_bench).
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "sss_bench")
+
+import database  # noqa: E402
+
+database.init_db()
+
+SCALES = [1_000, 100_000, 1_000_000]
+REPEATS = 5
+CATEGORIES = [f"Категория {i}" for i in range(20)]
+STATUSES = ["new"] * 2 + ["accepted"] * 3 + ["done"] * 14 + ["canceled"]
+PAGE_SIZE = 6
+BATCH = 10_000
+YEAR = 365 * 24 * 3600
+
+
+def _products(n, now):
+    for i in range(n):
+        yield {
+            "name": f"Маҳсулот {i}", "article": f"A-{i:07d}", "price": random.randint(100, 50_000),
+            "file_id": None, "category": CATEGORIES[i % len(CATEGORIES)],
+            # ~5% omborda yo'q
+            "stock": 0 if i % 20 == 0 else random.randint(1, 500),
+            "created_at": now - random.uniform(0, YEAR)
+        }
+
+
+def _orders(n, now, pids):
+    for i in range(n):
+        cart = {}
+        for pid in random.sample(pids, k=min(len(pids), random.randint(1, 3))):
+            cart[pid] = {"name": "Маҳсулот", "price": random.randint(100, 50_000), "qty": random.randint(1, 5)}
+        yield {
+            "order_id": i + 1, "user_id": random.randint(1, n // 5 + 1), "user_name": "bench", "phone": "000",
+            "cart": cart, "total_price": sum(x["price"] * x["qty"] for x in cart.values()),
+            "pay_method": "bench", "delivery_type": "bench", "location": "bench", "comment": "",
+            "delivery_price": 0, "closest_base": None, "status": random.choice(STATUSES),
+            "created_at": now - random.uniform(0, YEAR)
+        }
+
+
+async def _insert(col, docs):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= BATCH:
+            await col.insert_many(batch, ordered=False)
+            batch = []
+    if batch: await col.insert_many(batch, ordered=False)
+
+
+async def seed(n):
+    for col in (database.products_col, database.orders_col, database.stats_col, database.counters_col, database.categories_col):
+        await col.drop()
+    database._category_ids.clear()
+    database._category_names.clear()
+    now = time.time()
+    t0 = time.perf_counter()
+    await _insert(database.products_col, _products(n, now))
+    await database.rebuild_categories()
+    pids = [str(p["_id"]) for p in await database.products_col.find({}, {"_id": 1}).limit(1000).to_list(length=None)]
+    await _insert(database.orders_col, _orders(n, now, pids))
+    await database.counters_col.update_one({"_id": "order_id"}, {"$set": {"seq": n}}, upsert=True)
+    print(f"  {n:,} mahsulot + {n:,} buyurtma yozildi: {time.perf_counter() - t0:.1f}s")
+    return pids
+
+
+def _reset_caches():
+    database.clear_catalog_cache()
+    database._invalidate_settings()
+    database._invalidate_order_counts()
+
+
+def _raw(fn):
+    return getattr(fn, "__wrapped__", fn)
+
+
+async def _time(fn, *args, repeats=REPEATS):
+    samples = []
+    for _ in range(repeats):
+        _reset_caches()
+        start = time.perf_counter()
+        try:
+            await _raw(fn)(*args)
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"[:200]
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, None
+
+
+def cases(n, pids):
+    per_cat = n // len(CATEGORIES)
+    last = max(0, (per_cat - 1) // PAGE_SIZE)
+    cat = CATEGORIES[0]
+    order_id = random.randint(1, n)
+    cart = {pids[0]: {"name": "Маҳсулот", "price": 1000, "qty": 1}}
+    return [
+        ("get_categories", database.get_categories, (), REPEATS),
+        ("paginated: 0-sahifa", database.get_products_by_category_paginated, (cat, 0, PAGE_SIZE), REPEATS),
+        ("paginated: o'rta sahifa", database.get_products_by_category_paginated, (cat, last // 2, PAGE_SIZE), REPEATS),
+        ("paginated: oxirgi sahifa", database.get_products_by_category_paginated, (cat, last, PAGE_SIZE), REPEATS),
+        ("keyset: 1-sahifa", database.get_products_by_category_keyset, (cat, None, None, PAGE_SIZE), REPEATS),
+        ("get_product", database.get_product, (random.choice(pids),), REPEATS),
+        ("get_all_products", database.get_all_products, (), REPEATS),
+        ("get_orders_by_status(new)", database.get_orders_by_status, ("new",), REPEATS),
+        ("get_orders_page(new)", database.get_orders_page, ("new",), REPEATS),
+        ("get_order_counts", database.get_order_counts, (), REPEATS),
+        ("get_order_by_id", database.get_order_by_id, (order_id,), REPEATS),
+        ("get_combined_info", database.get_combined_info, (), REPEATS),
+        ("create_order", database.create_order, (1, "bench", "000", cart, 1000, "bench", "bench", "bench", ""), REPEATS),
+        ("load_search_index", database.load_search_index, (), 1),
+        ("rebuild_stats", database.rebuild_stats, (), 1),
+        ("rebuild_categories", database.rebuild_categories, (), 1),
+    ]
+
+
+async def drop_indexes():
+    for col in (database.products_col, database.orders_col):
+        await col.drop_indexes()
+
+
+async def run_scale(n):
+    pids = await seed(n)
+    print(f"  kategoriyada {n // len(CATEGORIES):,} mahsulot, oxirgi sahifa: {max(0, (n // len(CATEGORIES) - 1) // PAGE_SIZE)}")
+    results = {}
+    for mode in ("indekssiz", "indeks"):
+        if mode == "indekssiz": await drop_indexes()
+        else: await database.ensure_indexes()
+        for label, fn, args, repeats in cases(n, pids):
+            ms, error = await _time(fn, *args, repeats=repeats)
+            results.setdefault(label, {})[mode] = ms
+            if error: print(f"  {label} ({mode}): {error}")
+    return results
+
+
+def print_table(all_results):
+    columns = [(n, mode) for n in all_results for mode in ("indekssiz", "indeks")]
+    labels = []
+    for results in all_results.values():
+        for label in results:
+            if label not in labels: labels.append(label)
+    head = "".join(f"{f'{n:,} {mode}':>18}" for n, mode in columns)
+    print(f"\n{'funksiya (median ms)':<32}{head}")
+    for label in labels:
+        cells = []
+        for n, mode in columns:
+            ms = all_results[n].get(label, {}).get(mode)
+            cells.append(f"{'xato':>18}" if ms is None else f"{ms:>18.2f}")
+        print(f"{label:<32}{''.join(cells)}")
+
+
+async def main():
+    scales = [int(x) for x in sys.argv[1].split(",")] if len(sys.argv) > 1 else SCALES
+    global REPEATS
+    if len(sys.argv) > 2: REPEATS = int(sys.argv[2])
+    random.seed(1)
+    if not await database.ping_db(): sys.exit("MongoDB javob bermayapti")
+    all_results = {}
+    for n in scales:
+        print(f"\n== {n:,} ==")
+        all_results[n] = await run_scale(n)
+        print_table({n: all_results[n]})
+    if len(scales) > 1: print_table(all_results)
+    with open("bench_db.json", "w", encoding="utf-8") as f:
+        json.dump({str(n): r for n, r in all_results.items()}, f, ensure_ascii=False, indent=2)
+    for col in (database.products_col, database.orders_col, database.stats_col, database.counters_col, database.categories_col):
+        await col.drop()
+    await database.ensure_indexes()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+# Katalog importi: 50k qatorli CSV (yangi mahsulotlar), keyin shu fayl qayta
+# (hammasi mavjud — faqat yangilash) va 50k qatorli faqat-ombor fayli.
+#
+#   MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_import.py
+import asyncio
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "sss_bench")
+
+import database  # noqa: E402
+
+database.init_db()
+import importer  # noqa: E402
+
+ROWS = 50_000
+
+
+def _write(path, full):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(["article", "name", "price", "stock", "category"] if full else ["article", "stock"])
+        for i in range(ROWS):
+            stock = random.randint(0, 50)
+            w.writerow([f"SSS-{i:06d}", f"Товар {i}", random.randint(100, 9000), stock, f"Категория {i % 25}"] if full else [f"SSS-{i:06d}", stock])
+
+
+async def _run(label, path):
+    t0 = time.perf_counter()
+    result = await importer.import_products(path)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<22} | {elapsed:>7.2f} s | {ROWS / elapsed:>9.0f} qator/s | yangi {result.inserted:>6} | yangilandi {result.updated:>6} | xato {len(result.errors)}")
+
+
+async def main():
+    random.seed(42)
+    await database.products_col.delete_many({})
+    await database.ensure_indexes()
+    with tempfile.TemporaryDirectory() as tmp:
+        full, stock = os.path.join(tmp, "full.csv"), os.path.join(tmp, "stock.csv")
+        _write(full, True)
+        _write(stock, False)
+        await _run("yangi mahsulotlar", full)
+        await _run("qayta import", full)
+        await _run("faqat ombor", stock)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# Eng yaqin bazani topish: eski usul (hamma bazani yuklab, haversine sikli),
+# $geoNear (2dsphere indeks) va xotiradagi k-d daraxtni 100, 10k, 100k bazada solishtiradi.
+#
+#   MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_nearest_base.py
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "sss_bench")
+
+import database  # noqa: E402
+
+database.init_db()
+
+SIZES = [100, 10_000, 100_000]
+QUERIES = 200
+# Qirg'iziston chegaralari atrofida tasodifiy nuqtalar
+LAT, LON = (39.2, 43.3), (69.2, 80.3)
+
+
+def _point():
+    return random.uniform(*LAT), random.uniform(*LON)
+
+
+async def _seed(n):
+    await database.bases_col.delete_many({})
+    docs = []
+    for i in range(n):
+        lat, lon = _point()
+        docs.append({"name": f"База {i}", "lat": lat, "lon": lon, "loc": {"type": "Point", "coordinates": [lon, lat]}})
+    for i in range(0, n, 10_000):
+        await database.bases_col.insert_many(docs[i:i + 10_000])
+    await database.ensure_indexes()
+    database._invalidate_bases()
+
+
+async def _legacy(lat, lon):
+    bases = await database.bases_col.find().to_list(length=None)
+    return min(bases, key=lambda b: database.calculate_distance(b['lat'], b['lon'], lat, lon))
+
+
+async def _timed(fn, points):
+    t0 = time.perf_counter()
+    results = [await fn(lat, lon) for lat, lon in points]
+    return (time.perf_counter() - t0) * 1000 / len(points), results
+
+
+async def main():
+    random.seed(42)
+    print(f"{'bazalar':>8} | {'eski sikl, ms':>14} | {'$geoNear, ms':>13} | {'k-d daraxt, ms':>15} | {'qurish, ms':>10} | mos")
+    for n in SIZES:
+        await _seed(n)
+        points = [_point() for _ in range(QUERIES)]
+
+        legacy_points = points[:20] if n > 10_000 else points
+        legacy_ms, legacy = await _timed(_legacy, legacy_points)
+        geo_ms, geo = await _timed(database._nearest_base_geo, points)
+
+        t0 = time.perf_counter()
+        await database._get_base_index()
+        build_ms = (time.perf_counter() - t0) * 1000
+        mem_ms, mem = await _timed(database._nearest_base_memory, points)
+
+        agree = all(a["_id"] == b["_id"] == c["_id"] for a, b, c in zip(legacy, geo, mem))
+        print(f"{n:>8} | {legacy_ms:>14.2f} | {geo_ms:>13.2f} | {mem_ms:>15.3f} | {build_ms:>10.0f} | {'ha' if agree else 'YOQ'}")
+    await database.bases_col.delete_many({})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+# Buyurtma ID taqsimlovchisi uchun parallel yuklama tekshiruvi.
+# Bir nechta jarayon (replikani taqlid qiladi) bir vaqtda o'n minglab buyurtma yaratadi,
+# so'ng barcha order_id lar takrorlanmasligi tekshiriladi. Workerlar spawn bilan ishga
+# tushadi va har bir asyncio.run o'z klientini yaratib, oxirida yopadi (motor klienti
+# birinchi ishlatilgan loop ga bog'lanadi). Mongo siz tekshiruv: tests/test_order_ids.py
+#
+#   MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_order_ids.py [jami] [jarayonlar]
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "sss_bench")
+
+CONCURRENCY = 500
+
+
+async def _worker(count):
+    import database
+    database.init_db()
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i):
+        async with sem:
+            return await database.create_order(i, "bench", "000", {}, 0, "bench", "bench", "bench", "bench")
+
+    try:
+        ids = await asyncio.gather(*(one(i) for i in range(count)))
+    finally:
+        database.close_db()
+    return sum(1 for i in ids if i is None)
+
+
+def _run_worker(count, failures):
+    failures.put(asyncio.run(_worker(count)))
+
+
+async def _prepare():
+    import database
+    database.init_db()
+    try:
+        await database.orders_col.delete_many({})
+        await database.counters_col.delete_many({"_id": "order_id"})
+        await database.ensure_indexes()
+    finally:
+        database.close_db()
+
+
+async def _verify():
+    import database
+    database.init_db()
+    try:
+        total = await database.orders_col.count_documents({})
+        distinct = len(await database.orders_col.distinct("order_id"))
+        seq = (await database.counters_col.find_one({"_id": "order_id"}) or {}).get("seq", 0)
+        await database.orders_col.delete_many({})
+    finally:
+        database.close_db()
+    return total, distinct, seq
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    procs = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    asyncio.run(_prepare())
+
+    ctx = multiprocessing.get_context("spawn")
+    failures = ctx.Queue()
+    per_proc = total // procs
+    workers = [ctx.Process(target=_run_worker, args=(per_proc, failures)) for _ in range(procs)]
+    t0 = time.perf_counter()
+    for w in workers: w.start()
+    for w in workers: w.join()
+    elapsed = time.perf_counter() - t0
+    failed = sum(failures.get() for _ in workers)
+
+    created, distinct, seq = asyncio.run(_verify())
+    print(f"yaratildi: {created}, noyob order_id: {distinct}, xato: {failed}")
+    print(f"{created / elapsed:.0f} buyurtma/s, counter so'rovlari: ~{seq // int(os.getenv('ORDER_ID_BLOCK', '50'))}")
+    if created != distinct or failed:
+        sys.exit("XATO: order_id takrorlandi yoki buyurtma yaratilmadi")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# MongoDB uzilishini sinash: har 0.5s da katalog va buyurtma funksiyalarini chaqiradi,
+# kechikish, natija manbai (baza / eski kesh / DatabaseUnavailable) va breaker holatini chiqaradi.
+# Ishlayotgan paytda mongod ni to'xtating (masalan `docker stop mongo`) va qayta yoqing.
+#
+#   MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_outage.py
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "sss_bench")
+os.environ.setdefault("CATALOG_CACHE_TTL", "2")
+
+import database  # noqa: E402
+
+database.init_db()
+import resilience  # noqa: E402
+
+
+async def _probe(fn, *args):
+    t0 = time.perf_counter()
+    try:
+        result = await fn(*args)
+        status = "ok" if result else "bo'sh"
+    except resilience.DatabaseUnavailable:
+        status = "UNAVAILABLE"
+    return f"{fn.__name__}={status} {(time.perf_counter() - t0) * 1000:.0f}ms"
+
+
+async def main():
+    if not await database.ping_db(): return
+    if not await database.get_categories():
+        await database.add_product("Sinov", "T-1", 100, None, "Sinov", stock=5)
+    while True:
+        probes = [await _probe(database.get_categories), await _probe(database.get_order_counts)]
+        print(f"{time.strftime('%H:%M:%S')} | breaker={resilience.breaker.state:<9} | " + " | ".join(probes), flush=True)
+        await asyncio.sleep(0.5)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,85 @@
+# Mahsulot qidiruvi: xotiradagi trigram indeks va oddiy chiziqli qidiruv
+# (har bir mahsulot nomida "q in name") 1k, 10k, 100k mahsulotda.
+# MongoDB kerak emas: faqat search.py indeksi o'lchanadi.
+#
+#   python benchmarks/bench_search.py
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SearchIndex, normalize  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000]
+QUERIES = 300
+BRANDS = ["Samsung", "Xiaomi", "Apple", "Huawei", "Lenovo", "Bosch", "Philips", "Artel", "Tefal", "Sony"]
+KINDS = ["телефон", "чехол", "зарядка", "наушники", "ноутбук", "чайник", "утюг", "пылесос", "кабель", "телевизор"]
+
+
+def _products(n):
+    return [{
+        "_id": f"{i:024x}",
+        "name": f"{random.choice(BRANDS)} {random.choice(KINDS)} {random.randint(1, 999)}",
+        "article": f"SSS-{i:06d}"
+    } for i in range(n)]
+
+
+def _typo(word):
+    i = random.randrange(len(word))
+    return word[:i] + word[i + 1:] if len(word) > 4 else word
+
+
+def _queries(products):
+    out = []
+    for _ in range(QUERIES):
+        p = random.choice(products)
+        brand, kind, _ = p["name"].split()
+        out.append(random.choice([
+            kind[:3],                      # prefiks
+            f"{brand} {kind}",             # to'liq so'zlar
+            f"{_typo(brand)} {kind[:4]}",  # xato yozilgan
+            p["article"]                   # artikul
+        ]))
+    return out
+
+
+def _linear(products, q):
+    q = normalize(q)
+    return [p["_id"] for p in products if q in normalize(f"{p['name']} {p['article']}")][:10]
+
+
+def _timed(fn, queries):
+    times = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return statistics.mean(times), times[int(len(times) * 0.95)]
+
+
+def main():
+    random.seed(42)
+    print(f"{'mahsulot':>9} | {'qurish, ms':>10} | {'indeks o`rt/p95, ms':>20} | {'chiziqli o`rt/p95, ms':>22} | {'xatoli topildi':>14}")
+    for n in SIZES:
+        products = _products(n)
+        t0 = time.perf_counter()
+        index = SearchIndex.build(products)
+        build_ms = (time.perf_counter() - t0) * 1000
+        queries = _queries(products)
+
+        idx_avg, idx_p95 = _timed(lambda q: index.search(q, 10), queries)
+        lin_queries = queries[:30] if n > 10_000 else queries
+        lin_avg, lin_p95 = _timed(lambda q: _linear(products, q), lin_queries)
+
+        # Xato yozilgan so'rovlar (chiziqli qidiruv bularni topa olmaydi)
+        typos = [f"{_typo(p['name'].split()[0])} {p['name'].split()[1]}" for p in random.sample(products, 100)]
+        found = sum(1 for q in typos if index.search(q, 10))
+        print(f"{n:>9} | {build_ms:>10.0f} | {idx_avg:>9.2f} / {idx_p95:>8.2f} | {lin_avg:>10.2f} / {lin_p95:>9.2f} | {found:>10}/100")
+
+
+if __name__ == "__main__":
+    main()
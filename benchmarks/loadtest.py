@@ -0,0 +1,347 @@
+# Yuklama testi: Dispatcher ga sintetik Telegram update'lar oqimini beradi.
+# Har bir virtual foydalanuvchi to'liq yo'lni o'tadi: /start -> do'kon -> kategoriya ->
+# sahifalar (u_p_) -> mahsulot (u_v_) -> savatga qo'shish -> savat -> checkout ->
+# til -> yetkazish -> lokatsiya -> telefon -> chek rasmi (finish_order).
+# Telegram o'rniga soxta session: chiquvchi so'rovlar yoziladi, keyingi tugma
+# oxirgi yuborilgan klaviaturadan tanlanadi. MongoDB — haqiqiy lokal mongod.
+#
+#   MONGO_URL=mongodb://localhost:27017 python benchmarks/loadtest.py --users 2000 --concurrency 200
+#   python benchmarks/loadtest.py --out new.json --compare old.json
+#
+# Natija: updates/s, handler bo'yicha p50/p95/p99, update boshiga Mongo buyruqlari (JSON).
+# Ma'lumotlar alohida bazaga yoziladi (MONGO_DB_NAME, standart: sss_bench).
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "sss_bench")
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+os.environ["MAINTENANCE_MODE"] = "0"
+os.environ["METRICS_PORT"] = "0"
+# Virtual foydalanuvchilar o'ylamasdan bosadi: flood nazorati ularni tashlab yubormasin (middleware baribir o'lchanadi)
+os.environ.setdefault("THROTTLE_RATE", "0")
+os.environ.setdefault("THROTTLE_DEBOUNCE", "0")
+
+from aiogram import BaseMiddleware, Bot  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import GetMe  # noqa: E402
+from aiogram.types import InlineKeyboardMarkup, Message, Update, User  # noqa: E402
+
+CATEGORIES = ["Сантехника", "Электр", "Асбоб-ускуналар", "Бўёқлар", "Қурилиш"]
+PER_CATEGORY = 60
+BASES = [("База Аламедин", 42.88, 74.63), ("База Ош", 42.87, 74.57), ("База Дордой", 42.94, 74.61)]
+USER_ID_BASE = 7_000_000_000
+
+# Joriy update va handler: Mongo buyruqlari shularga yoziladi (motor contextvars nusxasini executor ga o'tkazadi)
+_update_ops = contextvars.ContextVar("update_ops", default=None)
+_handler = contextvars.ContextVar("handler", default="-")
+
+
+class OpsCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.total = 0
+        self.by_handler = Counter()
+
+    def started(self, event):
+        self.total += 1
+        self.by_handler[_handler.get()] += 1
+        ops = _update_ops.get()
+        if ops is not None: ops[0] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+ops_counter = OpsCounter()
+monitoring.register(ops_counter)
+
+import database  # noqa: E402
+import bot as app  # noqa: E402
+
+
+# =====================================================================
+# SOXTA TELEGRAM SESSION
+# =====================================================================
+
+class FakeSession(BaseSession):
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self.markups = {}  # chat_id -> oxirgi inline klaviatura
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency: await asyncio.sleep(self.latency)
+        if isinstance(method, GetMe):
+            return User(id=123456, is_bot=True, first_name="SSS", username="sss_loadtest_bot")
+        chat_id = getattr(method, "chat_id", None)
+        markup = getattr(method, "reply_markup", None)
+        if chat_id is not None and isinstance(markup, InlineKeyboardMarkup):
+            self.markups[chat_id] = markup
+        if "Message" not in str(method.__returning__):
+            return True
+        self._message_id += 1
+        return Message.model_validate({
+            "message_id": self._message_id, "date": int(time.time()),
+            "chat": {"id": chat_id or 0, "type": "private"}, "text": getattr(method, "text", None) or "-"
+        }, context={"bot": bot})
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+# =====================================================================
+# O'LCHOV
+# =====================================================================
+
+class HandlerTimer(BaseMiddleware):
+    def __init__(self, stats):
+        self.stats = stats
+
+    async def __call__(self, handler, event, data):
+        name = getattr(getattr(data.get("handler"), "callback", None), "__name__", "unknown")
+        token = _handler.set(name)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.stats.latency[name].append(time.perf_counter() - start)
+            _handler.reset(token)
+
+
+class Stats:
+    def __init__(self):
+        self.latency = defaultdict(list)  # handler -> [soniya]
+        self.updates = []  # update to'liq vaqti (FSM storage va middlewarelar bilan)
+        self.update_ops = []
+        self.errors = Counter()
+
+
+def percentile(values, q):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3) if values else 0.0
+    }
+
+
+# =====================================================================
+# VIRTUAL FOYDALANUVCHI
+# =====================================================================
+
+class VirtualUser:
+    def __init__(self, n, bot, dp, session, stats, rng):
+        self.id = USER_ID_BASE + n
+        self.bot, self.dp, self.session, self.stats, self.rng = bot, dp, session, stats, rng
+        self.user = {"id": self.id, "is_bot": False, "first_name": f"User{n}"}
+        self.chat = {"id": self.id, "type": "private"}
+
+    async def _feed(self, payload):
+        payload["update_id"] = next(_update_ids)
+        update = Update.model_validate(payload, context={"bot": self.bot})
+        ops = [0]
+        token = _update_ops.set(ops)
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.stats.errors[type(e).__name__] += 1
+        finally:
+            self.stats.updates.append(time.perf_counter() - start)
+            self.stats.update_ops.append(ops[0])
+            _update_ops.reset(token)
+
+    def _message(self, **fields):
+        return {"message": {"message_id": 1, "date": int(time.time()), "chat": self.chat, "from": self.user, **fields}}
+
+    async def send(self, text=None, **fields):
+        if text is not None: fields["text"] = text
+        await self._feed(self._message(**fields))
+
+    async def press(self, data):
+        await self._feed({"callback_query": {
+            "id": str(self.id), "from": self.user, "chat_instance": "loadtest", "data": data,
+            "message": {"message_id": 1, "date": int(time.time()), "chat": self.chat, "text": "-"}
+        }})
+
+    def buttons(self, prefix):
+        markup = self.session.markups.get(self.id)
+        if not markup: return []
+        return [b.callback_data for row in markup.inline_keyboard for b in row if (b.callback_data or "").startswith(prefix)]
+
+    async def browse_and_add(self):
+        await self.send("🛍 Дүкөн")
+        cats = self.buttons("cat_")
+        if not cats: return False
+        await self.press(self.rng.choice(cats))
+        # 0-2 marta keyingi sahifaga o'tadi
+        for _ in range(self.rng.randint(0, 2)):
+            nxt = [d for d in self.buttons("u_p_") if "_n_" in d]
+            if not nxt: break
+            await self.press(nxt[0])
+        products = self.buttons("u_v_")
+        if not products: return False
+        await self.press(self.rng.choice(products))
+        add = self.buttons("u_a_")
+        if not add: return False
+        await self.press(add[0])
+        await self.send(str(self.rng.randint(1, 3)))
+        return True
+
+    async def run(self, checkout):
+        await self.send("/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+        added = False
+        for _ in range(self.rng.randint(1, 2)):
+            added = await self.browse_and_add() or added
+        if not (added and checkout): return
+        await self.send("🛒 Себет")
+        await self.press("u_checkout")
+        await self.press("lang_kg")
+        await self.send("🚚 Жеткирүү")
+        base = self.rng.choice(BASES)
+        await self.send(location={"latitude": base[1] + self.rng.uniform(-0.05, 0.05), "longitude": base[2] + self.rng.uniform(-0.05, 0.05)})
+        await self.send(contact={"phone_number": f"+996700{self.id % 1_000_000:06d}", "first_name": self.user["first_name"], "user_id": self.id})
+        await self.send(photo=[{"file_id": f"check-{self.id}", "file_unique_id": f"u{self.id}", "width": 800, "height": 600}])
+
+
+_update_ids = iter(range(1, 10 ** 12))
+
+
+# =====================================================================
+# ISHGA TUSHIRISH
+# =====================================================================
+
+async def seed():
+    for col in (database.products_col, database.orders_col, database.bases_col, database.fsm_col,
+                database.outbox_col, database.stats_col, database.counters_col, database.categories_col):
+        await col.delete_many({})
+    # Kategoriya reestri counters bilan birga tozalanadi, jarayon xotirasidagi nom <-> id ham
+    database._category_ids.clear()
+    database._category_names.clear()
+    for cat in CATEGORIES:
+        for i in range(PER_CATEGORY):
+            await database.add_product(f"{cat} #{i}", f"LT-{cat[:3]}-{i}", 500 + i * 10, f"file-{i}", cat, stock=10 ** 7)
+    for name, lat, lon in BASES:
+        await database.add_base(name, lat, lon)
+    database.clear_catalog_cache()
+
+
+async def run(args):
+    database.init_db()
+    session = FakeSession(latency=args.tg_latency / 1000)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    dp = app.create_dispatcher()
+    stats = Stats()
+    dp.message.middleware(HandlerTimer(stats))
+    dp.callback_query.middleware(HandlerTimer(stats))
+
+    await seed()
+    if not await app.bootstrap_db(): sys.exit("MongoDB javob bermayapti")
+    await app.warm_up(bot)
+
+    rng = random.Random(args.seed)
+    users = [VirtualUser(n, bot, dp, session, stats, random.Random(rng.random())) for n in range(args.users)]
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def one(u):
+        async with sem:
+            await u.run(checkout=u.rng.random() < args.checkout_ratio)
+
+    ops_before = ops_counter.total
+    ops_counter.by_handler.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(u) for u in users))
+    elapsed = time.perf_counter() - start
+
+    updates = len(stats.updates)
+    handlers = {}
+    for name, values in sorted(stats.latency.items()):
+        handlers[name] = summary(values)
+        handlers[name]["mongo_ops_per_call"] = round(ops_counter.by_handler[name] / len(values), 2)
+    result = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {"users": args.users, "concurrency": args.concurrency, "checkout_ratio": args.checkout_ratio,
+                   "tg_latency_ms": args.tg_latency, "seed": args.seed, "fsm_storage": app.FSM_STORAGE,
+                   "nearest_base_mode": database.NEAREST_BASE_MODE},
+        "updates": updates,
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(updates / elapsed, 1) if elapsed else 0.0,
+        "mongo_ops_total": ops_counter.total - ops_before,
+        "mongo_ops_per_update": round(sum(stats.update_ops) / updates, 2) if updates else 0.0,
+        "update": summary(stats.updates),
+        "handlers": handlers,
+        "telegram_calls": dict(session.calls),
+        "orders": await database.orders_col.count_documents({}),
+        "errors": dict(stats.errors)
+    }
+    await bot.session.close()
+    await dp.storage.close()
+    return result
+
+
+def print_report(result, previous=None):
+    print(f"\n{result['updates']} update, {result['elapsed_s']}s: {result['updates_per_s']} update/s, "
+          f"{result['mongo_ops_per_update']} Mongo buyrug'i/update, buyurtmalar: {result['orders']}, xatolar: {result['errors'] or 0}")
+    print(f"{'handler':<28}{'soni':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mongo/ch':>10}")
+    rows = [("(update)", result["update"])] + list(result["handlers"].items())
+    for name, h in rows:
+        line = f"{name:<28}{h['count']:>8}{h['p50_ms']:>10.2f}{h['p95_ms']:>10.2f}{h['p99_ms']:>10.2f}{h.get('mongo_ops_per_call', ''):>10}"
+        old = (previous or {}).get("handlers", {}).get(name) if name != "(update)" else (previous or {}).get("update")
+        if old and old["p95_ms"]:
+            line += f"   p95 {100 * (h['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.0f}%"
+        print(line)
+    if previous and previous.get("updates_per_s"):
+        change = 100 * (result["updates_per_s"] - previous["updates_per_s"]) / previous["updates_per_s"]
+        print(f"\nupdates/s: {previous['updates_per_s']} -> {result['updates_per_s']} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSS bot yuklama testi")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--checkout-ratio", type=float, default=0.3, help="checkout gacha yetadigan foydalanuvchilar ulushi")
+    parser.add_argument("--tg-latency", type=float, default=0, help="soxta Telegram javobi kechikishi, ms")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    parser.add_argument("--compare", help="avvalgi natija JSON fayli")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+    print_report(result, previous)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nNatija saqlandi: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
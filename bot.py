@@ -1,37 +1,59 @@
 import asyncio
+import csv
 import logging
+import os
 import sys
-import math
+import tempfile
+import time
+from functools import lru_cache
 import pytz
 from datetime import datetime
-from aiogram import Bot, Dispatcher, F, types, BaseMiddleware
-from aiogram.filters import Command, StateFilter
+from aiogram import Bot, Dispatcher, Router, F, types, BaseMiddleware
+from aiogram.filters import Command, CommandObject, StateFilter, ExceptionTypeFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, 
-    InlineKeyboardButton, CallbackQuery
+    InlineKeyboardButton, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent, FSInputFile
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from config import BOT_TOKEN, ADMIN_IDS, CARD_NUMBER
-from database import *
+from aiohttp import web
+
+from config import (
+    BOT_TOKEN, ADMIN_IDS, CARD_NUMBER, MAINTENANCE_MODE, FSM_STORAGE, CATALOG_CACHE_TTL, RENDER_CACHE_SIZE, TG_GLOBAL_RATE, TG_CHAT_RATE, TG_CHAT_BURST,
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_DEBOUNCE,
+    METRICS_HOST, METRICS_PORT, SEARCH_CACHE_TIME, RUN_MODE, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEB_HOST, WEB_PORT, WEB_WORKERS, WEBHOOK_DRAIN_TIMEOUT
+)
+import database
+from database import (
+    init_db, ping_db, ensure_indexes, get_settings_snapshot, get_cache_stats, get_catalog_version, load_search_index, load_base_index,
+    get_categories, get_category_name, get_products_by_category_keyset, get_products_by_category_paginated, get_product, get_products_brief, search_products,
+    add_product, delete_product, set_product_stock, checkout_order, nearest_base,
+    get_shop_info, get_combined_info, set_shop_info, set_social_links, set_logo, get_elements_brief,
+    add_service, delete_service, add_location, delete_location, add_base, delete_base, add_ad, delete_ad,
+    get_order_by_id, get_order_counts, get_orders_page, update_order_status, get_stats, rebuild_stats, stats_keys
+)
+from pymongo.errors import ConnectionFailure
+from resilience import DatabaseUnavailable, breaker
+from storage import MongoFSMStorage, FSMUpdateScope
+from cache import TTLCache
+import webhook
+import outbox
+import importer
+import export
+from ratelimit import RateLimiter
+from throttling import ThrottlingMiddleware
+import metrics
 
 # =====================================================================
 # TIZIMNI SOZLASH VA MATEMATIKA
 # =====================================================================
-logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat / 2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+# Import paytida hech narsa yaratilmaydi va ulanmaydi: handlerlar router ga yoziladi,
+# Bot/Dispatcher esa create_bot()/create_dispatcher() da (main, webhook worker, testlar).
+STARTED_AT = time.perf_counter()
+router = Router()
 
 def get_delivery_time(lang):
     tz = pytz.timezone('Asia/Bishkek')
@@ -70,8 +92,82 @@ class MaintenanceMiddleware(BaseMiddleware):
         
         return
 
-dp.message.middleware(MaintenanceMiddleware())
-dp.callback_query.middleware(MaintenanceMiddleware())
+# =====================================================================
+# BOT VA DISPATCHER (APP FACTORY)
+# =====================================================================
+
+# Jarayon ishga tushgandan birinchi update javobigacha bo'lgan vaqt (cold start) logga yoziladi
+class FirstResponseMiddleware(BaseMiddleware):
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.done = False
+
+    async def __call__(self, handler, event, data):
+        if self.done: return await handler(event, data)
+        self.done = True
+        received = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            now = time.perf_counter()
+            logging.info(f"Birinchi javob: ishga tushgandan {now - self.started_at:.2f}s keyin (update {(now - received) * 1000:.0f}ms)")
+
+def create_bot():
+    bot = Bot(token=BOT_TOKEN)
+    # Telegram limiti bot uchun umumiy: webhook workerlari uni teng bo'lishadi
+    workers = max(1, WEB_WORKERS) if RUN_MODE == "webhook" else 1
+    rate_limiter = RateLimiter(global_rate=TG_GLOBAL_RATE / workers, chat_rate=TG_CHAT_RATE, chat_burst=TG_CHAT_BURST)
+    bot.session.middleware(rate_limiter)
+    metrics.gauges("telegram_ratelimit", "Telegram yuborish navbati", rate_limiter.stats,
+                   ["queue_interactive", "queue_bulk", "waits", "wait_seconds_total", "wait_seconds_max", "retry_after_total"])
+    return bot
+
+# init_db() dan keyin chaqiriladi: Mongo FSM storage fsm_col kolleksiyasini oladi
+def create_dispatcher():
+    storage = MongoFSMStorage(database.fsm_col) if FSM_STORAGE == "mongo" else MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    FSMUpdateScope.install(dp)
+    dp.update.outer_middleware(FirstResponseMiddleware(STARTED_AT))
+    # Flood nazorati filtrlar va handlerlardan oldin: tashlangan update bazaga bormaydi
+    throttling = ThrottlingMiddleware(THROTTLE_RATE, THROTTLE_BURST, THROTTLE_DEBOUNCE, exempt=ADMIN_IDS)
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+    metrics.gauges("throttle", "Foydalanuvchi flood nazorati", throttling.stats,
+                   ["passed", "debounced", "coalesced", "limited", "not_modified", "tracked_users"])
+    # Metrikalar birinchi: texnik xizmat javoblari ham o'lchanadi
+    dp.message.middleware(metrics.MetricsMiddleware("message"))
+    dp.callback_query.middleware(metrics.MetricsMiddleware("callback_query"))
+    dp.inline_query.middleware(metrics.MetricsMiddleware("inline_query"))
+    if MAINTENANCE_MODE:
+        dp.message.middleware(MaintenanceMiddleware())
+        dp.callback_query.middleware(MaintenanceMiddleware())
+    dp.include_router(router)
+    return dp
+
+metrics.gauges("catalog_cache", "Katalog keshi", get_cache_stats, ["size", "hits", "misses"])
+metrics.gauges("mongo_breaker", "MongoDB circuit breaker", breaker.stats, ["open", "failures", "opened_total"])
+
+# =====================================================================
+# BAZA ISHLAMAY QOLGANDA (DatabaseUnavailable)
+# =====================================================================
+# Bo'sh do'kon ko'rsatish o'rniga foydalanuvchiga vaqtinchalik nosozlik haqida aytiladi.
+DB_DOWN_TEXT = (
+    "⚠️ Техникалык көйгөй, бир аздан кийин кайра аракет кылыңыз.\n"
+    "⚠️ Техническая неполадка, попробуйте чуть позже.\n"
+    "⚠️ Техник носозлик, бироздан кейин қайта уриниб кўринг."
+)
+
+@router.errors(ExceptionTypeFilter(DatabaseUnavailable, ConnectionFailure))
+async def db_unavailable_handler(event: types.ErrorEvent):
+    logging.warning(f"Update {event.update.update_id}: baza ishlamayapti: {event.exception}")
+    u = event.update
+    try:
+        if u.callback_query: await u.callback_query.answer(DB_DOWN_TEXT[:200], show_alert=True)
+        elif u.message: await u.message.answer(DB_DOWN_TEXT)
+        elif u.inline_query: await u.inline_query.answer([], cache_time=5)
+    except Exception as e:
+        logging.error(f"db_unavailable_handler xatosi: {e}")
+    return True
 
 # =====================================================================
 # STATES (HOLATLAR)
@@ -101,6 +197,7 @@ class AdminState(StatesGroup):
     soc_wa = State()
     logo_photo = State()
     edit_stock_qty = State()
+    import_file = State()
 
 class UserState(StatesGroup):
     lang = State()
@@ -119,11 +216,16 @@ def is_admin(user_id):
     return user_id in ADMIN_IDS
 
 def main_kb(user_id):
+    return _main_kb(is_admin(user_id))
+
+# Klaviatura faqat admin/oddiy foydalanuvchiga qarab farq qiladi: ikkala variant bir marta quriladi
+@lru_cache(maxsize=2)
+def _main_kb(admin):
     rows = [
         [KeyboardButton(text="🛍 Дүкөн"), KeyboardButton(text="🛒 Себет")],
         [KeyboardButton(text="ℹ️ Биз жөнүндө")]
     ]
-    if is_admin(user_id):
+    if admin:
         rows.append([KeyboardButton(text="📦 Буюртмалар"), KeyboardButton(text="➕ Маҳсулот")])
         rows.append([KeyboardButton(text="🛠 Хизмат"), KeyboardButton(text="📍 Филиал")])
         rows.append([KeyboardButton(text="🔥 Аксия"), KeyboardButton(text="🏢 Базалар")])
@@ -134,7 +236,7 @@ def main_kb(user_id):
 # ASOSIY HANDLERLAR
 # =====================================================================
 
-@dp.message(Command("start"))
+@router.message(Command("start"))
 async def start_handler(m: types.Message, state: FSMContext):
     await state.clear()
     if len(m.text.split()) > 1 and m.text.split()[1].startswith("order_"):
@@ -151,7 +253,7 @@ async def start_handler(m: types.Message, state: FSMContext):
 # ADMIN: SAYT BOSHQARUVI VA O'CHIRISH
 # =====================================================================
 
-@dp.message(F.text == "🛠 Хизмат")
+@router.message(F.text == "🛠 Хизмат")
 async def admin_srv_menu(m: types.Message):
     if not is_admin(m.from_user.id): return
     kb = InlineKeyboardBuilder()
@@ -160,26 +262,26 @@ async def admin_srv_menu(m: types.Message):
     kb.adjust(2)
     await m.answer("Хизматни бошқариш:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data == "srv_add")
+@router.callback_query(F.data == "srv_add")
 async def admin_add_srv_start(call: CallbackQuery, state: FSMContext):
     await call.message.answer("Янги хизмат номи:", reply_markup=ReplyKeyboardRemove())
     await state.set_state(AdminState.srv_name)
     await call.message.delete()
 
-@dp.message(AdminState.srv_name)
+@router.message(AdminState.srv_name)
 async def admin_srv_name(m: types.Message, state: FSMContext):
     await state.update_data(name=m.text)
     await m.answer("Хизмат ҳақида қисқача маълумот ёзинг:")    
     await state.set_state(AdminState.srv_desc)
 
-@dp.message(AdminState.srv_desc)
+@router.message(AdminState.srv_desc)
 async def admin_srv_save(m: types.Message, state: FSMContext):
     d = await state.get_data()
     await add_service(d['name'], m.text)
     await m.answer("✅ Хизмат қўшилди!", reply_markup=main_kb(m.from_user.id))
     await state.clear()
 
-@dp.message(F.text == "📍 Филиал")
+@router.message(F.text == "📍 Филиал")
 async def admin_loc_menu(m: types.Message):
     if not is_admin(m.from_user.id): return
     kb = InlineKeyboardBuilder()
@@ -188,33 +290,33 @@ async def admin_loc_menu(m: types.Message):
     kb.adjust(2)
     await m.answer("Филиални бошқариш:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data == "loc_add")
+@router.callback_query(F.data == "loc_add")
 async def admin_add_loc_start(call: CallbackQuery, state: FSMContext):
     await call.message.answer("Филиал номи:", reply_markup=ReplyKeyboardRemove())
     await state.set_state(AdminState.loc_name)
     await call.message.delete()
 
-@dp.message(AdminState.loc_name)
+@router.message(AdminState.loc_name)
 async def admin_loc_name(m: types.Message, state: FSMContext):
     await state.update_data(name=m.text)
     await m.answer("Манзилни ёзинг:")
     await state.set_state(AdminState.loc_address)
 
-@dp.message(AdminState.loc_address)
+@router.message(AdminState.loc_address)
 async def admin_loc_addr(m: types.Message, state: FSMContext):
     await state.update_data(address=m.text)
     kb = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text="📍 Локация юбориш", request_location=True)]], resize_keyboard=True)
     await m.answer("Харитадан нуқтани юборинг:", reply_markup=kb)
     await state.set_state(AdminState.loc_geo)
 
-@dp.message(AdminState.loc_geo, F.location)
+@router.message(AdminState.loc_geo, F.location)
 async def admin_loc_save(m: types.Message, state: FSMContext):
     d = await state.get_data()
     await add_location(d['name'], d['address'], m.location.latitude, m.location.longitude)
     await m.answer("✅ Филиал қўшилди!", reply_markup=main_kb(m.from_user.id))
     await state.clear()
 
-@dp.message(F.text == "🏢 Базалар")
+@router.message(F.text == "🏢 Базалар")
 async def admin_base_menu(m: types.Message):
     if not is_admin(m.from_user.id): return
     kb = InlineKeyboardBuilder()
@@ -223,27 +325,27 @@ async def admin_base_menu(m: types.Message):
     kb.adjust(2)
     await m.answer("Базаларни бошқариш:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data == "base_add")
+@router.callback_query(F.data == "base_add")
 async def admin_add_base_start(call: CallbackQuery, state: FSMContext):
     await call.message.answer("База номини ёзинг (мас: Марказий омбор):", reply_markup=ReplyKeyboardRemove())
     await state.set_state(AdminState.base_name)
     await call.message.delete()
 
-@dp.message(AdminState.base_name)
+@router.message(AdminState.base_name)
 async def admin_base_name(m: types.Message, state: FSMContext):
     await state.update_data(name=m.text)
     kb = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text="📍 Локация юбориш", request_location=True)]], resize_keyboard=True)
     await m.answer("Базанинг харитадаги локациясини юборинг:", reply_markup=kb)
     await state.set_state(AdminState.base_geo)
 
-@dp.message(AdminState.base_geo, F.location)
+@router.message(AdminState.base_geo, F.location)
 async def admin_base_save(m: types.Message, state: FSMContext):
     d = await state.get_data()
     await add_base(d['name'], m.location.latitude, m.location.longitude)
     await m.answer("✅ База қўшилди!", reply_markup=main_kb(m.from_user.id))
     await state.clear()
 
-@dp.message(F.text == "🔥 Аксия")
+@router.message(F.text == "🔥 Аксия")
 async def admin_ad_menu(m: types.Message):
     if not is_admin(m.from_user.id): return
     kb = InlineKeyboardBuilder()
@@ -252,25 +354,25 @@ async def admin_ad_menu(m: types.Message):
     kb.adjust(2)
     await m.answer("Аксияни бошқариш:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data == "ad_add")
+@router.callback_query(F.data == "ad_add")
 async def admin_add_ad_start(call: CallbackQuery, state: FSMContext):
     await call.message.answer("Аксия сарлавҳаси:", reply_markup=ReplyKeyboardRemove())
     await state.set_state(AdminState.ad_title)
     await call.message.delete()
 
-@dp.message(AdminState.ad_title)
+@router.message(AdminState.ad_title)
 async def admin_ad_title(m: types.Message, state: FSMContext):
     await state.update_data(title=m.text)
     await m.answer("Аксия ҳақида маълумот:")
     await state.set_state(AdminState.ad_text)
 
-@dp.message(AdminState.ad_text)
+@router.message(AdminState.ad_text)
 async def admin_ad_text(m: types.Message, state: FSMContext):
     await state.update_data(text=m.text)
     await m.answer("Чегирма фоизи (фақат рақам):")
     await state.set_state(AdminState.ad_discount)
 
-@dp.message(AdminState.ad_discount)
+@router.message(AdminState.ad_discount)
 async def admin_ad_save(m: types.Message, state: FSMContext):
     if not m.text.isdigit(): return await m.answer("Рақам ёзинг!")
     d = await state.get_data()
@@ -278,26 +380,36 @@ async def admin_ad_save(m: types.Message, state: FSMContext):
     await m.answer("✅ Аксия қўшилди!", reply_markup=main_kb(m.from_user.id))
     await state.clear()
 
-@dp.callback_query(F.data.startswith("dl_"))
+# =====================================================================
+# ADMIN RO'YXATLARINI SAHIFALASH
+# =====================================================================
+# Kursor tokeni: "" (birinchi sahifa), "a<_id>" (shu _id dan eskilari), "b<_id>" (shu _id dan yangilari)
+ADMIN_PAGE_SIZE = 20
+
+def parse_cursor(tok):
+    if tok.startswith("a"): return tok[1:], None
+    if tok.startswith("b"): return None, tok[1:]
+    return None, None
+
+def list_nav(kb, prefix, items, has_prev, has_next):
+    nav = []
+    if has_prev and items: nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}_b{items[0]['_id']}"))
+    if has_next and items: nav.append(InlineKeyboardButton(text="➡️", callback_data=f"{prefix}_a{items[-1]['_id']}"))
+    if nav: kb.row(*nav)
+
+@router.callback_query(F.data.startswith("dl_"))
 async def admin_del_list(call: CallbackQuery):
-    t = call.data.split("_")[1]
+    parts = call.data.split("_")
+    t = parts[1]
+    after, before = parse_cursor(parts[2] if len(parts) > 2 else "")
+    items, has_prev, has_next = await get_elements_brief(t, after, before, ADMIN_PAGE_SIZE)
     kb = InlineKeyboardBuilder()
-    if t == "srv":
-        items = await get_all_services()
-        for i in items: kb.button(text=f"❌ {i['name']}", callback_data=f"ex_dsrv_{i['_id']}")
-    elif t == "loc":
-        items = await get_all_locations()
-        for i in items: kb.button(text=f"❌ {i['name']}", callback_data=f"ex_dloc_{i['_id']}")
-    elif t == "ad":
-        items = await get_all_ads()
-        for i in items: kb.button(text=f"❌ {i['title']}", callback_data=f"ex_dad_{i['_id']}")
-    elif t == "base":
-        items = await get_all_bases()
-        for i in items: kb.button(text=f"❌ {i['name']}", callback_data=f"ex_dbase_{i['_id']}")
+    for i in items: kb.button(text=f"❌ {i['name']}", callback_data=f"ex_d{t}_{i['_id']}")
     kb.adjust(1)
+    list_nav(kb, f"dl_{t}", items, has_prev, has_next)
     await call.message.edit_text("Ўчириладиган элементни танланг:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data.startswith("ex_d"))
+@router.callback_query(F.data.startswith("ex_d"))
 async def admin_del_exec(call: CallbackQuery):
     parts = call.data.split("_")
     p = parts[1]
@@ -313,7 +425,7 @@ async def admin_del_exec(call: CallbackQuery):
 # INFO, MAHSULOT QO'SHISH, BUYURTMALAR
 # =====================================================================
 
-@dp.message(F.text == "⚙️ Тармоқлар ва инфо")
+@router.message(F.text == "⚙️ Тармоқлар ва инфо")
 async def admin_info_manage(m: types.Message):
     if not is_admin(m.from_user.id): return
     kb = InlineKeyboardBuilder()
@@ -322,7 +434,7 @@ async def admin_info_manage(m: types.Message):
     kb.adjust(2)
     await m.answer("Қайси маълумотни ўзгартирмоқчисиз?", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data.startswith("edit_"))
+@router.callback_query(F.data.startswith("edit_"))
 async def admin_edit_info_start(call: CallbackQuery, state: FSMContext):
     field = call.data.replace("edit_", "")
     prompts = {
@@ -337,13 +449,13 @@ async def admin_edit_info_start(call: CallbackQuery, state: FSMContext):
     await state.set_state(prompts[field][1])
     await call.message.delete()
 
-@dp.message(StateFilter(AdminState.info_phone, AdminState.info_address, AdminState.info_about, AdminState.soc_ch, AdminState.soc_ig, AdminState.soc_wa))
-async def admin_info_save_single(m: types.Message, state: FSMContext):
+@router.message(StateFilter(AdminState.info_phone, AdminState.info_address, AdminState.info_about, AdminState.soc_ch, AdminState.soc_ig, AdminState.soc_wa))
+async def admin_info_save_single(m: types.Message, state: FSMContext, bot: Bot):
     st = await state.get_state()
     info = await get_combined_info()
     address, phone, about = info.get("address", ""), info.get("phone", ""), info.get("about", "")
     ch, ig, wa = info.get("telegram_channel", ""), info.get("instagram", ""), info.get("whatsapp", "")
-    tg = f"https://t.me/{(await bot.get_me()).username}"
+    tg = f"https://t.me/{(await bot.me()).username}"
 
     if st == AdminState.info_phone.state: phone = m.text
     elif st == AdminState.info_address.state: address = m.text
@@ -357,59 +469,60 @@ async def admin_info_save_single(m: types.Message, state: FSMContext):
     await m.answer("✅ Маълумот янгиланди!", reply_markup=main_kb(m.from_user.id))
     await state.clear()
 
-@dp.message(F.text == "🖼 Логотип")
+@router.message(F.text == "🖼 Логотип")
 async def admin_logo(m: types.Message, state: FSMContext):
     if not is_admin(m.from_user.id): return
     await m.answer("📸 Янги логотип учун расм юборинг:", reply_markup=ReplyKeyboardRemove())
     await state.set_state(AdminState.logo_photo)
 
-@dp.message(AdminState.logo_photo, F.photo)
+@router.message(AdminState.logo_photo, F.photo)
 async def admin_logo_save(m: types.Message, state: FSMContext):
     await set_logo(m.photo[-1].file_id)
     await m.answer("✅ Логотип янгиланди!", reply_markup=main_kb(m.from_user.id))
     await state.clear()
 
-@dp.message(F.text == "➕ Маҳсулот")
+@router.message(F.text == "➕ Маҳсулот")
 async def admin_product_menu(m: types.Message):
     if not is_admin(m.from_user.id): return
     kb = InlineKeyboardBuilder()
     kb.button(text="➕ Қўшиш", callback_data="prod_add")
     kb.button(text="❌ Ўчириш", callback_data="dp_l")
     kb.button(text="📦 Омборни таҳрирлаш", callback_data="es_l")
+    kb.button(text="📥 Импорт (CSV/XLSX)", callback_data="prod_import")
     kb.adjust(1)
     await m.answer("Маҳсулотларни бошқариш:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data == "prod_add")
+@router.callback_query(F.data == "prod_add")
 async def admin_add_p_start(call: CallbackQuery, state: FSMContext):
     await call.message.answer("📁 Маҳсулот категориясини ёзинг (мас: Сантехника, Электр):", reply_markup=ReplyKeyboardRemove())
     await state.set_state(AdminState.category)
     await call.message.delete()
 
-@dp.message(AdminState.category)
+@router.message(AdminState.category)
 async def admin_p_category(m: types.Message, state: FSMContext):
     await state.update_data(category=m.text)
     await m.answer("📸 Маҳсулот расмини юборинг:", reply_markup=ReplyKeyboardRemove())
     await state.set_state(AdminState.photo)
 
-@dp.message(AdminState.photo, F.photo)
+@router.message(AdminState.photo, F.photo)
 async def admin_p_photo(m: types.Message, state: FSMContext):
     await state.update_data(file_id=m.photo[-1].file_id)
     await m.answer("Маҳсулот номи:")
     await state.set_state(AdminState.name)
     
-@dp.message(AdminState.name)
+@router.message(AdminState.name)
 async def admin_p_name(m: types.Message, state: FSMContext):
     await state.update_data(name=m.text)
     await m.answer("Артикул:")
     await state.set_state(AdminState.article)
 
-@dp.message(AdminState.article)
+@router.message(AdminState.article)
 async def admin_p_article(m: types.Message, state: FSMContext):
     await state.update_data(article=m.text)
     await m.answer("Нархи (фақат рақам):")
     await state.set_state(AdminState.price)
 
-@dp.message(AdminState.price)
+@router.message(AdminState.price)
 async def admin_p_save(m: types.Message, state: FSMContext):
     if not m.text.isdigit(): return await m.answer("Рақам ёзинг!")
     d = await state.get_data()
@@ -417,35 +530,84 @@ async def admin_p_save(m: types.Message, state: FSMContext):
     await m.answer("✅ Маҳсулот қўшилди!", reply_markup=main_kb(m.from_user.id))
     await state.clear()
 
-@dp.callback_query(F.data == "dp_l")
+@router.callback_query(F.data == "prod_import")
+async def admin_import_start(call: CallbackQuery, state: FSMContext):
+    await call.message.answer(
+        "📥 CSV ёки XLSX файл юборинг. Биринчи қатор — сарлавҳа:\n"
+        "<code>article;name;price;stock;category</code>\n\n"
+        "• Артикул бор бўлса — маҳсулот янгиланади, йўқ бўлса — янгиси қўшилади (расмсиз).\n"
+        "• Фақат <code>article;stock</code> — мавжуд маҳсулотлар омборини янгилайди.",
+        parse_mode="HTML", reply_markup=ReplyKeyboardRemove()
+    )
+    await state.set_state(AdminState.import_file)
+    await call.message.delete()
+
+@router.message(AdminState.import_file, F.document)
+async def admin_import_file(m: types.Message, state: FSMContext, bot: Bot):
+    ext = os.path.splitext(m.document.file_name or "")[1].lower()
+    if ext not in (".csv", ".txt", ".xlsx", ".xlsm"): return await m.answer("Фақат CSV ёки XLSX файл юборинг!")
+    # Bot API orqali 20 MB gacha fayl yuklab olinadi
+    if (m.document.file_size or 0) > 20 * 1024 * 1024: return await m.answer("Файл 20 МБ дан катта!")
+    await m.answer("⏳ Импорт бошланди...")
+    fd, path = tempfile.mkstemp(suffix=ext)
+    os.close(fd)
+    try:
+        await bot.download(m.document, destination=path)
+        result = await importer.import_products(path)
+    except ValueError as e:
+        return await m.answer(f"❌ {e}")
+    except csv.Error as e:
+        # Buzilgan CSV (yopilmagan qo'shtirnoq, NUL belgi va h.k.)
+        return await m.answer(f"❌ CSV файл бузилган: {e}")
+    finally:
+        os.remove(path)
+    txt = (f"✅ Импорт тугади!\nҚаторлар: {result.rows}\n➕ Янги: {result.inserted}\n"
+           f"🔄 Янгиланди: {result.updated}\n⚠️ Хатолар: {len(result.errors)}")
+    if result.errors:
+        txt += "\n\n" + "\n".join(f"{n}-қатор: {msg}" for n, msg in result.errors[:20])
+        if len(result.errors) > 20: txt += f"\n... яна {len(result.errors) - 20} та"
+    await m.answer(txt, reply_markup=main_kb(m.from_user.id))
+    await state.clear()
+
+@router.callback_query(F.data.startswith("dp_l"))
 async def admin_dp_list(call: CallbackQuery):
-    items = await get_all_products()
+    await show_dp_list(call, call.data[5:])
+
+async def show_dp_list(call, tok=""):
+    after, before = parse_cursor(tok)
+    items, has_prev, has_next = await get_products_brief(after, before, ADMIN_PAGE_SIZE)
+    if not items and tok: return await show_dp_list(call)
     kb = InlineKeyboardBuilder()
-    for i in items: kb.button(text=f"❌ {i['name']}", callback_data=f"dp_e_{i['_id']}")
+    # Ўчиргандан кейин шу саҳифа қайта кўрсатилади
+    for i in items: kb.button(text=f"❌ {i['name']}", callback_data=f"dp_e_{i['_id']}_{tok}")
     kb.adjust(1)
+    list_nav(kb, "dp_l", items, has_prev, has_next)
     await call.message.edit_text("Ўчириладиган маҳсулот:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data.startswith("dp_e_"))
+@router.callback_query(F.data.startswith("dp_e_"))
 async def admin_dp_exec(call: CallbackQuery):
-    await delete_product(call.data.split("_")[2])
+    parts = call.data.split("_")
+    await delete_product(parts[2])
     await call.answer("Ўчирилди!")
-    await admin_dp_list(call)
+    await show_dp_list(call, parts[3] if len(parts) > 3 else "")
 
-@dp.callback_query(F.data == "es_l")
+@router.callback_query(F.data.startswith("es_l"))
 async def admin_es_list(call: CallbackQuery):
-    items = await get_all_products()
+    after, before = parse_cursor(call.data[5:])
+    items, has_prev, has_next = await get_products_brief(after, before, ADMIN_PAGE_SIZE)
     kb = InlineKeyboardBuilder()
     for i in items: kb.button(text=f"{i['name']} ({i['stock']})", callback_data=f"es_v_{i['_id']}")
     kb.adjust(1)
+    list_nav(kb, "es_l", items, has_prev, has_next)
     await call.message.edit_text("Танланг:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data.startswith("es_v_"))
+@router.callback_query(F.data.startswith("es_v_"))
 async def admin_es_val(call: CallbackQuery, state: FSMContext):
     await state.update_data(pid=call.data.split("_")[2])
     await call.message.answer("Янги сонини ёзинг:")
     await state.set_state(AdminState.edit_stock_qty)
 
-@dp.message(AdminState.edit_stock_qty)
+@router.message(AdminState.edit_stock_qty)
 async def admin_es_save(m: types.Message, state: FSMContext):
     if not m.text.isdigit(): return await m.answer("Рақам!")
     d = await state.get_data()
@@ -453,30 +615,40 @@ async def admin_es_save(m: types.Message, state: FSMContext):
     await m.answer("✅ Янгиланди!", reply_markup=main_kb(m.from_user.id))
     await state.clear()
 
-@dp.message(F.text == "📦 Буюртмалар")
-async def admin_orders(m: types.Message):
-    if not is_admin(m.from_user.id): return
+ORDER_STATUSES = [("🆕 Янги", "new"), ("🔄 Ишда", "processing"), ("✅ Тайёр", "ready"), ("🚚 Йўлда", "shipped"), ("🏁 Ёпилган", "delivered")]
+
+@router.message(F.text == "📦 Буюртмалар")
+async def admin_orders(m: types.Message, edit=False):
+    # edit=True: "Орқага" tugmasidan (xabar botniki, from_user tekshirilmaydi)
+    if not edit and not is_admin(m.from_user.id): return
+    counts = await get_order_counts()
     kb = InlineKeyboardBuilder()
-    for label, code in [("🆕 Янги", "new"), ("🔄 Ишда", "processing"), ("✅ Тайёр", "ready"), ("🚚 Йўлда", "shipped"), ("🏁 Ёпилган", "delivered")]:
-        kb.button(text=label, callback_data=f"adm_ord_{code}")
+    for label, code in ORDER_STATUSES:
+        kb.button(text=f"{label} ({counts.get(code, 0)})", callback_data=f"adm_ord_{code}")
     kb.adjust(2)
+    if edit: return await m.edit_text("Буюртмалар ҳолати:", reply_markup=kb.as_markup())
     await m.answer("Буюртмалар ҳолати:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data.startswith("adm_ord_"))
+# adm_ord_{status}[_{a|b}{_id}]
+@router.callback_query(F.data.startswith("adm_ord_"))
 async def admin_ord_list(call: CallbackQuery):
-    st = call.data.split("_")[2]
-    orders = await get_orders_by_status(st)
+    parts = call.data.split("_")
+    st = parts[2]
+    after, before = parse_cursor(parts[3] if len(parts) > 3 else "")
+    orders, has_prev, has_next = await get_orders_page(st, after, before, ADMIN_PAGE_SIZE)
     if not orders: return await call.answer("Бўш", show_alert=True)
     kb = InlineKeyboardBuilder()
     for o in orders: kb.button(text=f"#{o['order_id']} | {o['total_price']}", callback_data=f"dt_ord_{o['order_id']}")
     kb.adjust(1)
-    kb.button(text="🔙 Орқага", callback_data="back_adm_orders")
-    await call.message.edit_text(f"Ҳолат: {st}", reply_markup=kb.as_markup())
+    list_nav(kb, f"adm_ord_{st}", orders, has_prev, has_next)
+    kb.row(InlineKeyboardButton(text="🔙 Орқага", callback_data="back_adm_orders"))
+    counts = await get_order_counts()
+    await call.message.edit_text(f"Ҳолат: {st} ({counts.get(st, 0)})", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data == "back_adm_orders")
-async def admin_ord_back(call: CallbackQuery): await admin_orders(call.message)
+@router.callback_query(F.data == "back_adm_orders")
+async def admin_ord_back(call: CallbackQuery): await admin_orders(call.message, edit=True)
 
-@dp.callback_query(F.data.startswith("dt_ord_"))
+@router.callback_query(F.data.startswith("dt_ord_"))
 async def admin_ord_detail(call: CallbackQuery):
     o = await get_order_by_id(call.data.split("_")[2])
     txt = f"🆔 <b>Чек: #{o['order_id']}</b>\n👤 {o['user_name']}\n📞 {o['phone']}\n💰 {o['total_price']} сом\n📊 Ҳолати: {o['status']}"
@@ -487,83 +659,241 @@ async def admin_ord_detail(call: CallbackQuery):
     kb.button(text="🔙 Орқага", callback_data=f"adm_ord_{o['status']}")
     await call.message.edit_text(txt, parse_mode="HTML", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data.startswith("u_st_"))
+@router.callback_query(F.data.startswith("u_st_"))
 async def admin_ord_save_st(call: CallbackQuery):
     _, _, oid, st = call.data.split("_")
     await update_order_status(oid, st)
     await call.answer("Янгиланди!")
     await admin_ord_detail(call)
 
+# =====================================================================
+# ADMIN: SAVDO STATISTIKASI
+# =====================================================================
+
+def format_stats(title, doc, names):
+    if not doc: return f"<b>{title}</b>: маълумот йўқ"
+    status = ", ".join(f"{k}: {v}" for k, v in doc.get("status", {}).items() if v)
+    txt = (f"<b>{title}</b>\n📦 Буюртмалар: {doc.get('orders', 0)} ({status or '-'})\n"
+           f"💰 Тушум: {doc.get('revenue', 0)} сом\n🚕 Йўл кира: {doc.get('delivery_revenue', 0)} сом")
+    top = sorted(doc.get("units", {}).items(), key=lambda x: -x[1])[:5]
+    if top: txt += "\n🔝 " + ", ".join(f"{names.get(pid, pid)} × {qty}" for pid, qty in top if qty > 0)
+    bases = sorted(doc.get("base_revenue", {}).items(), key=lambda x: -x[1])[:3]
+    if bases: txt += "\n🏢 " + ", ".join(f"{b}: {v} сом" for b, v in bases)
+    return txt
+
+@router.message(Command("stats"))
+async def admin_stats(m: types.Message):
+    if not is_admin(m.from_user.id): return
+    total_key, day_key, week_key = stats_keys(time.time())
+    stats = await get_stats([total_key, day_key, week_key])
+    pids = {pid for doc in stats.values() for pid in doc.get("units", {})}
+    top = sorted(pids, key=lambda pid: -max(doc.get("units", {}).get(pid, 0) for doc in stats.values()))[:15]
+    names = {}
+    for pid in top:
+        p = await get_product(pid)
+        if p: names[pid] = p['name']
+    parts = [format_stats("📅 Бугун", stats.get(day_key), names), format_stats("🗓 Шу ҳафта", stats.get(week_key), names),
+             format_stats("📊 Жами", stats.get(total_key), names)]
+    await m.answer("\n\n".join(parts) + "\n\n/stats_rebuild — қайта ҳисоблаш", parse_mode="HTML")
+
+@router.message(Command("stats_rebuild"))
+async def admin_stats_rebuild(m: types.Message):
+    if not is_admin(m.from_user.id): return
+    await m.answer("⏳ Статистика қайта ҳисобланмоқда...")
+    n = await rebuild_stats()
+    await m.answer("❌ Хатолик юз берди" if n is None else f"✅ Тайёр: {n} та буюртма ҳисобланди")
+
+# /export [2026-10-01] [2026-10-18] [new|processing|...]
+@router.message(Command("export"))
+async def admin_export(m: types.Message, command: CommandObject):
+    if not is_admin(m.from_user.id): return
+    dates, status = [], None
+    for arg in (command.args or "").split():
+        try: dates.append(datetime.strptime(arg, "%Y-%m-%d").date())
+        except ValueError: status = arg
+    if len(dates) > 2 or (status and status not in [c for _, c in ORDER_STATUSES] + ["canceled"]):
+        return await m.answer("Фойдаланиш: /export [2026-10-01] [2026-10-18] [new|processing|ready|shipped|delivered|canceled]")
+    query = export.build_query(dates[0] if dates else None, dates[-1] if dates else None, status)
+    await m.answer("⏳ Экспорт тайёрланмоқда...")
+    fd, path = tempfile.mkstemp(suffix=".csv.gz")
+    os.close(fd)
+    try:
+        orders, rows = await export.write_orders_csv(path, query)
+        if not orders: return await m.answer("Бу филтр бўйича буюртма йўқ.")
+        # Bot API orqali 50 MB gacha fayl yuboriladi
+        if os.path.getsize(path) > 50 * 1024 * 1024: return await m.answer("Файл 50 МБ дан катта, санани қисқартиринг.")
+        name = "orders" + "".join(f"_{x}" for x in dates) + (f"_{status}" if status else "") + ".csv.gz"
+        await m.answer_document(FSInputFile(path, filename=name), caption=f"📤 {orders} та буюртма, {rows} та қатор")
+    except Exception as e:
+        logging.error(f"admin_export xatosi: {e}")
+        await m.answer("❌ Хатолик юз берди")
+    finally:
+        os.remove(path)
+
 # =====================================================================
 # FOYDALANUVCHI: DO'KON VA SAVAT
 # =====================================================================
 
-@dp.message(F.text.in_(["ℹ️ Биз жөнүндө", "ℹ️ Биз ҳақимизда"]))
+@router.message(F.text.in_(["ℹ️ Биз жөнүндө", "ℹ️ Биз ҳақимизда"]))
 async def about_handler(m: types.Message):
     i = await get_shop_info()
     await m.answer(f"📍 Манзил: {i['address']}\n📞 Тел: {i['phone']}\nℹ️ {i['about']}")
 
-@dp.message(F.text.in_(["🛍 Дүкөн", "🛍 Дўкон"]))
+@router.message(F.text.in_(["🛍 Дүкөн", "🛍 Дўкон"]))
 async def user_shop(m: types.Message):
+    rendered = await render_categories()
+    if not rendered: return await m.answer("Товарлар жок / Маҳсулот йўқ")
+    text, markup = rendered
+    await m.answer(text, reply_markup=markup)
+
+# =====================================================================
+# KATALOG RENDER KESHI
+# =====================================================================
+# Tayyor (matn, klaviatura) juftliklari. Kalitda katalog versiyasi bor: mahsulot
+# qo'shilsa/o'chirilsa/ombor o'zgarsa versiya oshadi va eski yozuvlar ishlatilmaydi.
+render_cache = TTLCache(maxsize=RENDER_CACHE_SIZE, ttl=CATALOG_CACHE_TTL)
+metrics.gauges("render_cache", "Katalog render keshi", render_cache.stats, ["size", "hits", "misses"])
+
+async def render_categories():
+    key = ("cats", get_catalog_version())
+    cached = render_cache.get(key)
+    if cached is not None: return cached
     cats = await get_categories()
-    if not cats: return await m.answer("Товарлар жок / Маҳсулот йўқ")
+    if not cats: return None
     kb = InlineKeyboardBuilder()
-    for c in cats: kb.button(text=c, callback_data=f"cat_{c[:20]}") 
+    # cat_{id}: nom uzunligidan qat'i nazar 64 baytlik callback_data chegarasiga sig'adi
+    for c in cats: kb.button(text=f"{c['name']} ({c['count']})", callback_data=f"cat_{c['_id']}")
     kb.adjust(2)
-    await m.answer("📁 Категорияны тандаңыз:", reply_markup=kb.as_markup())
+    rendered = ("📁 Категорияны тандаңыз:", kb.as_markup())
+    render_cache.set(key, rendered)
+    return rendered
 
-@dp.callback_query(F.data.startswith("cat_"))
+@router.callback_query(F.data.startswith("cat_"))
 async def user_shop_cat(call: CallbackQuery, state: FSMContext):
-    cat = call.data.replace("cat_", "")
+    raw = call.data.replace("cat_", "")
+    # Eski xabarlardagi tugmalar: cat_{nomning 20 belgisi}
+    cat = await get_category_name(int(raw)) if raw.isdigit() else raw
+    if not cat: return await call.answer("Бўш / Бош", show_alert=True)
     await state.update_data(current_cat=cat)
     await user_shop_page(call, cat, 0)
 
-@dp.callback_query(F.data.startswith("u_p_"))
+# Sahifa tugmasi: u_p_{page}_{n|p}_{created_at}_{_id} (keyset kursor), eski u_p_{page} ham qabul qilinadi
+def page_cb(page, direction, p):
+    return f"u_p_{page}_{direction}_{p['created_at']!r}_{p['_id']}"
+
+@router.callback_query(F.data.startswith("u_p_"))
 async def user_shop_pg(call: CallbackQuery, state: FSMContext):
     d = await state.get_data()
     cat = d.get("current_cat")
     if not cat: return await call.answer("Ката: кайра кириңиз", show_alert=True)
-    await user_shop_page(call, cat, int(call.data.split("_")[2]))
-
-async def user_shop_page(m_or_call, cat, page):
-    prods, total = await get_products_by_category_paginated(cat, page, 6)
-    if not prods: 
-        return await (m_or_call.answer("Бўш / Бош") if isinstance(m_or_call, types.Message) else m_or_call.answer("Бўш / Бош", show_alert=True))
+    parts = call.data.split("_")
+    page = int(parts[2])
+    if len(parts) == 6:
+        cursor = (parts[4], parts[5])
+        if parts[3] == "n": return await user_shop_page(call, cat, page, after=cursor)
+        return await user_shop_page(call, cat, page, before=cursor)
+    await user_shop_page(call, cat, page)
+
+async def render_shop_page(cat, page, after=None, before=None):
+    key = ("page", cat, page, after, before, get_catalog_version())
+    cached = render_cache.get(key)
+    if cached is not None: return cached
+    if page == 0 or after or before:
+        prods, total = await get_products_by_category_keyset(cat, after=after, before=before, page_size=6)
+    else:
+        prods, total = await get_products_by_category_paginated(cat, page, 6)
+    if not prods: return None
     kb = InlineKeyboardBuilder()
     for p in prods: kb.button(text=f"{p['name']}", callback_data=f"u_v_{p['_id']}")
     kb.adjust(2)
     nav = []
-    if page > 0: nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"u_p_{page-1}"))
-    if (page + 1) * 6 < total: nav.append(InlineKeyboardButton(text="➡️", callback_data=f"u_p_{page+1}"))
+    if page > 0: nav.append(InlineKeyboardButton(text="⬅️", callback_data=page_cb(page - 1, "p", prods[0])))
+    if (page + 1) * 6 < total: nav.append(InlineKeyboardButton(text="➡️", callback_data=page_cb(page + 1, "n", prods[-1])))
     nav.append(InlineKeyboardButton(text="🔙 Каталог", callback_data="back_to_cats"))
     if nav: kb.row(*nav)
-    text = f"📁 Категория: <b>{cat}</b>\nТоварлар:"
-    if isinstance(m_or_call, types.Message): await m_or_call.answer(text, reply_markup=kb.as_markup(), parse_mode="HTML")
-    else: await m_or_call.message.edit_text(text, reply_markup=kb.as_markup(), parse_mode="HTML")
+    rendered = (f"📁 Категория: <b>{cat}</b>\nТоварлар:", kb.as_markup())
+    render_cache.set(key, rendered)
+    return rendered
+
+async def user_shop_page(m_or_call, cat, page, after=None, before=None):
+    rendered = await render_shop_page(cat, page, after, before)
+    if not rendered: 
+        return await (m_or_call.answer("Бўш / Бош") if isinstance(m_or_call, types.Message) else m_or_call.answer("Бўш / Бош", show_alert=True))
+    text, markup = rendered
+    if isinstance(m_or_call, types.Message): await m_or_call.answer(text, reply_markup=markup, parse_mode="HTML")
+    else: await m_or_call.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
 
-@dp.callback_query(F.data == "back_to_cats")
+@router.callback_query(F.data == "back_to_cats")
 async def back_to_categories(call: CallbackQuery):
     await user_shop(call.message)
     await call.message.delete()
 
-@dp.callback_query(F.data.startswith("u_v_"))
+@router.callback_query(F.data.startswith("u_v_"))
 async def user_p_view(call: CallbackQuery):
     p = await get_product(call.data.split("_")[2])
     cap = f"📱 <b>{p['name']}</b>\n💰 {p['price']} сом\n📝 Артикул: {p.get('article', 'Йўқ')}\n📦 Омборда: {p.get('stock', 999)}"
     kb = InlineKeyboardBuilder()
     kb.button(text="🛒 Себетке кошуу", callback_data=f"u_a_{p['_id']}")
     kb.button(text="🔙 Артка", callback_data="u_p_0")
-    try: await call.message.answer_photo(p['file_id'], caption=cap, parse_mode="HTML", reply_markup=kb.as_markup())
-    except: await call.message.answer_document(p['file_id'], caption=cap, parse_mode="HTML", reply_markup=kb.as_markup())
+    # Importdan kelgan mahsulotda rasm bo'lmasligi mumkin
+    if not p.get('file_id'): await call.message.answer(cap, parse_mode="HTML", reply_markup=kb.as_markup())
+    else:
+        try: await call.message.answer_photo(p['file_id'], caption=cap, parse_mode="HTML", reply_markup=kb.as_markup())
+        except: await call.message.answer_document(p['file_id'], caption=cap, parse_mode="HTML", reply_markup=kb.as_markup())
     await call.message.delete()
 
-@dp.callback_query(F.data.startswith("u_a_"))
+# =====================================================================
+# QIDIRUV: /search VA INLINE REJIM (@bot so'rov)
+# =====================================================================
+# Inline rejim BotFather da yoqilgan bo'lishi kerak (/setinline).
+search_cache = TTLCache(maxsize=RENDER_CACHE_SIZE, ttl=SEARCH_CACHE_TIME)
+metrics.gauges("search_cache", "Qidiruv natijalari keshi", search_cache.stats, ["size", "hits", "misses"])
+
+async def cached_search(query, limit=10):
+    key = (query.strip().lower(), limit, get_catalog_version())
+    cached = search_cache.get(key)
+    if cached is not None: return cached
+    found = await search_products(query, limit=limit)
+    search_cache.set(key, found)
+    return found
+
+@router.message(Command("search"))
+async def user_search(m: types.Message, command: CommandObject):
+    if not command.args:
+        return await m.answer("🔎 Издөө: /search <аталышы же артикул>\nМисалы: /search iphone")
+    found = await cached_search(command.args)
+    if not found: return await m.answer("Эч нерсе табылган жок / Ничего не найдено.")
+    kb = InlineKeyboardBuilder()
+    for p in found: kb.button(text=f"{p['name']} — {p['price']} сом", callback_data=f"u_v_{p['_id']}")
+    kb.adjust(1)
+    await m.answer(f"🔎 «{command.args}» боюнча табылды:", reply_markup=kb.as_markup())
+
+@router.inline_query()
+async def user_inline_search(query: InlineQuery, bot: Bot):
+    if not query.query.strip():
+        return await query.answer([], cache_time=SEARCH_CACHE_TIME)
+    found = await cached_search(query.query, limit=20)
+    username = (await bot.me()).username
+    results = []
+    for p in found:
+        text = f"📱 <b>{p['name']}</b>\n💰 {p['price']} сом\n📝 Артикул: {p.get('article', 'Йўқ')}"
+        kb = InlineKeyboardBuilder()
+        kb.button(text="🛒 Буйрутма берүү", url=f"https://t.me/{username}?start=order_{p['_id']}")
+        results.append(InlineQueryResultArticle(
+            id=str(p['_id']), title=p['name'],
+            description=f"💰 {p['price']} сом · Артикул: {p.get('article', '-')}",
+            input_message_content=InputTextMessageContent(message_text=text, parse_mode="HTML"),
+            reply_markup=kb.as_markup()
+        ))
+    await query.answer(results, cache_time=SEARCH_CACHE_TIME)
+
+@router.callback_query(F.data.startswith("u_a_"))
 async def user_cart_qty(call: CallbackQuery, state: FSMContext):
     await state.update_data(pid=call.data.split("_")[2])
     await call.message.answer("Канча керек? Сан менен жазыңыз:", reply_markup=ReplyKeyboardRemove())
     await state.set_state(UserState.input_qty)
 
-@dp.message(UserState.input_qty)
+@router.message(UserState.input_qty)
 async def user_cart_save(m: types.Message, state: FSMContext):
     if not m.text.isdigit(): return await m.answer("Сан киргизиңиз!")
     qty = int(m.text)
@@ -580,7 +910,7 @@ async def user_cart_save(m: types.Message, state: FSMContext):
     await m.answer("✅ Себетке кошулду!", reply_markup=main_kb(m.from_user.id))
     await state.set_state(None)
 
-@dp.message(F.text.in_(["🛒 Себет", "🛒 Сават"]))
+@router.message(F.text.in_(["🛒 Себет", "🛒 Сават"]))
 async def user_cart_show(m: types.Message, state: FSMContext):
     d = await state.get_data()
     cart = d.get("cart", {})
@@ -594,7 +924,7 @@ async def user_cart_show(m: types.Message, state: FSMContext):
     kb.button(text="🗑 Тазалоо", callback_data="u_clear")
     await m.answer(txt, reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data == "u_clear")
+@router.callback_query(F.data == "u_clear")
 async def user_cart_clr(call: CallbackQuery, state: FSMContext):
     await state.update_data(cart={})
     await call.message.edit_text("Себет тазаланды.")
@@ -603,7 +933,7 @@ async def user_cart_clr(call: CallbackQuery, state: FSMContext):
 # CHECKOUT MANTIQI
 # =====================================================================
 
-@dp.callback_query(F.data == "u_checkout")
+@router.callback_query(F.data == "u_checkout")
 async def user_checkout_start(call: CallbackQuery, state: FSMContext):
     kb = InlineKeyboardBuilder()
     kb.button(text="🇰🇬 Кыргызча", callback_data="lang_kg") # Qirg'iz tili birinchiga olib chiqildi
@@ -612,7 +942,7 @@ async def user_checkout_start(call: CallbackQuery, state: FSMContext):
     await call.message.answer("Тилди тандаңыз:\nВыберите язык:\nБуюртмани расмийлаштириш учун тилни танланг:", reply_markup=kb.as_markup())
     await call.message.delete()
 
-@dp.callback_query(F.data.startswith("lang_"))
+@router.callback_query(F.data.startswith("lang_"))
 async def set_user_language(call: CallbackQuery, state: FSMContext):
     lang = call.data.split("_")[1]
     await state.update_data(lang=lang)
@@ -628,7 +958,7 @@ async def set_user_language(call: CallbackQuery, state: FSMContext):
     await state.set_state(UserState.delivery_type)
     await call.message.delete()
 
-@dp.message(UserState.delivery_type)
+@router.message(UserState.delivery_type)
 async def user_delivery_get(m: types.Message, state: FSMContext):
     d = await state.get_data()
     lang = d.get('lang', 'kg') # ASOSIY TIL QIRG'IZ
@@ -666,7 +996,7 @@ async def user_delivery_get(m: types.Message, state: FSMContext):
         await m.answer(prompt, reply_markup=kb)
         await state.set_state(UserState.upsell_loc)
 
-@dp.message(UserState.upsell_loc)
+@router.message(UserState.upsell_loc)
 async def handle_upsell(m: types.Message, state: FSMContext):
     d = await state.get_data()
     lang = d.get('lang', 'kg')
@@ -684,7 +1014,7 @@ async def handle_upsell(m: types.Message, state: FSMContext):
         await state.update_data(delivery_type="Етказиб бериш")
         await user_location_get(m, state)
 
-@dp.message(UserState.location)
+@router.message(UserState.location)
 async def user_location_get(m: types.Message, state: FSMContext):
     d = await state.get_data()
     lang = d.get('lang', 'kg')
@@ -697,19 +1027,10 @@ async def user_location_get(m: types.Message, state: FSMContext):
     if not m.location:
         return await m.answer({"uz":"Илтимос, харитадан локация юборинг.","ru":"Пожалуйста, отправьте локацию.","kg":"Сураныч, локация жөнөтүңүз."}[lang])
 
-    bases = await get_all_bases()
-    if not bases:
+    base, distance_km = await nearest_base(m.location.latitude, m.location.longitude)
+    if not base:
         return await m.answer({"uz":"❌ Тизимда ҳеч қандай база киритилмаган. Админга хабар беринг.","ru":"❌ В системе нет баз. Сообщите админу.","kg":"❌ Базалар киргизилген эмес. Админге билдириңиз."}[lang])
-
-    min_dist = float('inf')
-    closest_base = "Номаълум"
-    for base in bases:
-        dist = calculate_distance(base['lat'], base['lon'], m.location.latitude, m.location.longitude)
-        if dist < min_dist:
-            min_dist = dist
-            closest_base = base['name']
-
-    distance_km = min_dist
+    closest_base = base['name']
 
     if distance_km > 50:
         return await m.answer({"uz":"❌ 50 км дан узоққа элтиб бермаймиз. Ёки сизга яқин база йўқ.","ru":"❌ Доставка только до 50 км от ближайшей базы.","kg":"❌ Эң жакын базадан 50 кмге чейин гана жеткиребиз."}[lang])
@@ -737,7 +1058,7 @@ async def user_location_get(m: types.Message, state: FSMContext):
     await m.answer(info, parse_mode="HTML", reply_markup=kb)
     await state.set_state(UserState.phone)
 
-@dp.message(UserState.phone)
+@router.message(UserState.phone)
 async def user_phone_get(m: types.Message, state: FSMContext):
     phone = m.contact.phone_number if m.contact else m.text
     await state.update_data(phone=phone)
@@ -760,7 +1081,7 @@ async def user_phone_get(m: types.Message, state: FSMContext):
     await m.answer(msg, parse_mode="HTML", reply_markup=ReplyKeyboardRemove())
     await state.set_state(UserState.check_photo)
 
-@dp.message(UserState.check_photo, F.photo)
+@router.message(UserState.check_photo, F.photo)
 async def finish_order(m: types.Message, state: FSMContext):
     d = await state.get_data()
     lang = d.get('lang', 'kg')
@@ -778,40 +1099,158 @@ async def finish_order(m: types.Message, state: FSMContext):
     closest_base = d.get('closest_base', 'Номаълум')
     phone = d.get('phone', 'Номаълум')
     
-    oid = await create_order(m.from_user.id, m.from_user.full_name, phone, cart, final_total, "Карта орқали 10%", delivery, location, f"Тўланди: {advance} сом | Йўл: {delivery_price} | База: {closest_base} | Чек: {check_file_id}")
-    
-    for pid, i in cart.items(): await decrease_stock(pid, i['qty'])
-    
+    def admin_notifications(oid):
+        admin_text = f"🚨 <b>ЯНГИ БУЮРТМА: #{oid}</b>\n👤 Исм: {m.from_user.full_name}\n📞 Тел: {phone}\n🚚 Етказиш: {delivery} ({vehicle})\n🏢 База: {closest_base}\n📍 Манзил: {location}\n💰 ЖАМИ Сумма: {final_total} сом\n💵 Олдиндан тўланди (10%): {advance} сом\n📦 Қолдиқ (Ҳайдовчи олади): {final_total - advance} сом"
+        items = []
+        for a in ADMIN_IDS:
+            items.append({"chat_id": a, "method": "send_photo", "kwargs": {"photo": check_file_id, "caption": admin_text, "parse_mode": "HTML"}})
+            if location != "Базадан олиб кетади" and "," in location:
+                try:
+                    lat, lon = location.split(",")
+                    items.append({"chat_id": a, "method": "send_location", "kwargs": {"latitude": float(lat), "longitude": float(lon)}})
+                except: pass
+        return items
+
+    oid, failed = await checkout_order(m.from_user.id, m.from_user.full_name, phone, cart, final_total, "Карта орқали 10%", delivery, location, f"Тўланди: {advance} сом | Йўл: {delivery_price} | База: {closest_base} | Чек: {check_file_id}",
+                                       delivery_price=delivery_price, closest_base=d.get('closest_base'), notify=admin_notifications)
+
+    if failed:
+        names = "\n".join(f"- {cart[pid]['name']}" for pid in failed if pid in cart)
+        msg = {
+            "uz": f"❌ Кечирасиз, қуйидаги маҳсулотлар омборда етарли эмас:\n{names}\n\nСаватни янгилаб, қайта уриниб кўринг.",
+            "ru": f"❌ Извините, на складе недостаточно товаров:\n{names}\n\nОбновите корзину и попробуйте снова.",
+            "kg": f"❌ Кечиресиз, кампада төмөнкү товарлар жетишсиз:\n{names}\n\nСебетти жаңыртып, кайра аракет кылыңыз."
+        }[lang]
+        await state.set_state(None)
+        return await m.answer(msg, reply_markup=main_kb(m.from_user.id))
+    if not oid:
+        await state.set_state(None)
+        return await m.answer({"uz":"❌ Хатолик юз берди, қайта уриниб кўринг.","ru":"❌ Произошла ошибка, попробуйте снова.","kg":"❌ Ката кетти, кайра аракет кылыңыз."}[lang], reply_markup=main_kb(m.from_user.id))
+
     success_msg = {
         "uz": f"✅ Буюртма тасдиқланди! Чек ID: #{oid}\n{get_delivery_time('uz')} кутинг.",
         "ru": f"✅ Заказ подтвержден! ID чека: #{oid}\nОжидайте {get_delivery_time('ru')}.",
         "kg": f"✅ Буйрутма тастыкталды! Чек ID: #{oid}\n{get_delivery_time('kg')} күтүңүз."
     }[lang]
+    outbox.wake()
     await m.answer(success_msg, reply_markup=main_kb(m.from_user.id))
-    
-    admin_text = f"🚨 <b>ЯНГИ БУЮРТМА: #{oid}</b>\n👤 Исм: {m.from_user.full_name}\n📞 Тел: {phone}\n🚚 Етказиш: {delivery} ({vehicle})\n🏢 База: {closest_base}\n📍 Манзил: {location}\n💰 ЖАМИ Сумма: {final_total} сом\n💵 Олдиндан тўланди (10%): {advance} сом\n📦 Қолдиқ (Ҳайдовчи олади): {final_total - advance} сом"
-    
-    for a in ADMIN_IDS:
-        await bot.send_photo(a, photo=check_file_id, caption=admin_text, parse_mode="HTML")
-        if location != "Базадан олиб кетади" and "," in location:
-            try:
-                lat, lon = location.split(",")
-                await bot.send_location(a, latitude=float(lat), longitude=float(lon))
-            except: pass
-            
+
     await state.update_data(cart={})
     await state.set_state(None)
 
-@dp.message(UserState.check_photo)
+@router.message(UserState.check_photo)
 async def user_check_invalid(m: types.Message):
     d = await state.get_data()
     lang = d.get('lang', 'kg')
     msg = {"uz":"Илтимос, тўлов чекини фақат расм (скриншот) кўринишида юборинг!","ru":"Пожалуйста, отправьте чек только в виде фото!","kg":"Сураныч, төлөм чегин сүрөт түрүндө гана жөнөтүңүз!"}[lang]
     await m.answer(msg)
 
+# =====================================================================
+# ISHGA TUSHISH: WARM-UP
+# =====================================================================
+# Ikki qadam:
+#   - bootstrap_db(): ping + indekslar/migratsiyalar — deployment uchun BIR MARTA
+#     (polling: main; webhook: bosh jarayondagi setup_webhook, workerlarda emas);
+#   - warm_up(bot): faqat keshlar (katalog/sozlamalar/bazalar/qidiruv) — har bir jarayonda,
+#     update qabul qilishdan oldin: birinchi foydalanuvchi sovuq keshga tushmaydi.
+
+async def bootstrap_db():
+    if not await ping_db(): return False
+    await _warm_step("ensure_indexes", ensure_indexes())
+    return True
+
+async def _warm_step(name, coro):
+    start = time.perf_counter()
+    result = await coro
+    logging.info(f"Warm-up: {name} {(time.perf_counter() - start) * 1000:.0f}ms")
+    return result
+
+async def warm_up_catalog():
+    cats = await get_categories()
+    for cat in cats:
+        await render_shop_page(cat["name"], 0)
+    await render_categories()
+    return len(cats)
+
+async def warm_up(bot):
+    start = time.perf_counter()
+    await _warm_step("get_me", bot.me())
+    await _warm_step("settings", get_settings_snapshot())
+    await _warm_step("catalog", warm_up_catalog())
+    await _warm_step("bases", load_base_index())
+    await _warm_step("search", load_search_index())
+    logging.info(f"Warm-up tugadi: {time.perf_counter() - start:.2f}s (jarayon boshidan {time.perf_counter() - STARTED_AT:.2f}s)")
+    return True
+
 async def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    init_db()
+    bot = create_bot()
+    dp = create_dispatcher()
+    if not await bootstrap_db(): sys.exit(1)
+    await warm_up(bot)
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    outbox_task = asyncio.create_task(outbox.run_outbox_worker(bot))
+    metrics_runner = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    try:
+        await dp.start_polling(bot)
+    finally:
+        outbox_task.cancel()
+        if metrics_runner: await metrics_runner.cleanup()
+
+# =====================================================================
+# WEBHOOK REJIMI
+# =====================================================================
+
+# Bosh jarayonda alohida asyncio.run ichida: klient oxirida yopiladi, chunki u shu loop ga
+# bog'langan — WEB_WORKERS=1 da worker xuddi shu jarayonda yangi loop bilan ishlaydi.
+async def setup_webhook():
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    init_db()
+    try:
+        if not await bootstrap_db(): sys.exit(1)
+        if WEBHOOK_BASE_URL:
+            bot = create_bot()
+            await bot.set_webhook(
+                WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=router.resolve_used_update_types()
+            )
+            await bot.session.close()
+    finally:
+        database.close_db()
+
+# Har bir worker jarayoni o'z keshlarini o'zi isitadi (indekslar setup_webhook da yaratilgan)
+async def worker_ctx(app):
+    if not await ping_db(): raise RuntimeError("MongoDB javob bermayapti")
+    await warm_up(app["bot"])
+    task = asyncio.create_task(outbox.run_outbox_worker(app["bot"]))
+    # Har bir worker o'z metrikalarini METRICS_PORT + worker raqamida beradi
+    metrics_runner = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT + app["worker"]) if METRICS_PORT else None
+    yield
+    task.cancel()
+    if metrics_runner: await metrics_runner.cleanup()
+    database.close_db()
+
+# Ilova web.run_app ning o'z loop ida quriladi: Mongo klienti va bot sessiyasi shu loop da yaratiladi
+async def build_webhook_app(worker=0):
+    init_db()
+    bot = create_bot()
+    app = webhook.create_app(bot, create_dispatcher(), WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_DRAIN_TIMEOUT)
+    app["bot"] = bot
+    app["worker"] = worker
+    app.cleanup_ctx.append(worker_ctx)
+    return app
+
+def serve_webhook(worker=0):
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    web.run_app(build_webhook_app(worker), host=WEB_HOST, port=WEB_PORT, reuse_port=WEB_WORKERS > 1, shutdown_timeout=WEBHOOK_DRAIN_TIMEOUT, print=None)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if RUN_MODE == "webhook":
+        if WEB_WORKERS > 1 and FSM_STORAGE != "mongo":
+            logging.warning("Bir nechta worker uchun FSM_STORAGE=mongo kerak, aks holda savatlar workerlar orasida yo'qoladi")
+        asyncio.run(setup_webhook())
+        webhook.run_workers(serve_webhook, WEB_WORKERS)
+    else:
+        asyncio.run(main())
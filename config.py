@@ -10,3 +10,75 @@ ADMIN_IDS = [int(x) for x in admin_env.split(",") if x.strip().isdigit()]
 
 MONGO_URL = os.getenv("MONGO_URL")
 CARD_NUMBER = os.getenv("CARD_NUMBER", "Karta kiritilmagan")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "sss_new_shop")
+
+# Texnik xizmat rejimi: yoqilganda faqat adminlar botdan foydalana oladi
+MAINTENANCE_MODE = os.getenv("MAINTENANCE_MODE", "1") == "1"
+
+# Katalog keshi (mahsulotlar, kategoriyalar, sahifalar)
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "2048"))
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+# Buyurtma ID lari bir jarayonga shu o'lchamdagi bloklar bilan ajratiladi
+ORDER_ID_BLOCK = int(os.getenv("ORDER_ID_BLOCK", "50"))
+
+# FSM (savat, checkout holati) saqlash joyi: "mongo" (replikalar uchun) yoki "memory"
+FSM_STORAGE = os.getenv("FSM_STORAGE", "mongo")
+FSM_SESSION_TTL = int(os.getenv("FSM_SESSION_TTL", str(7 * 24 * 3600)))
+
+# Ishga tushirish rejimi: "polling" yoki "webhook"
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # bo'sh bo'lsa set_webhook chaqirilmaydi (lokal test)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8080"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+
+# Telegram API cheklovlari (token bucket)
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_CHAT_BURST = int(os.getenv("TG_CHAT_BURST", "5"))
+
+# Foydalanuvchi flood nazorati: har bir foydalanuvchi uchun update/s va burst (0 — o'chirilgan),
+# bir xil callback takrorini e'tiborsiz qoldirish oynasi, soniya
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", "6"))
+THROTTLE_DEBOUNCE = float(os.getenv("THROTTLE_DEBOUNCE", "1"))
+
+# Do'kon sozlamalari (info, socials, logo, trailer) keshi, soniya
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "60"))
+
+# Eng yaqin bazani topish: "geo" ($geoNear + 2dsphere) yoki "memory" (xotiradagi k-d daraxt)
+NEAREST_BASE_MODE = os.getenv("NEAREST_BASE_MODE", "geo")
+# Xotiradagi bazalar indeksi: boshqa worker qo'shgan/o'chirgan bazalar shu oraliqda (soniya) tekshiriladi
+BASE_INDEX_CHECK_INTERVAL = float(os.getenv("BASE_INDEX_CHECK_INTERVAL", "30"))
+
+# Prometheus /metrics endpointi (0 — o'chirilgan). Webhook rejimida har bir worker METRICS_PORT + raqamida.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Tayyor katalog sahifalari (matn + klaviatura) keshi
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "1024"))
+
+# Mahsulot qidiruvi: xotiradagi indeksni to'liq qayta qurish oralig'i (soniya) va inline javob keshi
+SEARCH_REBUILD_INTERVAL = float(os.getenv("SEARCH_REBUILD_INTERVAL", "600"))
+SEARCH_CACHE_TIME = int(os.getenv("SEARCH_CACHE_TIME", "60"))
+
+# Admin buyurtmalar menyusidagi holatlar soni keshi, soniya
+ORDER_COUNTS_TTL = float(os.getenv("ORDER_COUNTS_TTL", "10"))
+
+# MongoDB ulanish puli va timeoutlar (ms). Timeoutlarsiz o'chgan server har bir so'rovni 30s ushlab turadi.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "3000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "3000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# Tarmoq xatolarida qayta urinish va circuit breaker
+DB_RETRIES = int(os.getenv("DB_RETRIES", "2"))
+DB_RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.05"))
+DB_BREAKER_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "5"))
+DB_BREAKER_RESET = float(os.getenv("DB_BREAKER_RESET", "15"))
@@ -1,23 +1,57 @@
 import os
+import math
 import time
+import random
+import asyncio
 import logging
+from datetime import datetime, timedelta, timezone
+import pytz
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
-from config import MONGO_URL
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from cache import TTLCache
+from search import SearchIndex
+from metrics import db_timed, MongoCommandListener
+import resilience
+from resilience import db_call, is_transient
+from config import MONGO_URL, MONGO_DB_NAME, CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL, ORDER_ID_BLOCK, FSM_SESSION_TTL, SETTINGS_CACHE_TTL, NEAREST_BASE_MODE, BASE_INDEX_CHECK_INTERVAL, SEARCH_REBUILD_INTERVAL, ORDER_COUNTS_TTL
+from config import (
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS, DB_RETRIES, DB_RETRY_BASE_DELAY, DB_BREAKER_THRESHOLD, DB_BREAKER_RESET
+)
 
-# =====================================================================
-# LOGLARNI SOZLASH
-# =====================================================================
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("SSS_Database_Engine")
 
 # =====================================================================
 # BAZAGA ULANISH
 # =====================================================================
-try:
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client['sss_new_shop']
-    
+# Import paytida hech narsa ulanmaydi: klient init_db() da yaratiladi (bot.main,
+# webhook worker, benchmark skriptlari). Kolleksiyalar modul o'zgaruvchilari bo'lib
+# qoladi, funksiyalar ularni chaqiruv paytida o'qiydi.
+client = db = None
+products_col = orders_col = settings_col = services_col = locations_col = ads_col = None
+bases_col = counters_col = fsm_col = outbox_col = stats_col = categories_col = None
+
+def init_db(url=None, db_name=None):
+    global client, db, products_col, orders_col, settings_col, services_col, locations_col, ads_col
+    global bases_col, counters_col, fsm_col, outbox_col, stats_col, categories_col
+    if client is not None: return db
+    # motor ulanishni dangasa (lazy) o'rnatadi: haqiqiy tekshiruv — ping_db()
+    client = AsyncIOMotorClient(
+        url or MONGO_URL,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        retryWrites=True,
+        retryReads=True,
+        event_listeners=[MongoCommandListener()]
+    )
+    db = client[db_name or MONGO_DB_NAME]
+
     # Kolleksiyalar
     products_col = db['products']
     orders_col = db['orders']
@@ -25,309 +59,1246 @@ try:
     services_col = db['services']
     locations_col = db['locations']
     ads_col = db['ads']
-    bases_col = db['bases'] 
-    
-    logger.info("MongoDB ulanishi 100% muvaffaqiyatli!")
-except Exception as e:
-    logger.critical(f"BAZA BILAN ALOQA YO'Q: {e}")
+    bases_col = db['bases']
+    counters_col = db['counters']
+    fsm_col = db['fsm_sessions']
+    outbox_col = db['outbox']
+    stats_col = db['stats']
+    categories_col = db['categories']
+
+    resilience.configure(DB_BREAKER_THRESHOLD, DB_BREAKER_RESET, DB_RETRIES, DB_RETRY_BASE_DELAY)
+    return db
+
+# motor klienti birinchi so'rovdagi event loop ga bog'lanadi: boshqa asyncio.run / web.run_app
+# loop ida ishlatishdan oldin yopiladi, keyingi init_db() yangi klient yaratadi.
+def close_db():
+    global client, db, products_col, orders_col, settings_col, services_col, locations_col, ads_col
+    global bases_col, counters_col, fsm_col, outbox_col, stats_col, categories_col
+    if client is not None: client.close()
+    client = db = None
+    products_col = orders_col = settings_col = services_col = locations_col = ads_col = None
+    bases_col = counters_col = fsm_col = outbox_col = stats_col = categories_col = None
+
+# Ishga tushishda: server javob berguncha jitterli backoff bilan kutadi
+async def ping_db(attempts=5):
+    for attempt in range(attempts):
+        try:
+            await client.admin.command("ping")
+            logger.info("MongoDB ulanishi 100% muvaffaqiyatli!")
+            return True
+        except Exception as e:
+            delay = min(10, 2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning(f"MongoDB ping xatosi ({attempt + 1}/{attempts}): {e}; {delay:.1f}s kutamiz")
+            if attempt + 1 < attempts: await asyncio.sleep(delay)
+    logger.critical("BAZA BILAN ALOQA YO'Q: ping javob bermadi")
+    return False
+
+# =====================================================================
+# KATALOG KESHI
+# =====================================================================
+# Kalitlar: ("cats",), ("product", pid), ("count", category),
+# ("page", category, page, page_size), ("kpage", category, after, before, page_size)
+_catalog_cache = TTLCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL)
+_catalog_version = 0
+_CATEGORY_KEYS = ("page", "kpage", "count")
+
+def _invalidate_catalog(category=None, pid=None):
+    global _catalog_version
+    _catalog_version += 1
+    _catalog_cache.pop(("cats",))
+    if pid is not None:
+        _catalog_cache.pop(("product", str(pid)))
+    if category is None:
+        _catalog_cache.drop_where(lambda k: k[0] in _CATEGORY_KEYS)
+    else:
+        _catalog_cache.drop_where(lambda k: k[0] in _CATEGORY_KEYS and k[1] == category)
+
+# Checkout dan keyin: {pid: (category, stock_after)}. Ombori kamaygan mahsulotning faqat o'z
+# kaliti tushiriladi; kategoriya sahifalari va versiya faqat mahsulot 0 ga tushganda yangilanadi
+# (shunda kategoriya count i va sahifa tarkibi o'zgaradi).
+def _invalidate_reserved(touched):
+    for pid, (category, stock) in touched.items():
+        if stock == 0: _invalidate_catalog(category, pid)
+        else: _catalog_cache.pop(("product", str(pid)))
+
+def get_catalog_version():
+    return _catalog_version
+
+def get_cache_stats():
+    return _catalog_cache.stats()
+
+def clear_catalog_cache():
+    _invalidate_catalog()
+    _catalog_cache.clear()
+
+# =====================================================================
+# 1.0 KATEGORIYALAR REESTRI
+# =====================================================================
+# {"_id": 7, "name": "Сантехника", "count": <omborda bor mahsulotlar soni>}
+# _id — counters dagi "category_id" ketma-ketligidan qisqa butun son: callback "cat_7"
+# nomning uzunligiga bog'liq emas. count mahsulot yozuvlari bilan birga $inc qilinadi
+# (stock 0 ga tushganda -1, 0 dan chiqqanda +1); import tugagach rebuild_categories().
+# Nom <-> id bog'lanishi o'zgarmaydi, shuning uchun jarayon xotirasida saqlanadi.
+_category_ids = {}  # nom -> id
+_category_names = {}  # id -> nom
+
+def _remember_category(cid, name):
+    _category_ids[name] = cid
+    _category_names[cid] = name
+
+async def _ensure_category(name):
+    cid = _category_ids.get(name)
+    if cid is not None: return cid
+    doc = await categories_col.find_one({"name": name}, {"_id": 1})
+    while not doc:
+        seq = await counters_col.find_one_and_update(
+            {"_id": "category_id"}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        try:
+            await categories_col.insert_one({"_id": seq["seq"], "name": name, "count": 0})
+            doc = {"_id": seq["seq"]}
+        except DuplicateKeyError:
+            # Boshqa jarayon shu nomni bir vaqtda yaratdi — yoki hisoblagich tozalangan va
+            # bu _id band: unda nom topilmaydi va keyingi seq bilan qayta urinamiz
+            doc = await categories_col.find_one({"name": name}, {"_id": 1})
+    _remember_category(doc["_id"], name)
+    return doc["_id"]
+
+# Omborda bor/yo'q chegarasini kesib o'tgan mahsulot uchun count ni o'zgartiradi
+async def _adjust_category(name, delta, session=None):
+    if not delta or name is None: return
+    if delta > 0: await _ensure_category(name)
+    await categories_col.update_one({"name": name}, {"$inc": {"count": delta}}, session=session)
+
+def _in_stock_delta(old_stock, new_stock):
+    return int((new_stock or 0) > 0) - int((old_stock or 0) > 0)
+
+@db_call(retry=True)
+async def get_category_name(cid):
+    name = _category_names.get(cid)
+    if name is not None: return name
+    doc = await categories_col.find_one({"_id": cid}, {"name": 1})
+    if not doc: return None
+    _remember_category(cid, doc["name"])
+    return doc["name"]
+
+# Bitta kategoriya: count = omborda bor mahsulotlar soni. $set emas, shartli $inc:
+# o'qish va yozish orasida boshqa jarayon count ni $inc qilgan bo'lsa yangilanish
+# o'tmaydi va hisob qaytadan olinadi — parallel checkout/tahrir o'zgarishi yo'qolmaydi.
+async def _recount_category(name, attempts=3):
+    for _ in range(attempts):
+        doc = await categories_col.find_one({"name": name}, {"count": 1})
+        if not doc: return False
+        old = doc.get("count", 0)
+        n = await products_col.count_documents({"category": name, "stock": {"$gt": 0}})
+        if n == old: return False
+        res = await categories_col.update_one({"name": name, "count": old}, {"$inc": {"count": n - old}})
+        if res.modified_count: return True
+    logger.warning(f"Kategoriya {name!r} qayta hisoblanmadi: parallel yozuvlar, keyingi rebuild da")
+    return False
+
+_category_rebuild_lock = asyncio.Lock()
+
+# Mahsulotlardan to'liq qayta hisoblash: import, migratsiya yoki count siljib ketganda.
+# Ishlab turgan bot bilan parallel chaqirilishi mumkin (importer): qarang _recount_category.
+@db_call(default=0)
+async def rebuild_categories():
+    async with _category_rebuild_lock:
+        names = {n for n in await products_col.distinct("category") if n is not None}
+        registry = {d["name"] async for d in categories_col.find({}, {"name": 1})}
+        fixed = 0
+        for name in sorted(names | registry):
+            if name in names: await _ensure_category(name)
+            if await _recount_category(name): fixed += 1
+        _invalidate_catalog()
+    logger.info(f"Kategoriyalar qayta hisoblandi: {len(names)} ta, {fixed} tasi tuzatildi")
+    return len(names)
 
 # =====================================================================
 # 1. MAHSULOTLAR (PRODUCTS) MANTIQI
 # =====================================================================
 
-async def add_product(name, article, price, file_id, category):
-    try:
-        doc = {
-            "name": name,
-            "article": str(article),
-            "price": int(price),
-            "stock": 999,
-            "file_id": file_id,
-            "category": category,
-            "created_at": time.time()
-        }
-        result = await products_col.insert_one(doc)
-        return result.inserted_id
-    except Exception as e:
-        logger.error(f"add_product xatosi: {e}")
-        return None
+@db_call()
+async def add_product(name, article, price, file_id, category, stock=999):
+    doc = {
+        "name": name,
+        "article": str(article),
+        "price": int(price),
+        "stock": int(stock),
+        "file_id": file_id,
+        "category": category,
+        "created_at": time.time()
+    }
+    await _ensure_category(category)
+    result = await products_col.insert_one(doc)
+    await _adjust_category(category, _in_stock_delta(0, doc["stock"]))
+    _invalidate_catalog(category)
+    _search_apply("add", doc)
+    return result.inserted_id
 
+# Qaytaradi: [{"_id": id, "name": nom, "count": n}, ...] — faqat omborda mahsuloti borlar
+@db_call(default=[], retry=True, stale=lambda: _catalog_cache.get(("cats",), stale=True))
 async def get_categories():
-    try:
-        return await products_col.distinct("category", {"stock": {"$gt": 0}})
-    except Exception as e:
-        logger.error(f"get_categories xatosi: {e}")
-        return []
+    cached = _catalog_cache.get(("cats",))
+    if cached is not None: return cached
+    cats = await categories_col.find({"count": {"$gt": 0}}).sort("name", ASCENDING).to_list(length=None)
+    for c in cats: _remember_category(c["_id"], c["name"])
+    _catalog_cache.set(("cats",), cats)
+    return cats
 
+async def _count_in_stock(category):
+    key = ("count", category)
+    cached = _catalog_cache.get(key)
+    if cached is not None: return cached
+    doc = await categories_col.find_one({"name": category}, {"count": 1})
+    total_count = max(0, doc["count"]) if doc else 0
+    _catalog_cache.set(key, total_count)
+    return total_count
+
+@db_call(default=([], 0), retry=True, stale=lambda category, page=0, page_size=6: _catalog_cache.get(("page", category, page, page_size), stale=True))
 async def get_products_by_category_paginated(category, page=0, page_size=6):
-    try:
-        skip = page * page_size
-        query = {"stock": {"$gt": 0}, "category": category}
-        cursor = products_col.find(query).sort("created_at", -1).skip(skip).limit(page_size)
-        products = await cursor.to_list(length=page_size)
-        total_count = await products_col.count_documents(query)
-        return products, total_count
-    except Exception as e:
-        logger.error(f"Pagination xatosi: {e}")
-        return [], 0
+    key = ("page", category, page, page_size)
+    cached = _catalog_cache.get(key)
+    if cached is not None: return cached
+    skip = page * page_size
+    query = {"stock": {"$gt": 0}, "category": category}
+    cursor = products_col.find(query).sort("created_at", -1).skip(skip).limit(page_size)
+    products = await cursor.to_list(length=page_size)
+    total_count = await _count_in_stock(category)
+    _catalog_cache.set(key, (products, total_count))
+    return products, total_count
+
+# Keyset (cursor) pagination: sahifa (created_at, _id) bo'yicha tartiblanadi.
+# after = oldingi sahifaning oxirgi elementi (keyingi sahifa uchun),
+# before = joriy sahifaning birinchi elementi (oldingi sahifa uchun).
+# Har ikkalasi (created_at, "ObjectId hex") ko'rinishida beriladi.
+@db_call(default=([], 0), retry=True, stale=lambda category, after=None, before=None, page_size=6: _catalog_cache.get(("kpage", category, after, before, page_size), stale=True))
+async def get_products_by_category_keyset(category, after=None, before=None, page_size=6):
+    key = ("kpage", category, after, before, page_size)
+    cached = _catalog_cache.get(key)
+    if cached is not None: return cached
+    query = {"stock": {"$gt": 0}, "category": category}
+    order = -1
+    if after:
+        ts, oid = float(after[0]), ObjectId(after[1])
+        query["$or"] = [{"created_at": {"$lt": ts}}, {"created_at": ts, "_id": {"$lt": oid}}]
+    elif before:
+        ts, oid = float(before[0]), ObjectId(before[1])
+        query["$or"] = [{"created_at": {"$gt": ts}}, {"created_at": ts, "_id": {"$gt": oid}}]
+        order = 1
+    cursor = products_col.find(query).sort([("created_at", order), ("_id", order)]).limit(page_size)
+    products = await cursor.to_list(length=page_size)
+    if order == 1: products.reverse()
+    total_count = await _count_in_stock(category)
+    _catalog_cache.set(key, (products, total_count))
+    return products, total_count
 
+@db_call(retry=True, stale=lambda pid: _catalog_cache.get(("product", str(pid)), stale=True))
 async def get_product(pid):
-    try:
-        if not ObjectId.is_valid(pid): return None
-        return await products_col.find_one({"_id": ObjectId(pid)})
-    except Exception as e:
-        logger.error(f"get_product xatosi: {e}")
-        return None
+    key = ("product", str(pid))
+    cached = _catalog_cache.get(key)
+    if cached is not None: return cached
+    if not ObjectId.is_valid(pid): return None
+    product = await products_col.find_one({"_id": ObjectId(pid)})
+    if product: _catalog_cache.set(key, product)
+    return product
 
+@db_call(default=False)
 async def delete_product(pid):
-    try:
-        await products_col.delete_one({"_id": ObjectId(pid)})
-        return True
-    except Exception as e:
-        logger.error(f"delete_product xatosi: {e}")
-        return False
+    old = await products_col.find_one_and_delete({"_id": ObjectId(pid)}, projection={"category": 1, "stock": 1})
+    if old: await _adjust_category(old.get("category"), _in_stock_delta(old.get("stock"), 0))
+    _invalidate_catalog(old.get("category") if old else None, pid)
+    _search_apply("remove", pid)
+    return True
 
+@db_call(default=False)
 async def set_product_stock(pid, new_stock):
-    try:
-        await products_col.update_one({"_id": ObjectId(pid)}, {"$set": {"stock": int(new_stock)}})
-        return True
-    except Exception as e:
-        logger.error(f"set_product_stock xatosi: {e}")
-        return False
+    old = await products_col.find_one_and_update(
+        {"_id": ObjectId(pid)}, {"$set": {"stock": int(new_stock)}}, projection={"category": 1, "stock": 1}
+    )
+    if old: await _adjust_category(old.get("category"), _in_stock_delta(old.get("stock"), int(new_stock)))
+    _invalidate_catalog(old.get("category") if old else None, pid)
+    return True
 
+@db_call(default=False)
 async def decrease_stock(pid, qty):
-    try:
-        await products_col.update_one({"_id": ObjectId(pid)}, {"$inc": {"stock": -int(qty)}})
-        return True
-    except Exception as e:
-        logger.error(f"decrease_stock xatosi: {e}")
-        return False
+    old = await products_col.find_one_and_update(
+        {"_id": ObjectId(pid)}, {"$inc": {"stock": -int(qty)}}, projection={"category": 1, "stock": 1}
+    )
+    if old: await _adjust_category(old.get("category"), _in_stock_delta(old.get("stock"), old.get("stock", 0) - int(qty)))
+    _invalidate_catalog(old.get("category") if old else None, pid)
+    return True
+
+# Savatdagi barcha qatorlarni bitta bulk_write bilan band qiladi ("stock >= qty" sharti bilan).
+# Qaytaradi: yetmagan mahsulotlar pid ro'yxati (bo'sh ro'yxat = hammasi band qilindi).
+# Faqat tranzaksiya ichida (session bilan) chaqiriladi: xato bo'lsa tranzaksiya bekor qilinadi.
+# touched (ixtiyoriy) ga muvaffaqiyatda {pid: (category, stock_after)} yoziladi.
+@db_timed
+async def reserve_stock(cart, session, touched=None):
+    lines = [(ObjectId(pid), int(i['qty'])) for pid, i in cart.items()]
+    token = ObjectId()
+    ops = [
+        UpdateOne({"_id": oid, "stock": {"$gte": qty}}, {"$inc": {"stock": -qty}, "$set": {"last_reservation": token}})
+        for oid, qty in lines
+    ]
+    res = await products_col.bulk_write(ops, ordered=False, session=session)
+    # Token faqat muvaffaqiyatli yangilangan hujjatlarda bor: yetmaganlar va ombori 0 ga
+    # tushganlar (kategoriya count i shu tranzaksiyada kamayadi) bitta so'rovda aniqlanadi
+    reserved = await products_col.find(
+        {"_id": {"$in": [oid for oid, _ in lines]}, "last_reservation": token}, {"stock": 1, "category": 1}, session=session
+    ).to_list(length=len(lines))
+    if res.matched_count != len(ops):
+        reserved_ids = {d["_id"] for d in reserved}
+        return [str(oid) for oid, _ in lines if oid not in reserved_ids]
+    for d in reserved:
+        if d.get("stock") == 0: await _adjust_category(d.get("category"), -1, session=session)
+        if touched is not None: touched[str(d["_id"])] = (d.get("category"), d.get("stock"))
+    return []
 
+# Tranzaksiyasiz (standalone mongod) zaxira varianti: qatorma-qator, muvaffaqiyatsizlikda orqaga qaytariladi
+async def _reserve_stock_sequential(cart, touched=None):
+    done, failed = [], []
+    for pid, i in cart.items():
+        qty = int(i['qty'])
+        doc = await products_col.find_one_and_update(
+            {"_id": ObjectId(pid), "stock": {"$gte": qty}}, {"$inc": {"stock": -qty}},
+            projection={"stock": 1, "category": 1}, return_document=ReturnDocument.AFTER
+        )
+        if not doc:
+            failed.append(pid)
+            continue
+        done.append((pid, qty))
+        if touched is not None: touched[pid] = (doc.get("category"), doc.get("stock"))
+        if doc.get("stock") == 0: await _adjust_category(doc.get("category"), -1)
+    if failed:
+        for pid, qty in done: await _restock(pid, qty)
+    return failed
+
+# Bekor qilingan zaxirani qaytarish: 0 dan chiqqan mahsulot kategoriyasi count ini oshiradi
+async def _restock(pid, qty):
+    doc = await products_col.find_one_and_update(
+        {"_id": ObjectId(pid)}, {"$inc": {"stock": qty}},
+        projection={"stock": 1, "category": 1}, return_document=ReturnDocument.AFTER
+    )
+    if doc and doc.get("stock") == qty: await _adjust_category(doc.get("category"), 1)
+
+@db_call(default=[], retry=True)
 async def get_all_products():
-    try:
-        return await products_col.find().sort("created_at", -1).to_list(length=2000)
-    except Exception as e:
-        logger.error(f"get_all_products xatosi: {e}")
-        return []
+    return await products_col.find().sort("created_at", -1).to_list(length=2000)
+
+# Import (CSV/XLSX) partiyasi: artikul bo'yicha upsert. To'liq qator (nom, narx, kategoriya bilan)
+# yangi mahsulot yaratadi yoki mavjudini yangilaydi; faqat artikul + ombor bo'lgan qator faqat
+# mavjud mahsulotning omborini o'zgartiradi.
+# Qaytaradi: (yaratilgan, yangilangan, topilmagan artikullar ro'yxati)
+@db_timed
+async def bulk_upsert_products(rows):
+    stock_only = [r["article"] for r in rows if "name" not in r]
+    existing = set()
+    if stock_only:
+        async for d in products_col.find({"article": {"$in": stock_only}}, {"article": 1, "_id": 0}):
+            existing.add(d["article"])
+    missing = [a for a in stock_only if a not in existing]
+
+    ops = []
+    for r in rows:
+        fields = {k: v for k, v in r.items() if k != "article"}
+        if "name" in r:
+            ops.append(UpdateOne(
+                {"article": r["article"]},
+                {"$set": fields, "$setOnInsert": {"file_id": None, "created_at": time.time()}},
+                upsert=True
+            ))
+        elif r["article"] in existing:
+            ops.append(UpdateOne({"article": r["article"]}, {"$set": fields}))
+    if not ops: return 0, 0, missing
+    result = await products_col.bulk_write(ops, ordered=False)
+    return result.upserted_count, result.modified_count, missing
+
+# =====================================================================
+# 1.1 MAHSULOT QIDIRUVI (NOM VA ARTIKUL BO'YICHA)
+# =====================================================================
+# Indeks xotirada: add_product/delete_product uni darhol yangilaydi, boshqa
+# jarayonlar (webhook workerlari) yozgan o'zgarishlar esa SEARCH_REBUILD_INTERVAL
+# da bir marta to'liq qayta qurish orqali yetib keladi. Qayta qurish fon vazifasida:
+# qidiruv hech qachon uni kutmaydi, tayyor bo'lguncha joriy indeks ishlatiladi.
+
+_search_index = SearchIndex()
+_search_rebuild_lock = asyncio.Lock()
+_search_rebuild_task = None
+_search_pending = None  # qayta qurish paytida: [(amal, argument)] — yangi indeksga ham qo'llanadi
+
+# add_product/delete_product: joriy indeks darhol yangilanadi. Qayta qurish ketayotgan bo'lsa
+# amal yoziladi va tayyor indeksga swap dan oldin qo'llanadi — aks holda yo'qolardi.
+def _search_apply(op, arg):
+    getattr(_search_index, op)(arg)
+    if _search_pending is not None: _search_pending.append((op, arg))
+
+@db_call(default=0, retry=True)
+async def load_search_index():
+    global _search_index, _search_pending
+    async with _search_rebuild_lock:
+        _search_pending = []
+        try:
+            docs = await products_col.find({}, {"name": 1, "article": 1}).to_list(length=None)
+            # Katta katalogda qurish bir necha yuz ms oladi: event loop ni bloklamaymiz
+            index = await asyncio.to_thread(SearchIndex.build, docs)
+            # add/remove idempotent: o'qishga tushgan amal qayta qo'llansa ham zarari yo'q
+            for op, arg in _search_pending: getattr(index, op)(arg)
+            _search_index = index
+        finally:
+            _search_pending = None
+        logger.info(f"Qidiruv indeksi qurildi: {len(_search_index)} ta mahsulot")
+    return len(_search_index)
+
+def _search_rebuild_done(task):
+    if not task.cancelled() and task.exception():
+        logger.error(f"Qidiruv indeksini qayta qurish xatosi: {task.exception()}")
+
+def _schedule_search_rebuild():
+    global _search_rebuild_task
+    if _search_rebuild_lock.locked() or (_search_rebuild_task and not _search_rebuild_task.done()): return
+    # Qurish muvaffaqiyatsiz bo'lsa ham keyingi urinish bir intervaldan keyin (har so'rovda emas)
+    _search_index.built_at = time.monotonic()
+    _search_rebuild_task = asyncio.create_task(load_search_index())
+    _search_rebuild_task.add_done_callback(_search_rebuild_done)
+
+# Qaytaradi: mos keluvchi, omborda bor mahsulotlar (eng mosi birinchi)
+@db_call(default=[], retry=True)
+async def search_products(query, limit=10):
+    if time.monotonic() - _search_index.built_at > SEARCH_REBUILD_INTERVAL: _schedule_search_rebuild()
+    ids = _search_index.search(query, limit=limit * 2)
+    if not ids: return []
+    docs = await products_col.find(
+        {"_id": {"$in": [ObjectId(i) for i in ids]}, "stock": {"$gt": 0}},
+        {"name": 1, "article": 1, "price": 1, "stock": 1, "category": 1}
+    ).to_list(length=len(ids))
+    by_id = {str(d["_id"]): d for d in docs}
+    return [by_id[i] for i in ids if i in by_id][:limit]
+
+# =====================================================================
+# ADMIN RO'YXATLARI: PROYEKSIYA + KEYSET SAHIFALASH (_id bo'yicha, yangilari birinchi)
+# =====================================================================
+# Qaytaradi: (hujjatlar, oldingi_sahifa_bormi, keyingi_sahifa_bormi)
+
+async def _page_by_id(col, query, projection, after=None, before=None, limit=20):
+    q = dict(query)
+    order = -1
+    if after: q["_id"] = {"$lt": ObjectId(after)}
+    elif before:
+        q["_id"] = {"$gt": ObjectId(before)}
+        order = 1
+    docs = await col.find(q, projection).sort("_id", order).limit(limit + 1).to_list(length=limit + 1)
+    more = len(docs) > limit
+    docs = docs[:limit]
+    if order == 1:
+        docs.reverse()
+        return docs, more, True
+    return docs, bool(after), more
+
+@db_call(default=([], False, False), retry=True)
+async def get_products_brief(after=None, before=None, limit=20):
+    return await _page_by_id(products_col, {}, {"name": 1, "stock": 1}, after, before, limit)
 
 # =====================================================================
 # 2. BUYURTMALAR (ORDERS) MANTIQI
 # =====================================================================
 
-async def create_order(user_id, user_name, phone, cart, total_price, pay_method, delivery_type, location, comment):
+# Buyurtma ID: counters kolleksiyasidagi ketma-ketlikdan bloklab olinadi.
+# Har bir jarayon ORDER_ID_BLOCK ta ID ni bitta so'rovda band qiladi, shuning uchun
+# replikalar orasida ham takrorlanmaydi. 7 xonali format eski 6 xonali ID lar bilan to'qnashmaydi.
+_order_id_lock = asyncio.Lock()
+_order_id_next = 0
+_order_id_end = 0
+
+@db_timed
+async def allocate_order_id():
+    global _order_id_next, _order_id_end
+    async with _order_id_lock:
+        if _order_id_next >= _order_id_end:
+            doc = await counters_col.find_one_and_update(
+                {"_id": "order_id"}, {"$inc": {"seq": ORDER_ID_BLOCK}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            _order_id_end = doc["seq"]
+            _order_id_next = _order_id_end - ORDER_ID_BLOCK
+        _order_id_next += 1
+        return f"{_order_id_next:07d}"
+
+# notify(order_id) -> [{"chat_id": ..., "method": "send_photo", "kwargs": {...}}, ...]
+# Bildirishnomalar buyurtma bilan bitta tranzaksiyada outbox ga yoziladi, yuborish outbox.py da.
+def _build_order(user_id, user_name, phone, cart, total_price, pay_method, delivery_type, location, comment, delivery_price=0, closest_base=None):
+    return {
+        "user_id": user_id,
+        "user_name": user_name,
+        "phone": str(phone),
+        "cart": cart,
+        "total_price": total_price,
+        "pay_method": pay_method,
+        "delivery_type": delivery_type,
+        "location": location,
+        "comment": comment,
+        "delivery_price": delivery_price,
+        "closest_base": closest_base,
+        "status": "new",
+        "created_at": time.time()
+    }
+
+async def _insert_order(order_data, notify=None, session=None):
+    for _ in range(3):
+        order_data["order_id"] = await allocate_order_id()
+        order_data.pop("_id", None)
+        try:
+            await orders_col.insert_one(order_data, session=session)
+            _invalidate_order_counts()
+            if notify:
+                await _enqueue_notifications(order_data["order_id"], notify(order_data["order_id"]), session)
+            return order_data["order_id"]
+        except DuplicateKeyError:
+            logger.warning(f"create_order: {order_data['order_id']} band, qayta urinilmoqda")
+    return None
+
+# session bilan (tranzaksiya ichida) chaqirilsa statistika yozilmaydi: uni commit dan keyin chaqiruvchi yozadi
+# session siz (tranzaksiyasiz mongod, checkout_order ning ketma-ket varianti) buyurtma va uning outbox
+# qatorlari ATOMAR EMAS: insert_one dan keyin jarayon yiqilsa buyurtma saqlanadi, admin bildirishnomasi
+# esa yozilmay qoladi (u /orders navbatida baribir ko'rinadi). Ikki marta yuborish bo'lmaydi — outbox
+# _id si "<order_id>:<n>". Kafolat kerak bo'lsa MongoDB replica set sifatida ishga tushiriladi.
+@db_call()
+async def create_order(user_id, user_name, phone, cart, total_price, pay_method, delivery_type, location, comment, delivery_price=0, closest_base=None, notify=None, session=None):
+    order_data = _build_order(user_id, user_name, phone, cart, total_price, pay_method, delivery_type, location, comment, delivery_price, closest_base)
+    order_id = await _insert_order(order_data, notify, session)
+    if order_id and session is None: await _rollup_order(order_data)
+    return order_id
+
+# =====================================================================
+# OUTBOX (ADMIN BILDIRISHNOMALARI NAVBATI)
+# =====================================================================
+# _id = "<order_id>:<n>" — idempotentlik kaliti: bitta bildirishnoma faqat bir marta yoziladi.
+# status: pending -> sending (lease bilan band) -> sent | dead
+
+async def _enqueue_notifications(order_id, items, session=None):
+    if not items: return
+    now = time.time()
+    docs = [{
+        "_id": f"{order_id}:{n}",
+        "order_id": order_id,
+        "chat_id": item["chat_id"],
+        "method": item["method"],
+        "kwargs": item.get("kwargs", {}),
+        "status": "pending",
+        "attempts": 0,
+        "next_at": now,
+        "created_at": now
+    } for n, item in enumerate(items)]
+    await outbox_col.insert_many(docs, ordered=False, session=session)
+
+@db_call(default=[])
+async def claim_outbox(limit=50, lease=60):
+    now = time.time()
+    query = {"$or": [
+        {"status": "pending", "next_at": {"$lte": now}},
+        {"status": "sending", "lease_until": {"$lte": now}}
+    ]}
+    claimed = []
+    for _ in range(limit):
+        doc = await outbox_col.find_one_and_update(
+            query, {"$set": {"status": "sending", "lease_until": now + lease}},
+            sort=[("next_at", ASCENDING)], return_document=ReturnDocument.AFTER
+        )
+        if not doc: break
+        claimed.append(doc)
+    return claimed
+
+@db_call(default=False)
+async def complete_outbox(nid):
+    await outbox_col.update_one({"_id": nid}, {"$set": {"status": "sent", "sent_at": datetime.now(timezone.utc)}, "$unset": {"lease_until": 1}})
+    return True
+
+@db_call(default=False)
+async def retry_outbox(nid, delay, error, dead=False):
+    await outbox_col.update_one({"_id": nid}, {
+        "$set": {"status": "dead" if dead else "pending", "next_at": time.time() + delay, "last_error": str(error)[:500]},
+        "$inc": {"attempts": 1},
+        "$unset": {"lease_until": 1}
+    })
+    return True
+
+class _StockShortage(Exception):
+    def __init__(self, failed):
+        super().__init__(failed)
+        self.failed = failed
+
+_transactions_supported = None
+
+# Checkout: zaxira + buyurtma bitta tranzaksiyada. Qaytaradi: (order_id, yetmagan pid lar)
+@db_call(default=(None, []))
+async def checkout_order(user_id, user_name, phone, cart, total_price, pay_method, delivery_type, location, comment, delivery_price=0, closest_base=None, notify=None):
+    global _transactions_supported
+    args = (user_id, user_name, phone, cart, total_price, pay_method, delivery_type, location, comment, delivery_price, closest_base)
     try:
-        order_id = str(int(time.time() * 1000))[-6:] 
-        order_data = {
-            "order_id": order_id,
-            "user_id": user_id,
-            "user_name": user_name,
-            "phone": str(phone),
-            "cart": cart,
-            "total_price": total_price,
-            "pay_method": pay_method,
-            "delivery_type": delivery_type,
-            "location": location,
-            "comment": comment,
-            "status": "new",
-            "created_at": time.time()
-        }
-        await orders_col.insert_one(order_data)
-        return order_id
-    except Exception as e:
-        logger.error(f"create_order xatosi: {e}")
-        return None
+        if _transactions_supported is not False:
+            order, touched = {}, {}
+            async def txn(session):
+                touched.clear()
+                failed = await reserve_stock(cart, session, touched)
+                if failed: raise _StockShortage(failed)
+                order.clear()
+                order.update(_build_order(*args))
+                if not await _insert_order(order, notify, session): raise RuntimeError("buyurtma yaratilmadi")
+                return order["order_id"]
+            try:
+                async with await client.start_session() as session:
+                    order_id = await session.with_transaction(txn)
+                _transactions_supported = True
+                # Bekor qilingan tranzaksiya omborni o'zgartirmaydi: kesh faqat commit dan keyin tozalanadi
+                _invalidate_reserved(touched)
+                # Statistika tranzaksiyadan tashqarida yoziladi: aks holda har bir checkout
+                # bitta "total" hujjatida yozish konfliktiga uchraydi
+                await _rollup_order(order)
+                return order_id, []
+            except OperationFailure as e:
+                # 20 = IllegalOperation: tranzaksiyalar faqat replica set / mongos da ishlaydi
+                if e.code != 20: raise
+                _transactions_supported = False
+                logger.warning("MongoDB tranzaksiyalarni qo'llamaydi, ketma-ket zaxiraga o'tildi")
+
+        # Ombor o'zgargan (keyin qaytarilgan bo'lsa ham) mahsulotlar keshi tozalanadi
+        touched = {}
+        try:
+            failed = await _reserve_stock_sequential(cart, touched)
+            if failed: raise _StockShortage(failed)
+            order_id = await create_order(*args, notify=notify)
+            if not order_id:
+                for pid, i in cart.items(): await _restock(pid, int(i['qty']))
+            return order_id, []
+        finally:
+            _invalidate_reserved(touched)
+    except _StockShortage as e:
+        return None, e.failed
 
+@db_call(retry=True)
 async def get_order_by_id(order_id):
-    try:
-        return await orders_col.find_one({"order_id": order_id})
-    except Exception as e:
-        logger.error(f"get_order_by_id xatosi: {e}")
-        return None
+    return await orders_col.find_one({"order_id": order_id})
 
+@db_call(default=False)
 async def update_order_status(order_id, new_status):
+    old = await orders_col.find_one_and_update(
+        {"order_id": order_id}, {"$set": {"status": new_status}}, projection=_ROLLUP_FIELDS
+    )
+    _invalidate_order_counts()
+    if old and old.get("status") != new_status: await _rollup_status(old, new_status)
+    return True
+
+@db_call(default=[], retry=True)
+async def get_orders_by_status(status):
+    return await orders_col.find({"status": status}).sort("created_at", -1).to_list(length=100)
+
+# Admin navbatlari: har bir holat bo'yicha soni (bitta $group) va _id bo'yicha keyset sahifalar
+_order_counts = None  # (loaded_at, {status: count})
+
+def _invalidate_order_counts():
+    global _order_counts
+    _order_counts = None
+
+@db_call(default={}, retry=True)
+async def get_order_counts():
+    global _order_counts
+    if _order_counts and time.monotonic() - _order_counts[0] < ORDER_COUNTS_TTL:
+        return _order_counts[1]
+    counts = {}
+    async for row in orders_col.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["n"]
+    _order_counts = (time.monotonic(), counts)
+    return counts
+
+@db_call(default=([], False, False), retry=True)
+async def get_orders_page(status, after=None, before=None, limit=20):
+    return await _page_by_id(orders_col, {"status": status}, {"order_id": 1, "total_price": 1}, after, before, limit)
+
+# Eksport uchun: kursor batch_size tadan o'qiydi, butun natija xotiraga yuklanmaydi.
+# Async generator bo'lgani uchun xatolar chaqiruvchiga o'tadi.
+async def iter_orders(query, batch_size=1000):
+    cursor = orders_col.find(query).sort("created_at", ASCENDING).batch_size(batch_size)
+    async for order in cursor:
+        yield order
+
+# =====================================================================
+# 2.1 SAVDO STATISTIKASI (ROLLUP)
+# =====================================================================
+# stats kolleksiyasi: "total", "day:2026-10-18", "week:2026-W42" (Asia/Bishkek vaqti).
+# Har bir hujjat: orders, revenue, delivery_revenue, status.<holat>,
+# base_orders.<baza>, base_revenue.<baza>. Mahsulot bo'yicha sotuvlar alohida hujjatlarda:
+# {"_id": "units:<davr>:<pid>", "period": <davr>, "pid": pid, "qty": n} — "total" hujjati
+# har bir sotilgan mahsulot bilan cheksiz o'smaydi, top-N period_qty indeksidan olinadi. Bekor qilingan (canceled) buyurtmalar
+# revenue/units/baza summalaridan chiqariladi. Buyurtma yaratilganda va holati
+# o'zgarganda $inc bilan yangilanadi; /stats faqat 3 ta hujjatni _id bo'yicha o'qiydi.
+
+STATS_TZ = pytz.timezone('Asia/Bishkek')
+_ROLLUP_FIELDS = {"status": 1, "created_at": 1, "total_price": 1, "delivery_price": 1, "closest_base": 1, "cart": 1}
+
+def stats_keys(ts):
+    local = datetime.fromtimestamp(ts, STATS_TZ)
+    year, week, _ = local.isocalendar()
+    return ["total", f"day:{local:%Y-%m-%d}", f"week:{year}-W{week:02d}"]
+
+# Maydon nomida "." va "$" bo'lishi mumkin emas
+def _field(name):
+    return str(name).replace(".", "·").replace("$", "")
+
+def _sales_inc(order, sign):
+    inc = {
+        "revenue": sign * int(order.get("total_price") or 0),
+        "delivery_revenue": sign * int(order.get("delivery_price") or 0),
+    }
+    for pid, item in (order.get("cart") or {}).items():
+        inc[f"units.{_field(pid)}"] = sign * int(item.get("qty", 0))
+    base = order.get("closest_base")
+    if base:
+        inc[f"base_orders.{_field(base)}"] = sign
+        inc[f"base_revenue.{_field(base)}"] = sign * int(order.get("delivery_price") or 0)
+    return inc
+
+def _stats_indexes():
+    return [IndexModel([("period", ASCENDING), ("qty", DESCENDING)], name="period_qty")]
+
+# _sales_inc dagi "units.<pid>" yo'llari alohida hujjatlarga ajratiladi
+def _rollup_ops(key, inc):
+    main, ops = {}, []
+    for path, v in inc.items():
+        if path.startswith("units."):
+            pid = path[len("units."):]
+            ops.append(UpdateOne({"_id": f"units:{key}:{pid}"}, {"$inc": {"qty": v}, "$setOnInsert": {"period": key, "pid": pid}}, upsert=True))
+        else:
+            main[path] = v
+    if main: ops.append(UpdateOne({"_id": key}, {"$inc": main}, upsert=True))
+    return ops
+
+# rebuild_stats ishlayotganda: [(buyurtma _id, yangi_buyurtmami, ops)] — swap dan keyin qo'llanadi
+_stats_journal = None
+_stats_rebuild_lock = asyncio.Lock()
+# Skan cutoff dan oldingi, lekin shu oraliqdagi buyurtmalarni id bo'yicha eslab qoladi:
+# ObjectId insert paytida olinadi, tranzaksiya esa keyinroq commit bo'lishi mumkin
+STATS_CUTOFF_LAG = 300
+
+async def _apply_rollup(order, inc, created=False):
+    ops = [op for k in stats_keys(order.get("created_at") or time.time()) for op in _rollup_ops(k, inc)]
+    if _stats_journal is not None:
+        _stats_journal.append((order.get("_id"), created, ops))
+        return
+    await stats_col.bulk_write(ops, ordered=False)
+
+async def _rollup_order(order):
     try:
-        await orders_col.update_one({"order_id": order_id}, {"$set": {"status": new_status}})
-        return True
+        inc = _sales_inc(order, 1)
+        inc["orders"] = 1
+        inc[f"status.{_field(order.get('status', 'new'))}"] = 1
+        await _apply_rollup(order, inc, created=True)
     except Exception as e:
-        logger.error(f"update_order_status xatosi: {e}")
-        return False
+        logger.error(f"_rollup_order xatosi: {e}")
 
-async def get_orders_by_status(status):
+# Holat o'zgarishi buyurtma yaratilgan kun/hafta hujjatlarida hisoblanadi
+async def _rollup_status(old, new_status):
     try:
-        return await orders_col.find({"status": status}).sort("created_at", -1).to_list(length=100)
+        old_status = old.get("status", "new")
+        inc = {f"status.{_field(old_status)}": -1, f"status.{_field(new_status)}": 1}
+        if new_status == "canceled" and old_status != "canceled":
+            inc.update(_sales_inc(old, -1))
+        elif old_status == "canceled":
+            inc.update(_sales_inc(old, 1))
+        await _apply_rollup(old, inc)
     except Exception as e:
-        logger.error(f"get_orders_by_status xatosi: {e}")
-        return []
+        logger.error(f"_rollup_status xatosi: {e}")
+
+# Qaytaradi: {kalit: hujjat}, hujjat["units"] = {pid: dona} — shu davrning top `top` mahsuloti
+@db_call(default={}, retry=True)
+async def get_stats(keys, top=15):
+    docs = await stats_col.find({"_id": {"$in": keys}}).to_list(length=len(keys))
+    by_key = {d["_id"]: d for d in docs}
+    for key, doc in by_key.items():
+        units = await stats_col.find({"period": key}, {"pid": 1, "qty": 1}).sort("qty", DESCENDING).limit(top).to_list(length=top)
+        doc["units"] = {u["pid"]: u["qty"] for u in units}
+    return by_key
+
+# Barcha buyurtmalardan qayta hisoblash (birinchi ishga tushirish yoki nomuvofiqlik bo'lsa).
+# Natija vaqtinchalik stats_rebuild kolleksiyasiga yoziladi va rename bilan bir zumda
+# almashtiriladi: /stats hech qachon bo'sh yoki yarim to'lgan statistikani ko'rmaydi.
+# Shu jarayondagi rollup lar qayta hisoblash davomida jurnalga yoziladi va swap dan keyin
+# yangi kolleksiyaga qo'llanadi; yaratilishi skanda hisoblangan buyurtmalar o'tkazib yuboriladi
+# (cutoff - STATS_CUTOFF_LAG dan keyingilar id bo'yicha tekshiriladi). Boshqa workerlarning shu oraliqdagi rollup lari eski kolleksiya bilan birga
+# yo'qoladi, skan paytida holati o'zgargan buyurtma esa ikki marta hisoblanishi mumkin —
+# buyruq kam yuklangan vaqtda ishlatiladi va kerak bo'lsa qayta chaqiriladi.
+@db_call()
+async def rebuild_stats():
+    global _stats_journal
+    async with _stats_rebuild_lock:
+        _stats_journal = []
+        cutoff = ObjectId()
+        lag_floor = ObjectId.from_datetime(cutoff.generation_time - timedelta(seconds=STATS_CUTOFF_LAG))
+        recent = None
+        try:
+            n, recent = await _rebuild_stats(cutoff, lag_floor)
+            return n
+        finally:
+            journal, _stats_journal = _stats_journal, None
+            for oid, created, ops in journal:
+                # Skan shu buyurtmani hisoblagan bo'lsa yaratilishi qayta qo'shilmaydi; skan o'tib
+                # ketgandan keyin commit bo'lgan (id si cutoff dan kichik) buyurtma esa qo'shiladi
+                if recent is not None and created and oid is not None and oid <= cutoff and (oid < lag_floor or oid in recent):
+                    continue
+                await stats_col.bulk_write(ops, ordered=False)
+
+async def _rebuild_stats(cutoff, lag_floor):
+    totals, units, recent = {}, {}, set()
+    n = 0
+    async for o in orders_col.find({"_id": {"$lte": cutoff}}, _ROLLUP_FIELDS).batch_size(1000):
+        if o["_id"] >= lag_floor: recent.add(o["_id"])
+        inc = {} if o.get("status") == "canceled" else _sales_inc(o, 1)
+        inc["orders"] = 1
+        inc[f"status.{_field(o.get('status', 'new'))}"] = 1
+        for key in stats_keys(o.get("created_at") or 0):
+            doc = totals.setdefault(key, {})
+            for path, v in inc.items():
+                if path.startswith("units."):
+                    unit = (key, path[len("units."):])
+                    units[unit] = units.get(unit, 0) + v
+                    continue
+                *parents, leaf = path.split(".")
+                target = doc
+                for part in parents: target = target.setdefault(part, {})
+                target[leaf] = target.get(leaf, 0) + v
+        n += 1
+    docs = [{"_id": k, **v} for k, v in totals.items()]
+    docs += [{"_id": f"units:{k}:{pid}", "period": k, "pid": pid, "qty": q} for (k, pid), q in units.items()]
+    if not docs:
+        await stats_col.delete_many({})
+    else:
+        tmp = db[f"{stats_col.name}_rebuild"]
+        await tmp.drop()
+        # rename indekslarni tmp dan oladi: top-N indeksi swap dan oldin yaratiladi
+        await tmp.create_indexes(_stats_indexes())
+        for i in range(0, len(docs), 1000):
+            await tmp.insert_many(docs[i:i + 1000])
+        await tmp.rename(stats_col.name, dropTarget=True)
+    logger.info(f"Statistika qayta hisoblandi: {n} ta buyurtma, {len(docs)} ta hujjat")
+    return n, recent
 
 # =====================================================================
 # 3. SAYT ELEMENTLARI (XIZMAT, LOKATSIYA, AKSIYA) - CRUD
 # =====================================================================
 
+@db_call(default=False)
 async def add_service(name, desc):
-    try:
-        await services_col.insert_one({"name": name, "description": desc, "icon": "fa-solid fa-helmet-safety"})
-        return True
-    except Exception as e:
-        logger.error(f"add_service xatosi: {e}")
-        return False
+    await services_col.insert_one({"name": name, "description": desc, "icon": "fa-solid fa-helmet-safety"})
+    return True
 
+@db_call(default=[], retry=True)
 async def get_all_services():
-    try:
-        return await services_col.find().to_list(length=100)
-    except: return []
+    return await services_col.find().to_list(length=100)
 
+@db_call(default=False)
 async def delete_service(sid):
-    try:
-        await services_col.delete_one({"_id": ObjectId(sid)})
-        return True
-    except: return False
+    await services_col.delete_one({"_id": ObjectId(sid)})
+    return True
 
+@db_call(default=False)
 async def add_location(name, address, lat, lon):
-    try:
-        map_link = f"https://yandex.com/maps/?pt={lon},{lat}&z=16&l=map"
-        await locations_col.insert_one({"name": name, "address": address, "lat": lat, "lon": lon, "map_link": map_link})
-        return True
-    except Exception as e:
-        logger.error(f"add_location xatosi: {e}")
-        return False
+    map_link = f"https://yandex.com/maps/?pt={lon},{lat}&z=16&l=map"
+    await locations_col.insert_one({"name": name, "address": address, "lat": lat, "lon": lon, "map_link": map_link})
+    return True
 
+@db_call(default=[], retry=True)
 async def get_all_locations():
-    try:
-        return await locations_col.find().to_list(length=100)
-    except: return []
+    return await locations_col.find().to_list(length=100)
 
+@db_call(default=False)
 async def delete_location(lid):
-    try:
-        await locations_col.delete_one({"_id": ObjectId(lid)})
-        return True
-    except: return False
+    await locations_col.delete_one({"_id": ObjectId(lid)})
+    return True
 
+@db_call(default=False)
 async def add_ad(title, text, discount):
-    try:
-        await ads_col.insert_one({"title": title, "text": text, "discount": int(discount), "active": True})
-        return True
-    except Exception as e:
-        logger.error(f"add_ad xatosi: {e}")
-        return False
+    await ads_col.insert_one({"title": title, "text": text, "discount": int(discount), "active": True})
+    return True
 
+@db_call(default=[], retry=True)
 async def get_all_ads():
-    try:
-        return await ads_col.find().to_list(length=50)
-    except: return []
+    return await ads_col.find().to_list(length=50)
 
+@db_call(default=False)
 async def delete_ad(aid):
-    try:
-        await ads_col.delete_one({"_id": ObjectId(aid)})
-        return True
-    except: return False
+    await ads_col.delete_one({"_id": ObjectId(aid)})
+    return True
+
+# kind: "srv" | "loc" | "ad" | "base"; qaytariladigan hujjatlarda faqat _id va "name"
+@db_call(default=([], False, False), retry=True)
+async def get_elements_brief(kind, after=None, before=None, limit=20):
+    col, field = {
+        "srv": (services_col, "name"),
+        "loc": (locations_col, "name"),
+        "ad": (ads_col, "title"),
+        "base": (bases_col, "name"),
+    }[kind]
+    docs, has_prev, has_next = await _page_by_id(col, {}, {field: 1}, after, before, limit)
+    return [{"_id": d["_id"], "name": d.get(field, "")} for d in docs], has_prev, has_next
 
 # =====================================================================
 # 4. SOZLAMALAR (INFO, LOGO, SOCIALS, TRAILER)
 # =====================================================================
+# Barcha sozlamalar bitta $in so'rovi bilan o'qiladi va xotirada saqlanadi.
+# set_* funksiyalari versiyani oshiradi; boshqa replikalardagi o'zgarishlar
+# SETTINGS_CACHE_TTL dan keyin ko'rinadi.
+_SETTINGS_TYPES = ["info", "socials", "logo", "trailer"]
+_settings_version = 0
+_settings_snapshot = None  # (version, loaded_at, {type: doc})
 
+def _invalidate_settings():
+    global _settings_version
+    _settings_version += 1
+
+@db_call(default={}, retry=True, stale=lambda: _settings_snapshot[2] if _settings_snapshot else None)
+async def get_settings_snapshot():
+    global _settings_snapshot
+    snap = _settings_snapshot
+    if snap and snap[0] == _settings_version and time.monotonic() - snap[1] < SETTINGS_CACHE_TTL:
+        return snap[2]
+    version = _settings_version
+    docs = await settings_col.find({"type": {"$in": _SETTINGS_TYPES}}).to_list(length=len(_SETTINGS_TYPES))
+    by_type = {d["type"]: d for d in docs}
+    # O'qish paytida set_* chaqirilgan bo'lsa, eskirgan natijani keshlamaymiz
+    if version == _settings_version:
+        _settings_snapshot = (version, time.monotonic(), by_type)
+    return by_type
+
+@db_call(default=False)
 async def set_shop_info(address, phone, about):
-    try:
-        await settings_col.update_one(
-            {"type": "info"}, 
-            {"$set": {"address": address, "phone": str(phone), "about": about}}, 
-            upsert=True
-        )
-        return True
-    except Exception as e:
-        logger.error(f"set_shop_info xatosi: {e}")
-        return False
+    await settings_col.update_one(
+        {"type": "info"}, 
+        {"$set": {"address": address, "phone": str(phone), "about": about}}, 
+        upsert=True
+    )
+    _invalidate_settings()
+    return True
 
+@db_call(default={"address": "Xato", "phone": "Xato", "about": "Xato"}, retry=True)
 async def get_shop_info():
-    try:
-        info = await settings_col.find_one({"type": "info"})
-        if not info:
-            return {"address": "Киритилмаган", "phone": "Йўқ", "about": "Йўқ"}
-        return info
-    except Exception as e:
-        logger.error(f"get_shop_info xatosi: {e}")
-        return {"address": "Xato", "phone": "Xato", "about": "Xato"}
+    info = (await get_settings_snapshot()).get("info")
+    if not info:
+        return {"address": "Киритилмаган", "phone": "Йўқ", "about": "Йўқ"}
+    return info
 
+@db_call(default=False)
 async def set_social_links(tg, ig, wa, ch):
-    try:
-        await settings_col.update_one(
-            {"type": "socials"}, 
-            {"$set": {"telegram": tg, "instagram": ig, "whatsapp": wa, "channel": ch}}, 
-            upsert=True
-        )
-        return True
-    except Exception as e:
-        logger.error(f"set_social_links xatosi: {e}")
-        return False
+    await settings_col.update_one(
+        {"type": "socials"}, 
+        {"$set": {"telegram": tg, "instagram": ig, "whatsapp": wa, "channel": ch}}, 
+        upsert=True
+    )
+    _invalidate_settings()
+    return True
 
+@db_call(default=False)
 async def set_logo(file_id):
-    try:
-        await settings_col.update_one({"type": "logo"}, {"$set": {"file_id": file_id}}, upsert=True)
-        return True
-    except Exception as e:
-        logger.error(f"set_logo xatosi: {e}")
-        return False
+    await settings_col.update_one({"type": "logo"}, {"$set": {"file_id": file_id}}, upsert=True)
+    _invalidate_settings()
+    return True
 
+@db_call(default=False)
 async def set_trailer(file_id):
-    try:
-        await settings_col.update_one(
-            {"type": "trailer"}, 
-            {"$set": {"trailer_id": file_id}}, 
-            upsert=True
-        )
-        return True
-    except Exception as e:
-        logger.error(f"set_trailer xatosi: {e}")
-        return False
+    await settings_col.update_one(
+        {"type": "trailer"}, 
+        {"$set": {"trailer_id": file_id}}, 
+        upsert=True
+    )
+    _invalidate_settings()
+    return True
 
 # =====================================================================
 # 5. INTEGRATSIYA (COMBINED INFO)
 # =====================================================================
 
+@db_call(default={}, retry=True)
 async def get_combined_info():
-    try:
-        info = await settings_col.find_one({"type": "info"}) or {}
-        socials = await settings_col.find_one({"type": "socials"}) or {}
-        logo = await settings_col.find_one({"type": "logo"}) or {}
-        trailer = await settings_col.find_one({"type": "trailer"}) or {}
-        
-        return {
-            "address": info.get("address", "Манзил киритилмаган"),
-            "phone": info.get("phone", "Телефон киритилмаган"),
-            "about": info.get("about", "SSS Online Shop"),
-            "telegram_bot": socials.get("telegram", "#"),
-            "telegram_channel": socials.get("channel", "#"),
-            "instagram": socials.get("instagram", "#"),
-            "whatsapp": socials.get("whatsapp", "#"),
-            "logo_id": logo.get("file_id"),
-            "trailer_id": trailer.get("trailer_id") 
-        }
-    except Exception as e:
-        logger.error(f"get_combined_info xatosi: {e}")
-        return {}
+    snap = await get_settings_snapshot()
+    info = snap.get("info") or {}
+    socials = snap.get("socials") or {}
+    logo = snap.get("logo") or {}
+    trailer = snap.get("trailer") or {}
+
+    return {
+        "address": info.get("address", "Манзил киритилмаган"),
+        "phone": info.get("phone", "Телефон киритилмаган"),
+        "about": info.get("about", "SSS Online Shop"),
+        "telegram_bot": socials.get("telegram", "#"),
+        "telegram_channel": socials.get("channel", "#"),
+        "instagram": socials.get("instagram", "#"),
+        "whatsapp": socials.get("whatsapp", "#"),
+        "logo_id": logo.get("file_id"),
+        "trailer_id": trailer.get("trailer_id") 
+    }
 
 # =====================================================================
 # 6. БАЗАЛАР (ЙЎЛ КИРА ҲИСОБЛАШ НУҚТАЛАРИ УЧУН)
 # =====================================================================
 
-async def add_base(name, lat, lon):
+def calculate_distance(lat1, lon1, lat2, lon2):
+    R = 6371.0
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+# Xotiradagi k-d daraxt: nuqtalar birlik sferadagi 3D vektorlarga aylantiriladi,
+# shunda vatar (chord) masofasi bo'yicha eng yaqin nuqta sfera bo'yicha ham eng yaqin.
+def _to_xyz(lat, lon):
+    la, lo = math.radians(lat), math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+class BaseIndex:
+    def __init__(self, bases):
+        self.size = len(bases)
+        self.root = self._build([(_to_xyz(b['lat'], b['lon']), b) for b in bases], 0)
+
+    def _build(self, points, axis):
+        if not points: return None
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        nxt = (axis + 1) % 3
+        return (points[mid], axis, self._build(points[:mid], nxt), self._build(points[mid + 1:], nxt))
+
+    def nearest(self, lat, lon):
+        q = _to_xyz(lat, lon)
+        best, best_d = None, float('inf')
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None: continue
+            (xyz, base), axis, left, right = node
+            d = (xyz[0] - q[0])**2 + (xyz[1] - q[1])**2 + (xyz[2] - q[2])**2
+            if d < best_d: best, best_d = base, d
+            diff = q[axis] - xyz[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Uzoq shoxni faqat ajratuvchi tekislik joriy eng yaxshi masofadan yaqin bo'lsa tekshiramiz
+            if diff * diff < best_d: stack.append(far)
+            stack.append(near)
+        return best
+
+# Har bir worker o'z daraxtini saqlaydi. add_base/delete_base counters dagi "bases_version"
+# ni oshiradi; boshqa workerlar uni BASE_INDEX_CHECK_INTERVAL da bir marta (_id bo'yicha
+# bitta so'rov) tekshirib, o'zgargan bo'lsa daraxtni qayta quradi.
+_base_index = None  # (version, checked_at, BaseIndex)
+
+def _invalidate_bases():
+    global _base_index
+    _base_index = None
+
+async def _bases_version():
+    doc = await counters_col.find_one({"_id": "bases_version"}, {"seq": 1})
+    return doc.get("seq", 0) if doc else 0
+
+async def _bump_bases_version():
+    await counters_col.update_one({"_id": "bases_version"}, {"$inc": {"seq": 1}}, upsert=True)
+    _invalidate_bases()
+
+async def _get_base_index():
+    global _base_index
+    cached = _base_index
+    now = time.monotonic()
+    if cached and now - cached[1] < BASE_INDEX_CHECK_INTERVAL: return cached[2]
+    version = await _bases_version()
+    if cached and cached[0] == version:
+        _base_index = (version, now, cached[2])
+        return cached[2]
+    bases = await bases_col.find({}, {"name": 1, "lat": 1, "lon": 1}).to_list(length=None)
+    index = BaseIndex(bases)
+    _base_index = (version, now, index)
+    return index
+
+# Ishga tushishda xotiradagi bazalar indeksini oldindan qurish
+@db_call(default=0, retry=True)
+async def load_base_index():
+    return (await _get_base_index()).size
+
+async def _nearest_base_geo(lat, lon, max_km=None):
+    geo_near = {"near": {"type": "Point", "coordinates": [lon, lat]}, "distanceField": "dist_m", "spherical": True, "key": "loc"}
+    if max_km is not None: geo_near["maxDistance"] = max_km * 1000
+    docs = await bases_col.aggregate([{"$geoNear": geo_near}, {"$limit": 1}]).to_list(length=1)
+    return docs[0] if docs else None
+
+async def _nearest_base_memory(lat, lon):
+    return (await _get_base_index()).nearest(lat, lon)
+
+# Eng yaqin baza: (base, masofa_km) yoki (None, None).
+# Asosiy yo'l — $geoNear (2dsphere indeks), xato bo'lsa xotiradagi k-d daraxt.
+@db_call(default=(None, None), retry=True)
+async def nearest_base(lat, lon, max_km=None):
+    base = None
     try:
-        await bases_col.insert_one({"name": name, "lat": lat, "lon": lon})
-        return True
+        if NEAREST_BASE_MODE == "memory":
+            base = await _nearest_base_memory(lat, lon)
+        else:
+            base = await _nearest_base_geo(lat, lon, max_km)
     except Exception as e:
-        logger.error(f"add_base xatosi: {e}")
-        return False
+        logger.warning(f"nearest_base: $geoNear ishlamadi, xotiradagi indeksga o'tildi: {e}")
+        try:
+            base = await _nearest_base_memory(lat, lon)
+        except Exception as e:
+            # Baza ishlamayapti: "baza topilmadi" deb javob bermaslik uchun xato db_call ga o'tadi
+            if is_transient(e): raise
+            logger.error(f"nearest_base xatosi: {e}")
+    if not base: return None, None
+    dist = calculate_distance(base['lat'], base['lon'], lat, lon)
+    if max_km is not None and dist > max_km: return None, None
+    return base, dist
 
+@db_call(default=False)
+async def add_base(name, lat, lon):
+    await bases_col.insert_one({"name": name, "lat": lat, "lon": lon, "loc": {"type": "Point", "coordinates": [lon, lat]}})
+    await _bump_bases_version()
+    return True
+
+@db_call(default=[], retry=True)
 async def get_all_bases():
+    return await bases_col.find().to_list(length=100)
+
+@db_call(default=False)
+async def delete_base(bid):
+    await bases_col.delete_one({"_id": ObjectId(bid)})
+    await _bump_bases_version()
+    return True
+
+# =====================================================================
+# 7. INDEKSLAR (ISHGA TUSHISHDA YARATILADI)
+# =====================================================================
+
+def _index_specs():
+    return {
+        products_col: [
+            # {"stock": {"$gt": 0}, "category": ...} + sort created_at (ESR tartibi)
+            IndexModel([("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING), ("stock", ASCENDING)], name="category_created_stock"),
+            # distinct("category", {"stock": {"$gt": 0}})
+            IndexModel([("category", ASCENDING), ("stock", ASCENDING)], name="category_stock"),
+            # Import: artikul bo'yicha upsert (eski bazalarda takror artikullar bo'lishi mumkin — unique emas)
+            IndexModel([("article", ASCENDING)], name="article"),
+        ],
+        # order_id_unique bu yerda emas: _ensure_order_id_unique (takrorlar tozalangandan keyin)
+        orders_col: [
+            IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created"),
+            # Admin navbati: {"status": ...} + sort _id (keyset)
+            IndexModel([("status", ASCENDING), ("_id", DESCENDING)], name="status_id"),
+            # Eksport: sana oralig'i bo'yicha (holatsiz)
+            IndexModel([("created_at", ASCENDING)], name="created_at"),
+        ],
+        settings_col: [
+            IndexModel([("type", ASCENDING)], name="type_unique", unique=True),
+        ],
+        outbox_col: [
+            IndexModel([("status", ASCENDING), ("next_at", ASCENDING)], name="status_next_at"),
+            # Yuborilgan bildirishnomalar bir haftadan keyin o'chadi
+            IndexModel([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=7 * 24 * 3600),
+        ],
+        bases_col: [
+            IndexModel([("loc", "2dsphere")], name="loc_2dsphere"),
+        ],
+        categories_col: [
+            IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+        ],
+        stats_col: _stats_indexes(),
+        fsm_col: [
+            # Tashlab ketilgan savat/checkout sessiyalari FSM_SESSION_TTL dan keyin o'chadi
+            IndexModel([("updated_at", ASCENDING)], name="updated_at_ttl", expireAfterSeconds=FSM_SESSION_TTL),
+        ],
+    }
+
+def _hot_queries():
+    return [
+        ("products: category sahifasi", products_col.find({"stock": {"$gt": 0}, "category": ""}).sort("created_at", -1).limit(6)),
+        ("orders: order_id", orders_col.find({"order_id": ""}).limit(1)),
+        ("orders: status", orders_col.find({"status": "new"}).sort("created_at", -1).limit(100)),
+        ("orders: status sahifasi", orders_col.find({"status": "new"}).sort("_id", -1).limit(21)),
+        ("settings: type", settings_col.find({"type": "info"}).limit(1)),
+        ("categories: menyu", categories_col.find({"count": {"$gt": 0}}).sort("name", ASCENDING)),
+    ]
+
+# Eski bazalarda faqat lat/lon bor: GeoJSON maydonini qo'shamiz
+async def _migrate_bases():
     try:
-        return await bases_col.find().to_list(length=100)
+        await bases_col.update_many(
+            {"loc": {"$exists": False}, "lat": {"$exists": True}, "lon": {"$exists": True}},
+            [{"$set": {"loc": {"type": "Point", "coordinates": ["$lon", "$lat"]}}}]
+        )
     except Exception as e:
-        logger.error(f"get_all_bases xatosi: {e}")
-        return []
+        logger.error(f"_migrate_bases xatosi: {e}")
 
-async def delete_base(bid):
+# Eski rollup lar mahsulot sotuvlarini "units" maydonida saqlagan: alohida hujjatlarga o'tkaziladi
+async def _migrate_stats():
+    try:
+        if await stats_col.find_one({"units": {"$exists": True}}, {"_id": 1}):
+            await rebuild_stats()
+    except Exception as e:
+        logger.error(f"_migrate_stats xatosi: {e}")
+
+# Reestr hali yo'q (yangilangan eski baza): mahsulotlardan bir marta quriladi
+async def _migrate_categories():
+    try:
+        if not await categories_col.find_one({}, {"_id": 1}) and await products_col.find_one({}, {"_id": 1}):
+            await rebuild_categories()
+    except Exception as e:
+        logger.error(f"_migrate_categories xatosi: {e}")
+
+# Eski bazalarda bir xil order_id li (yoki order_id siz) buyurtmalar bo'lishi mumkin:
+# eng birinchisi o'z raqamini saqlaydi, qolganlariga yangi raqam beriladi, eskisi legacy_order_id da qoladi
+async def _dedupe_order_ids():
+    pipeline = [
+        {"$group": {"_id": "$order_id", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}}
+    ]
+    fixed = 0
+    async for group in orders_col.aggregate(pipeline, allowDiskUse=True):
+        for oid in sorted(group["ids"])[1:]:
+            # Hisoblagich eski raqamlardan orqada bo'lishi mumkin: band raqamlar o'tkazib yuboriladi
+            new_id = await allocate_order_id()
+            while await orders_col.find_one({"order_id": new_id}, {"_id": 1}):
+                new_id = await allocate_order_id()
+            await orders_col.update_one({"_id": oid}, {"$set": {"order_id": new_id, "legacy_order_id": group["_id"]}})
+            logger.warning(f"Takror order_id {group['_id']!r}: buyurtma {oid} -> {new_id}")
+            fixed += 1
+    return fixed
+
+# Unique indeks alohida yaratiladi: u muvaffaqiyatsiz bo'lsa ham status/sana indekslari turadi.
+# Takrorlar tozalangandan keyin ham yaratilmasa — ishga tushish to'xtaydi (faqat log emas).
+async def _ensure_order_id_unique():
+    # Indeks bor — takrorlar bo'lishi mumkin emas: butun kolleksiya bo'yicha $group shart emas
+    if "order_id_unique" in await orders_col.index_information(): return
+    await _dedupe_order_ids()
     try:
-        await bases_col.delete_one({"_id": ObjectId(bid)})
-        return True
+        await orders_col.create_index([("order_id", ASCENDING)], name="order_id_unique", unique=True)
     except Exception as e:
-        logger.error(f"delete_base xatosi: {e}")
-        return False
+        logger.critical(f"order_id_unique indeksi yaratilmadi: {e}")
+        raise
+
+@db_timed
+async def ensure_indexes():
+    await _migrate_bases()
+    for col, models in _index_specs().items():
+        try:
+            await col.create_indexes(models)
+        except Exception as e:
+            logger.error(f"ensure_indexes xatosi ({col.name}): {e}")
+    await _ensure_order_id_unique()
+    await _migrate_categories()
+    await _migrate_stats()
+    await verify_indexes()
+
+@db_timed
+async def verify_indexes():
+    ok = True
+    for label, cursor in _hot_queries():
+        try:
+            plan = await cursor.explain()
+            if "COLLSCAN" in str(plan.get("queryPlanner", {}).get("winningPlan", {})):
+                ok = False
+                logger.warning(f"Indeks ishlatilmayapti (COLLSCAN): {label}")
+        except Exception as e:
+            logger.error(f"verify_indexes xatosi ({label}): {e}")
+    if ok: logger.info("Barcha asosiy so'rovlar indeksdan foydalanmoqda.")
+    return ok
@@ -0,0 +1,97 @@
+import asyncio
+import csv
+import gzip
+import logging
+from datetime import datetime, timedelta
+from database import iter_orders, STATS_TZ
+
+# =====================================================================
+# BUYURTMALAR EKSPORTI (BUXGALTERIYA UCHUN CSV.GZ)
+# =====================================================================
+# Buyurtmalar motor kursori orqali partiyalab o'qiladi va har bir savat qatori
+# alohida CSV qatori sifatida darhol gzip faylga yoziladi: xotira hajmi buyurtmalar
+# soniga bog'liq emas. Siqish va diskka yozish event loop ni to'smasligi uchun har bir
+# partiya asyncio.to_thread da yoziladi.
+
+logger = logging.getLogger("SSS_Export")
+
+BATCH_SIZE = 1000
+
+COLUMNS = [
+    "order_id", "created_at", "status", "user_id", "user_name", "phone", "pay_method", "delivery_type",
+    "location", "total_price", "delivery_price", "closest_base", "paid", "check_file_id",
+    "product_id", "product_name", "price", "qty", "line_total"
+]
+
+# finish_order yozadigan izoh: "Тўланди: 250 сом | Йўл: 300 | База: ... | Чек: <file_id>"
+_COMMENT_FIELDS = {"Тўланди": "paid", "Йўл": "delivery_price", "База": "closest_base", "Чек": "check_file_id"}
+
+
+# Mijoz kiritgan matn (ism, telefon, manzil) "=", "+", "-", "@" bilan boshlansa Excel uni formula
+# sifatida bajaradi (CSV injection): oldiga ' qo'yiladi va katak matn bo'lib qoladi
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def safe_cell(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES): return "'" + value
+    return value
+
+
+def parse_comment(comment):
+    parsed = {}
+    for part in str(comment or "").split("|"):
+        key, sep, value = part.partition(":")
+        field = _COMMENT_FIELDS.get(key.strip())
+        if sep and field: parsed[field] = value.strip().removesuffix(" сом")
+    return parsed
+
+
+def build_query(date_from=None, date_to=None, status=None):
+    query = {}
+    if status: query["status"] = status
+    created = {}
+    # Sanalar do'kon vaqti bo'yicha: date_to kuni ham to'liq kiradi
+    if date_from: created["$gte"] = STATS_TZ.localize(datetime.combine(date_from, datetime.min.time())).timestamp()
+    if date_to: created["$lt"] = STATS_TZ.localize(datetime.combine(date_to + timedelta(days=1), datetime.min.time())).timestamp()
+    if created: query["created_at"] = created
+    return query
+
+
+def order_rows(o):
+    comment = parse_comment(o.get("comment"))
+    created = datetime.fromtimestamp(o["created_at"], STATS_TZ).strftime("%Y-%m-%d %H:%M:%S") if o.get("created_at") else ""
+    head = [
+        o.get("order_id"), created, o.get("status"), o.get("user_id"), safe_cell(o.get("user_name")), safe_cell(o.get("phone")),
+        o.get("pay_method"), o.get("delivery_type"), safe_cell(o.get("location")), o.get("total_price"),
+        o.get("delivery_price", comment.get("delivery_price")), o.get("closest_base") or comment.get("closest_base"),
+        comment.get("paid"), comment.get("check_file_id")
+    ]
+    cart = o.get("cart") or {}
+    if not cart:
+        yield head + [None] * 5
+    for pid, item in cart.items():
+        qty, price = item.get("qty", 0), item.get("price", 0)
+        yield head + [pid, item.get("name"), price, qty, price * qty]
+
+
+# Qaytaradi: (buyurtmalar soni, CSV qatorlar soni)
+async def write_orders_csv(path, query):
+    orders = rows = 0
+    # utf-8-sig: Excel kirill harflarini to'g'ri ochadi
+    f = await asyncio.to_thread(gzip.open, path, "wt", encoding="utf-8-sig", newline="")
+    try:
+        writer = csv.writer(f)
+        batch = [COLUMNS]
+        async for o in iter_orders(query, batch_size=BATCH_SIZE):
+            for row in order_rows(o):
+                batch.append(row)
+                rows += 1
+            orders += 1
+            if len(batch) >= BATCH_SIZE:
+                await asyncio.to_thread(writer.writerows, batch)
+                batch = []
+        if batch: await asyncio.to_thread(writer.writerows, batch)
+    finally:
+        await asyncio.to_thread(f.close)
+    logger.info(f"Eksport: {orders} ta buyurtma, {rows} ta qator")
+    return orders, rows
@@ -0,0 +1,163 @@
+import asyncio
+import csv
+import logging
+import os
+from itertools import islice
+from database import bulk_upsert_products, clear_catalog_cache, load_search_index, rebuild_categories
+
+# =====================================================================
+# KATALOG IMPORTI: CSV / XLSX DAN MAHSULOT VA OMBOR
+# =====================================================================
+# Fayl qatorma-qator o'qiladi (XLSX — openpyxl read_only), BATCH_SIZE qator
+# tekshirilib, bitta bulk_write bilan artikul bo'yicha upsert qilinadi.
+# Ustunlar (birinchi qator sarlavha, tartib ixtiyoriy):
+#   article*, stock*, name, price, category
+# name/price/category bo'lsa — yangi mahsulot yaratiladi yoki yangilanadi,
+# bo'lmasa — faqat mavjud mahsulot ombori yangilanadi.
+
+logger = logging.getLogger("SSS_Import")
+
+BATCH_SIZE = 1000
+MAX_ERRORS = 1000
+
+# Sarlavha variantlari (kichik harfda)
+_HEADERS = {
+    "article": ("article", "артикул", "artikul", "sku"),
+    "name": ("name", "название", "наименование", "аталышы", "номи", "nomi"),
+    "price": ("price", "цена", "баасы", "нархи", "narx"),
+    "stock": ("stock", "остаток", "склад", "количество", "калдык", "омбор", "ombor"),
+    "category": ("category", "категория", "kategoriya"),
+}
+_FULL = ("name", "price", "category")
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []  # (qator raqami, xabar)
+
+    def error(self, row_no, msg):
+        if len(self.errors) < MAX_ERRORS: self.errors.append((row_no, msg))
+
+
+def _map_header(header):
+    mapping = {}
+    for i, title in enumerate(header):
+        title = str(title or "").strip().lower()
+        for field, aliases in _HEADERS.items():
+            if title in aliases and field not in mapping: mapping[field] = i
+    missing = [f for f in ("article", "stock") if f not in mapping]
+    if missing: raise ValueError(f"Сарлавҳада устун йўқ: {', '.join(missing)}")
+    return mapping
+
+
+def _cell(row, i):
+    if i is None or i >= len(row) or row[i] is None: return ""
+    value = row[i]
+    # XLSX: 1234.0 -> "1234"
+    if isinstance(value, float) and value.is_integer(): value = int(value)
+    return str(value).strip()
+
+
+def _int(text, field):
+    try:
+        value = int(float(text.replace(" ", "").replace(",", ".")))
+    except ValueError:
+        raise ValueError(f"{field}: сон эмас ({text!r})")
+    if value < 0: raise ValueError(f"{field}: манфий сон")
+    return value
+
+
+def parse_row(row, mapping):
+    values = {f: _cell(row, i) for f, i in mapping.items()}
+    if not values["article"]: raise ValueError("артикул бўш")
+    doc = {"article": values["article"], "stock": _int(values["stock"], "stock")}
+    given = [f for f in _FULL if values.get(f)]
+    if given and len(given) < len(_FULL):
+        raise ValueError(f"янги маҳсулот учун {', '.join(f for f in _FULL if f not in given)} керак")
+    if given:
+        doc["name"] = values["name"]
+        doc["price"] = _int(values["price"], "price")
+        doc["category"] = values["category"]
+    return doc
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(f, dialect)
+
+
+def _read_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("XLSX учун openpyxl ўрнатилмаган, CSV юборинг")
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def read_rows(path):
+    if os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm"):
+        return _read_xlsx(path)
+    return _read_csv(path)
+
+
+def _next_batch(rows, mapping, result, start):
+    batch, count = {}, 0
+    for row_no, row in enumerate(islice(rows, BATCH_SIZE), start):
+        count += 1
+        if not any(_cell(row, i) for i in range(len(row))): continue
+        try:
+            doc = parse_row(row, mapping)
+        except ValueError as e:
+            result.error(row_no, str(e))
+            continue
+        # Bir partiyada takror artikul: oxirgi qator yutadi
+        batch[doc["article"]] = (row_no, doc)
+    result.rows += count
+    return batch, count
+
+
+async def import_products(path):
+    result = ImportResult()
+    rows = read_rows(path)
+    try:
+        # Fayl o'qish/tekshirish CPU ishi: event loop ni band qilmaslik uchun threadda
+        header = await asyncio.to_thread(next, rows, None)
+        if header is None: raise ValueError("Файл бўш")
+        mapping = _map_header(header)
+        row_no = 2
+        while True:
+            batch, count = await asyncio.to_thread(_next_batch, rows, mapping, result, row_no)
+            if not count: break
+            row_no += count
+            if not batch: continue
+            try:
+                inserted, updated, missing = await bulk_upsert_products([doc for _, doc in batch.values()])
+            except Exception as e:
+                logger.error(f"import_products xatosi: {e}")
+                for n, _ in batch.values(): result.error(n, "базага ёзилмади")
+                continue
+            result.inserted += inserted
+            result.updated += updated
+            missing = set(missing)
+            for n, doc in batch.values():
+                if doc["article"] in missing: result.error(n, f"артикул {doc['article']} топилмади")
+    finally:
+        rows.close()
+        # Ombor va kategoriyalar ommaviy o'zgardi: reestr count lari qayta hisoblanadi
+        await rebuild_categories()
+        clear_catalog_cache()
+        await load_search_index()
+    return result
@@ -0,0 +1,203 @@
+import bisect
+import contextvars
+import functools
+import logging
+import time
+from aiohttp import web
+from aiogram import BaseMiddleware
+from pymongo import monitoring
+
+# =====================================================================
+# METRIKALAR (PROMETHEUS TEXT FORMAT, /metrics)
+# =====================================================================
+# Handler kechikishlari (handler + FSM holati bo'yicha), xatolar, database.py
+# funksiyalari va ular yuborgan MongoDB buyruqlari. Har bir jarayon o'z
+# metrikalarini beradi (webhook workerlari alohida scrape qilinadi).
+
+logger = logging.getLogger("SSS_Metrics")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra: pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, doc, labelnames=()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket_counts, sum, count]
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        item = self._values.get(labels)
+        if item is None:
+            item = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets): item[0][i] += 1
+        item[1] += value
+        item[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = _labels(self.labelnames, labels, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{le} {cumulative}"
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{le} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+# Scrape paytida o'qiladigan qiymatlar (kesh, navbat uzunligi va h.k.)
+class Gauge:
+    def __init__(self, name, doc, fn):
+        self.name, self.doc, self.fn = name, doc, fn
+        _registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} gauge"
+        try:
+            yield f"{self.name} {float(self.fn())}"
+        except Exception as e:
+            logger.warning(f"{self.name} gauge xatosi: {e}")
+
+
+_gauges = {}
+
+
+# Takroriy ro'yxatga olish (create_bot/create_dispatcher qayta chaqirilsa) yangi kolleksiya
+# qo'shmaydi: mavjud gauge oxirgi berilgan obyektdan o'qiydigan bo'ladi.
+def gauge(name, doc, fn):
+    g = _gauges.get(name)
+    if g is None:
+        g = _gauges[name] = Gauge(name, doc, fn)
+    else:
+        g.fn = fn
+    return g
+
+
+def gauges(prefix, doc, stats_fn, keys):
+    for key in keys:
+        gauge(f"{prefix}_{key}", f"{doc}: {key}", lambda key=key: stats_fn()[key])
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Handler bajarilish vaqti", ("event", "handler", "state"))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handler ichida ko'tarilgan xatolar", ("event", "handler"))
+DB_CALL_LATENCY = Histogram("db_call_seconds", "database.py funksiyalari bajarilish vaqti", ("function",))
+MONGO_COMMANDS = Counter("mongo_commands_total", "MongoDB buyruqlari (round-trip) soni", ("function", "command"))
+MONGO_COMMAND_FAILURES = Counter("mongo_command_failures_total", "Muvaffaqiyatsiz MongoDB buyruqlari", ("function", "command"))
+MONGO_COMMAND_LATENCY = Histogram("mongo_command_seconds", "MongoDB buyruqlari kechikishi", ("function",))
+
+# =====================================================================
+# DATABASE.PY FUNKSIYALARI VA MONGO BUYRUQLARI
+# =====================================================================
+
+_db_function = contextvars.ContextVar("db_function", default="-")
+
+
+def db_timed(fn):
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = _db_function.set(name)
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            DB_CALL_LATENCY.observe(time.perf_counter() - start, name)
+            _db_function.reset(token)
+    return wrapper
+
+
+# motor buyruqlarni executor ichida contextvars nusxasi bilan bajaradi,
+# shuning uchun bu yerda chaqirgan database.py funksiyasining nomi ko'rinadi.
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        MONGO_COMMANDS.inc(_db_function.get(), event.command_name)
+
+    def succeeded(self, event):
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, _db_function.get())
+
+    def failed(self, event):
+        MONGO_COMMAND_FAILURES.inc(_db_function.get(), event.command_name)
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, _db_function.get())
+
+# =====================================================================
+# HANDLER MIDDLEWARE
+# =====================================================================
+
+
+class MetricsMiddleware(BaseMiddleware):
+    def __init__(self, event_type):
+        self.event_type = event_type
+
+    async def __call__(self, handler, event, data):
+        handler_obj = data.get("handler")
+        name = getattr(getattr(handler_obj, "callback", None), "__name__", "unknown")
+        state = data.get("raw_state") or "-"
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(self.event_type, name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, self.event_type, name, state)
+
+# =====================================================================
+# HTTP ENDPOINT
+# =====================================================================
+
+
+async def handle_metrics(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(host, port):
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"/metrics http://{host}:{port}/metrics manzilida")
+    return runner
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import random
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from config import TG_CHAT_RATE
+from database import claim_outbox, complete_outbox, retry_outbox
+import ratelimit
+
+# =====================================================================
+# OUTBOX WORKER: ADMIN BILDIRISHNOMALARINI FONDA YUBORISH
+# =====================================================================
+# `concurrency` ta slot har biri bitta qatorni yuborishdan oldin band qiladi (claim_outbox(limit=1)).
+# Ko'p qatorni oldindan band qilish xavfli: bildirishnomalar bir necha admin chatiga boradi,
+# chat limiti ~TG_CHAT_RATE/s, 50 qatorlik partiya lease tugagunicha yuborilmay qolishi va boshqa
+# worker uni qayta band qilib, ikki marta yuborishi mumkin edi. Endi lease bitta yuborishni qoplaydi.
+
+logger = logging.getLogger("SSS_Outbox")
+
+MAX_ATTEMPTS = 8
+_wakeup = asyncio.Event()
+
+
+# Yangi buyurtmadan keyin chaqiriladi: worker keyingi pollni kutmasdan ishga tushadi
+def wake():
+    _wakeup.set()
+
+
+# Eng yomon holat: hamma slot bitta chatga navbatda (concurrency / chat_rate soniya), 3 barobar zaxira
+def lease_for(concurrency, chat_rate):
+    if chat_rate <= 0: return 60
+    return max(60, concurrency / chat_rate * 3)
+
+
+async def _deliver(bot, doc):
+    try:
+        # Ommaviy yuborish: mijozlarga javoblar navbatda oldinda turadi
+        with ratelimit.bulk():
+            await getattr(bot, doc["method"])(doc["chat_id"], **doc["kwargs"])
+    except TelegramRetryAfter as e:
+        await retry_outbox(doc["_id"], e.retry_after, e)
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
+        # Admin botni bloklagan yoki so'rov noto'g'ri: qayta urinish foydasiz
+        logger.error(f"Bildirishnoma {doc['_id']} yuborilmadi: {e}")
+        await retry_outbox(doc["_id"], 0, e, dead=True)
+    except Exception as e:
+        attempts = doc.get("attempts", 0) + 1
+        delay = min(300, 2 ** attempts) * random.uniform(0.5, 1.5)
+        logger.warning(f"Bildirishnoma {doc['_id']} xatosi ({attempts}-urinish): {e}")
+        await retry_outbox(doc["_id"], delay, e, dead=attempts >= MAX_ATTEMPTS)
+    else:
+        await complete_outbox(doc["_id"])
+
+
+async def _slot(bot, lease, poll_interval):
+    while True:
+        try:
+            batch = await claim_outbox(limit=1, lease=lease)
+            if batch:
+                await _deliver(bot, batch[0])
+                continue
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Outbox worker xatosi: {e}")
+            await asyncio.sleep(poll_interval)
+
+
+async def run_outbox_worker(bot, concurrency=8, poll_interval=2.0, chat_rate=TG_CHAT_RATE):
+    lease = lease_for(concurrency, chat_rate)
+    await asyncio.gather(*(_slot(bot, lease, poll_interval) for _ in range(concurrency)))
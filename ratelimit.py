@@ -0,0 +1,133 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+# =====================================================================
+# TELEGRAM API CHEKLOVLARI: TOKEN BUCKET + 429 (retry_after) NAZORATI
+# =====================================================================
+# Bot sessiyasiga middleware sifatida ulanadi: bot.session.middleware(RateLimiter())
+# Global (~30 xabar/s) va har bir chat uchun alohida chelak. Interaktiv javoblar
+# (handlerlar) navbatda ommaviy yuborishlardan (outbox) oldin turadi.
+# Chelaklar jarayon xotirasida: WEB_WORKERS ta worker bo'lsa global_rate ularga bo'lib
+# beriladi (bot.create_bot), aks holda jami N x 30/s bo'lardi.
+
+logger = logging.getLogger("SSS_RateLimit")
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+_priority = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+# Cheklanadigan metodlar: xabar yuborish/tahrirlash (DeleteMessage, ChatAction va h.k. emas)
+_LIMITED_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+
+
+# Fon vazifalari (outbox) shu blok ichida yuboradi
+@contextmanager
+def bulk():
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter(BaseRequestMiddleware):
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=5, group_rate=20 / 60, max_retries=3, max_chats=10000):
+        self.global_bucket = TokenBucket(global_rate, max(1, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+        self.waiting = {INTERACTIVE: 0, BULK: 0}
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.retry_after_total = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Manfiy chat_id — guruh/kanal: daqiqasiga ~20 xabar
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire(self, chat_id, priority):
+        chat = self._chat_bucket(chat_id)
+        start = time.monotonic()
+        self.waiting[priority] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                delay = max(chat.delay(now), self.global_bucket.delay(now))
+                if delay <= 0 and (priority == INTERACTIVE or not self.waiting[INTERACTIVE]):
+                    chat.take()
+                    self.global_bucket.take()
+                    break
+                await asyncio.sleep(delay if delay > 0 else 0.02)
+        finally:
+            self.waiting[priority] -= 1
+            waited = time.monotonic() - start
+            self.waits += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not type(method).__name__.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, _priority.get())
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after_total += 1
+                if attempt >= self.max_retries: raise
+                logger.warning(f"429: {type(method).__name__} chat={chat_id}, {e.retry_after}s kutamiz")
+                # Telegram butun botni cheklagan bo'lishi mumkin: boshqa chatlarga ham shu vaqt yuborilmaydi
+                until = time.monotonic() + e.retry_after
+                self._chat_bucket(chat_id).blocked_until = until
+                self.global_bucket.blocked_until = max(self.global_bucket.blocked_until, until)
+
+    def stats(self):
+        return {
+            "queue_interactive": self.waiting[INTERACTIVE],
+            "queue_bulk": self.waiting[BULK],
+            "waits": self.waits,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+            "retry_after_total": self.retry_after_total,
+            "tracked_chats": len(self._chats)
+        }
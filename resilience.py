@@ -0,0 +1,155 @@
+import asyncio
+import contextlib
+import copy
+import functools
+import logging
+import random
+import time
+from pymongo.errors import ConnectionFailure, PyMongoError
+from metrics import db_timed
+
+# =====================================================================
+# MONGODB BARQARORLIGI: QAYTA URINISH + CIRCUIT BREAKER
+# =====================================================================
+# database.py funksiyalari @db_call(...) bilan o'raladi:
+#   - oddiy xato (noto'g'ri so'rov, dublikat va h.k.) -> log + default qiymat (avvalgidek);
+#   - tarmoq/timeout xatosi -> retry=True bo'lsa jitterli backoff bilan qayta urinish;
+#   - ketma-ket `threshold` ta tarmoq xatosidan keyin breaker ochiladi: `reset_timeout`
+#     soniya davomida so'rovlar bazaga bormaydi, darhol stale(...) kesh qiymati yoki
+#     DatabaseUnavailable qaytariladi (bot uni dp.errors da foydalanuvchiga aytadi).
+
+logger = logging.getLogger("SSS_Resilience")
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+def is_transient(e):
+    if isinstance(e, ConnectionFailure): return True  # AutoReconnect, NetworkTimeout, ServerSelectionTimeoutError
+    return isinstance(e, PyMongoError) and (e.has_error_label("RetryableWriteError") or e.has_error_label("TransientTransactionError"))
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, reset_timeout=15):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.opened_total = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None: return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    # Ochiq holatda reset_timeout o'tgach bitta sinov so'roviga ruxsat beriladi
+    def allow(self):
+        state = self.state
+        if state == "closed": return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def success(self):
+        if self.opened_at is not None: logger.info("MongoDB yana ishlayapti, breaker yopildi")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+            self.opened_total += 1
+            logger.error(f"MongoDB javob bermayapti: breaker {self.reset_timeout}s ga ochildi")
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def stats(self):
+        return {
+            "open": int(self.state != "closed"),
+            "failures": self.failures,
+            "opened_total": self.opened_total
+        }
+
+
+breaker = CircuitBreaker()
+_retry = {"attempts": 2, "base_delay": 0.05}
+
+
+def configure(threshold, reset_timeout, retries, base_delay):
+    breaker.threshold, breaker.reset_timeout = threshold, reset_timeout
+    _retry["attempts"], _retry["base_delay"] = retries, base_delay
+
+
+def _unavailable(name, stale, args, kwargs, error):
+    if stale:
+        value = stale(*args, **kwargs)
+        if value is not None:
+            logger.warning(f"{name}: baza ishlamayapti, keshdagi eski qiymat qaytarildi")
+            return value
+    raise DatabaseUnavailable(f"{name}: {error or 'circuit breaker ochiq'}")
+
+
+# db_call dan tashqaridagi Mongo chaqiruvlari uchun (FSM storage): breaker ochiq bo'lsa darhol
+# DatabaseUnavailable, xato esa default qiymatga aylanmaydi — chaqiruvchiga ko'tariladi.
+@contextlib.asynccontextmanager
+async def guarded(name):
+    if not breaker.allow():
+        raise DatabaseUnavailable(f"{name}: circuit breaker ochiq")
+    probe = breaker.probing
+    try:
+        yield
+    except Exception as e:
+        if is_transient(e): breaker.failure()
+        else: breaker.success()
+        raise
+    else:
+        breaker.success()
+    finally:
+        if probe and breaker.probing: breaker.probing = False
+
+
+# retry=True faqat o'qish va idempotent yozuvlar uchun (pymongo retryWrites bitta
+# yozuvni o'zi bir marta qayta yuboradi). stale(*args, **kwargs) -> eski qiymat yoki None.
+def db_call(default=None, retry=False, stale=None):
+    def decorator(fn):
+        name = fn.__name__
+        timed = db_timed(fn)
+
+        async def attempt_all(args, kwargs):
+            attempts = 1 + (_retry["attempts"] if retry else 0)
+            for attempt in range(attempts):
+                try:
+                    result = await timed(*args, **kwargs)
+                except DatabaseUnavailable:
+                    raise
+                except Exception as e:
+                    if not is_transient(e):
+                        breaker.success()
+                        logger.error(f"{name} xatosi: {e}")
+                        return copy.deepcopy(default)
+                    breaker.failure()
+                    if attempt + 1 >= attempts or not breaker.allow():
+                        logger.error(f"{name}: MongoDB bilan aloqa yo'q: {e}")
+                        return _unavailable(name, stale, args, kwargs, e)
+                    await asyncio.sleep(_retry["base_delay"] * (2 ** attempt) * random.uniform(0.5, 1.5))
+                else:
+                    breaker.success()
+                    return result
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not breaker.allow():
+                return _unavailable(name, stale, args, kwargs, None)
+            probe = breaker.probing
+            try:
+                return await attempt_all(args, kwargs)
+            finally:
+                # Sinov so'rovi natijasiz tugadi (CancelledError, ichki DatabaseUnavailable):
+                # aks holda breaker half_open + probing da abadiy qotib qoladi
+                if probe and breaker.probing: breaker.probing = False
+        return wrapper
+    return decorator
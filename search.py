@@ -0,0 +1,140 @@
+import bisect
+import heapq
+import math
+import re
+import time
+from collections import defaultdict
+
+# =====================================================================
+# MAHSULOT QIDIRUVI: XOTIRADAGI PREFIKS + TRIGRAM (N-GRAM) INDEKS
+# =====================================================================
+# 1) Prefiks: nom va artikul so'zlari saralangan ro'yxatda (so'z, pid), so'rovdagi
+#    har bir so'z qaysidir so'zning boshi bo'lsa — bisect bilan topiladi.
+# 2) Fuzzy: natija yetmasa, har bir so'z "  so'z " ko'rinishida trigramlarga
+#    ajratilgan, so'rov trigramlarining kamida MIN_SCORE qismi mos kelishi kerak
+#    (xato yozilgan yoki tushib qolgan harflar).
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+MIN_SCORE = 0.6
+
+
+def normalize(text):
+    return " ".join(_TOKEN_RE.findall(str(text).lower().replace("ё", "е")))
+
+
+def _grams(token, closed=True):
+    padded = f"  {token} " if closed else f"  {token}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self):
+        self.docs = {}  # pid -> (nom, artikul, so'zlar, trigramlar)
+        self.words = []  # saralangan (so'z, pid)
+        self.postings = defaultdict(set)
+        self.built_at = 0.0
+
+    @staticmethod
+    def _parse(product):
+        name, article = normalize(product.get("name", "")), normalize(product.get("article", ""))
+        words = set(f"{name} {article}".split())
+        # "SSS-0012" -> "sss0012": artikul ajratuvchisiz yozilsa ham prefiks bo'lib topiladi
+        if article: words.add(article.replace(" ", ""))
+        grams = set()
+        for w in words:
+            grams |= _grams(w)
+        return name, article, tuple(sorted(words)), grams
+
+    @classmethod
+    def build(cls, products):
+        index = cls()
+        for p in products:
+            pid = str(p["_id"])
+            doc = index.docs[pid] = cls._parse(p)
+            index.words.extend((w, pid) for w in doc[2])
+            for g in doc[3]:
+                index.postings[g].add(pid)
+        index.words.sort()
+        index.built_at = time.monotonic()
+        return index
+
+    def add(self, product):
+        pid = str(product["_id"])
+        self.remove(pid)
+        doc = self.docs[pid] = self._parse(product)
+        for w in doc[2]:
+            bisect.insort(self.words, (w, pid))
+        for g in doc[3]:
+            self.postings[g].add(pid)
+
+    def remove(self, pid):
+        pid = str(pid)
+        doc = self.docs.pop(pid, None)
+        if not doc: return
+        for w in doc[2]:
+            i = bisect.bisect_left(self.words, (w, pid))
+            if i < len(self.words) and self.words[i] == (w, pid): del self.words[i]
+        for g in doc[3]:
+            ids = self.postings.get(g)
+            if ids:
+                ids.discard(pid)
+                if not ids: del self.postings[g]
+
+    def _prefix_range(self, token):
+        return bisect.bisect_left(self.words, (token,)), bisect.bisect_left(self.words, (token + "\uffff",))
+
+    def _prefix(self, q, tokens, limit):
+        # To'liq mos artikul har doim birinchi
+        compact = q.replace(" ", "")
+        lo, hi = bisect.bisect_left(self.words, (compact,)), bisect.bisect_left(self.words, (compact + "\0",))
+        exact = [pid for _, pid in self.words[lo:hi] if self.docs[pid][1].replace(" ", "") == compact]
+
+        # Eng tor diapazonli so'z bo'yicha yuramiz, qolgan so'zlar hujjatning o'zida tekshiriladi
+        lo, hi = min((self._prefix_range(t) for t in tokens), key=lambda r: r[1] - r[0])
+        found, seen = exact[:limit], set(exact)
+        for i in range(lo, hi):
+            if len(found) >= limit: break
+            pid = self.words[i][1]
+            if pid in seen: continue
+            seen.add(pid)
+            words = self.docs[pid][2]
+            if all(any(w.startswith(t) for w in words) for t in tokens):
+                found.append(pid)
+        return found
+
+    def _fuzzy(self, tokens, limit, exclude):
+        qgrams = set()
+        for t in tokens:
+            qgrams |= _grams(t, closed=False)
+        # Eng kam uchraydigan trigramlardan boshlaymiz: MIN_SCORE ga yetgan hujjat ulardan
+        # kamida bittasini o'z ichiga oladi, qolganlari faqat topilgan nomzodlarda tekshiriladi
+        grams = sorted(qgrams, key=lambda g: len(self.postings.get(g, ())))
+        need = math.ceil(MIN_SCORE * len(grams))
+        seed = len(grams) - need + 1
+        hits = defaultdict(int)
+        for g in grams[:seed]:
+            for pid in self.postings.get(g, ()):
+                hits[pid] += 1
+        for g in grams[seed:]:
+            posting = self.postings.get(g, ())
+            if len(posting) < len(hits):
+                for pid in posting:
+                    if pid in hits: hits[pid] += 1
+            else:
+                for pid in hits:
+                    if pid in posting: hits[pid] += 1
+        scored = ((shared, pid) for pid, shared in hits.items() if shared >= need and pid not in exclude)
+        return [pid for _, pid in heapq.nsmallest(limit, scored, key=lambda x: (-x[0], x[1]))]
+
+    def search(self, query, limit=10):
+        q = normalize(query)
+        if not q or not self.docs: return []
+        tokens = q.split()
+        found = self._prefix(q, tokens, limit)
+        if len(found) < limit:
+            found += self._fuzzy(tokens, limit - len(found), set(found))
+        return found
+
+    def __len__(self):
+        return len(self.docs)
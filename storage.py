@@ -0,0 +1,106 @@
+import copy
+from contextvars import ContextVar
+from pymongo import ReturnDocument
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from resilience import guarded
+
+# =====================================================================
+# FSM HOLATLARINI MONGODB DA SAQLASH (BIR NECHTA REPLIKA UCHUN)
+# =====================================================================
+# Hujjat: {"_id": "fsm:<chat_id>:<user_id>", "state": ..., "data": {...}, "updated_at": Date}
+# updated_at ustidagi TTL indeks (database.ensure_indexes) tashlab ketilgan sessiyalarni o'chiradi.
+# Yozuvlar darhol bazaga boradi (savat yo'qolmasligi uchun). O'qish keshi faqat BITTA update
+# doirasida yashaydi (FSMUpdateScope): bitta update ichida holat va ma'lumot bir necha marta
+# so'raladi, lekin keyingi update doim bazadan o'qiydi — boshqa replika yoki worker yozgan
+# holat darhol ko'rinadi. Scope siz chaqiruvlar (outbox, testlar) keshsiz ishlaydi.
+# Har bir so'rov circuit breaker orqali: baza ishlamasa FSMContextMiddleware ning get_state()
+# i server tanlash timeoutini kutmaydi — darhol DatabaseUnavailable, uni dp.errors
+# (bot.db_unavailable_handler) foydalanuvchiga aytadi.
+
+_PROJECTION = {"_id": 0, "state": 1, "data": 1}
+_update_cache = ContextVar("fsm_update_cache", default=None)
+
+
+class FSMUpdateScope(BaseMiddleware):
+    # dp.update.outer_middleware: har bir feed_update uchun yangi bo'sh kesh
+    async def __call__(self, handler, event, data):
+        token = _update_cache.set({})
+        try:
+            return await handler(event, data)
+        finally:
+            _update_cache.reset(token)
+
+    # Dispatcher o'zining FSMContextMiddleware ini (u get_state() ni chaqiradi) __init__ da
+    # ro'yxatga oladi: oddiy outer_middleware(...) undan keyin qo'shilib, o'sha o'qishni
+    # qamramaydi. Scope birinchi o'ringa qo'yiladi, qolganlari tartibi saqlanib qayta ulanadi.
+    @classmethod
+    def install(cls, dp):
+        manager = dp.update.outer_middleware
+        existing = list(manager)
+        for m in existing: manager.unregister(m)
+        scope = manager.register(cls())
+        for m in existing: manager.register(m)
+        return scope
+
+
+class MongoFSMStorage(BaseStorage):
+    def __init__(self, collection, key_builder=None):
+        self._col = collection
+        self._key_builder = key_builder or DefaultKeyBuilder()
+
+    def _remember(self, doc_id, doc):
+        cache = _update_cache.get()
+        if cache is not None: cache[(id(self), doc_id)] = doc
+
+    async def _load(self, key):
+        doc_id = self._key_builder.build(key)
+        cache = _update_cache.get()
+        doc = cache.get((id(self), doc_id)) if cache is not None else None
+        if doc is None:
+            async with guarded("fsm_load"):
+                doc = await self._col.find_one({"_id": doc_id}, _PROJECTION) or {}
+            self._remember(doc_id, doc)
+        return doc
+
+    async def _update(self, key, update):
+        doc_id = self._key_builder.build(key)
+        update.setdefault("$currentDate", {})["updated_at"] = True
+        try:
+            async with guarded("fsm_update"):
+                doc = await self._col.find_one_and_update(
+                    {"_id": doc_id}, update, projection=_PROJECTION,
+                    upsert=True, return_document=ReturnDocument.AFTER
+                )
+        except Exception:
+            cache = _update_cache.get()
+            if cache is not None: cache.pop((id(self), doc_id), None)
+            raise
+        self._remember(doc_id, doc or {})
+        return doc or {}
+
+    async def set_state(self, key, state=None):
+        if isinstance(state, State): state = state.state
+        if state is None:
+            await self._update(key, {"$unset": {"state": 1}})
+        else:
+            await self._update(key, {"$set": {"state": str(state)}})
+
+    async def get_state(self, key):
+        return (await self._load(key)).get("state")
+
+    async def set_data(self, key, data):
+        await self._update(key, {"$set": {"data": dict(data)}})
+
+    async def get_data(self, key):
+        return copy.deepcopy((await self._load(key)).get("data") or {})
+
+    # Har bir kalit alohida $set qilinadi: parallel yangilanishlar bir-birini yo'qotmaydi
+    async def update_data(self, key, data):
+        if not data: return await self.get_data(key)
+        doc = await self._update(key, {"$set": {f"data.{k}": v for k, v in data.items()}})
+        return copy.deepcopy(doc.get("data") or {})
+
+    async def close(self):
+        pass
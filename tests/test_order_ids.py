@@ -0,0 +1,60 @@
+# Buyurtma ID taqsimlovchisi: parallel create_order/allocate_order_id takror ID bermasligi.
+# Talab: pip install pytest mongomock-motor; real MongoDB kerak emas (replikalar bilan
+# to'liq yuklama: benchmarks/bench_order_ids.py).
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database.close_db()
+    monkeypatch.setattr(database, "AsyncIOMotorClient", lambda url, **kw: mongomock_motor.AsyncMongoMockClient())
+    monkeypatch.setattr(database, "ORDER_ID_BLOCK", 7)  # tez-tez yangi blok olinadi
+    monkeypatch.setattr(database, "_order_id_next", 0)
+    monkeypatch.setattr(database, "_order_id_end", 0)
+    monkeypatch.setattr(database, "_order_id_lock", asyncio.Lock())
+    database.init_db()
+    yield database
+    database.close_db()
+
+
+def _new_process():
+    # Boshqa replika: o'z bloki yo'q, hisoblagichdan yangisini oladi
+    database._order_id_next = database._order_id_end = 0
+
+
+def test_concurrent_allocations_are_unique(db):
+    async def run():
+        first = await asyncio.gather(*(db.allocate_order_id() for _ in range(300)))
+        _new_process()
+        second = await asyncio.gather(*(db.allocate_order_id() for _ in range(300)))
+        return first + second
+    ids = asyncio.run(run())
+    assert len(ids) == 600
+    assert len(set(ids)) == 600
+
+
+def test_concurrent_create_order_ids_are_unique(db):
+    async def run():
+        await db.ensure_indexes()
+
+        async def one(i):
+            return await db.create_order(i, "test", "000", {}, 0, "test", "test", "test", "")
+
+        ids = await asyncio.gather(*(one(i) for i in range(200)))
+        _new_process()
+        ids += await asyncio.gather(*(one(i) for i in range(200, 400)))
+        stored = await db.orders_col.distinct("order_id")
+        return ids, stored
+    ids, stored = asyncio.run(run())
+    assert None not in ids
+    assert len(set(ids)) == 400
+    assert sorted(stored) == sorted(ids)
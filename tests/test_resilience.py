@@ -0,0 +1,71 @@
+# db_call + CircuitBreaker: half-open sinov so'rovi bekor qilinsa ham breaker qotib qolmasligi.
+import asyncio
+import os
+import sys
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resilience  # noqa: E402
+from resilience import DatabaseUnavailable, breaker, db_call  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_breaker():
+    saved = (breaker.threshold, breaker.reset_timeout, dict(resilience._retry))
+    resilience.configure(1, 0, 0, 0)
+    breaker.success()
+    yield
+    breaker.threshold, breaker.reset_timeout = saved[0], saved[1]
+    resilience._retry.update(saved[2])
+    breaker.success()
+
+
+def test_cancelled_probe_releases_half_open_breaker():
+    @db_call()
+    async def down():
+        raise AutoReconnect("down")
+
+    @db_call()
+    async def slow():
+        await asyncio.sleep(10)
+
+    @db_call()
+    async def ok():
+        return "ok"
+
+    async def run():
+        with pytest.raises(DatabaseUnavailable):
+            await down()
+        assert breaker.state == "half_open"  # reset_timeout=0: darhol sinovga ruxsat
+        probe = asyncio.create_task(slow())
+        await asyncio.sleep(0)
+        assert breaker.probing
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not breaker.probing
+        assert await ok() == "ok"
+        assert breaker.state == "closed"
+    asyncio.run(run())
+
+
+def test_nested_unavailable_probe_releases_breaker():
+    @db_call()
+    async def down():
+        raise AutoReconnect("down")
+
+    @db_call()
+    async def outer():
+        return await down()
+
+    async def run():
+        with pytest.raises(DatabaseUnavailable):
+            await down()
+        # Tashqi chaqiruv sinov so'rovi: ichkisiga ruxsat yo'q -> DatabaseUnavailable
+        with pytest.raises(DatabaseUnavailable):
+            await outer()
+        assert not breaker.probing
+    asyncio.run(run())
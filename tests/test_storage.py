@@ -0,0 +1,113 @@
+# MongoFSMStorage: ikki replika (ikki storage nusxasi) bitta kolleksiyani bo'lishadi.
+# Talab: pip install pytest mongomock-motor; real MongoDB kerak emas.
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from storage import MongoFSMStorage, FSMUpdateScope  # noqa: E402
+from resilience import DatabaseUnavailable, breaker  # noqa: E402
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+
+
+def _pair():
+    col = mongomock_motor.AsyncMongoMockClient()["sss_test"]["fsm_sessions"]
+    return MongoFSMStorage(col), MongoFSMStorage(col)
+
+
+async def _in_update(coro_fn):
+    # feed_update dagi kabi: FSMUpdateScope ichida bajariladi
+    return await FSMUpdateScope()(lambda event, data: coro_fn(), None, {})
+
+
+def test_replicas_see_each_other_writes():
+    async def run():
+        a, b = _pair()
+        await _in_update(lambda: a.set_data(KEY, {"cart": {"p1": 1}}))
+        assert await _in_update(lambda: b.get_data(KEY)) == {"cart": {"p1": 1}}
+        # b o'qib bo'lgan, endi a yangilaydi: b ning keyingi update i yangi holatni ko'radi
+        await _in_update(lambda: a.update_data(KEY, {"cart": {"p1": 2}}))
+        await _in_update(lambda: a.set_state(KEY, "Checkout:phone"))
+        assert await _in_update(lambda: b.get_data(KEY)) == {"cart": {"p1": 2}}
+        assert await _in_update(lambda: b.get_state(KEY)) == "Checkout:phone"
+        await _in_update(lambda: b.set_state(KEY, None))
+        assert await _in_update(lambda: a.get_state(KEY)) is None
+    asyncio.run(run())
+
+
+def test_cache_lives_only_inside_one_update():
+    async def run():
+        a, b = _pair()
+        await a.set_data(KEY, {"step": 1})
+
+        async def reads():
+            first = await a.get_data(KEY)
+            await b.set_data(KEY, {"step": 2})
+            # shu update ichida a o'z keshidan o'qiydi
+            return first, await a.get_data(KEY)
+
+        assert await _in_update(reads) == ({"step": 1}, {"step": 1})
+        assert await _in_update(lambda: a.get_data(KEY)) == {"step": 2}
+        # scope siz chaqiruv keshsiz
+        await b.set_data(KEY, {"step": 3})
+        assert await a.get_data(KEY) == {"step": 3}
+    asyncio.run(run())
+
+
+def test_open_breaker_fails_fast():
+    async def run():
+        a, _ = _pair()
+        breaker.opened_at, breaker.probing = time.monotonic(), False  # breaker ochiq
+        try:
+            with pytest.raises(DatabaseUnavailable):
+                await a.get_state(KEY)
+            with pytest.raises(DatabaseUnavailable):
+                await a.set_data(KEY, {"x": 1})
+        finally:
+            breaker.success()
+        assert await a.get_state(KEY) is None
+    asyncio.run(run())
+
+
+def test_scope_covers_fsm_context_middleware():
+    from aiogram import Bot, Dispatcher, types
+    from aiogram.fsm.context import FSMContext
+
+    async def run():
+        a, _ = _pair()
+        await a.set_state(KEY, "Checkout:phone")
+        reads = []
+        find_one = a._col.find_one
+
+        async def counted(*args, **kwargs):
+            reads.append(args)
+            return await find_one(*args, **kwargs)
+
+        a._col.find_one = counted
+        dp = Dispatcher(storage=a)
+        FSMUpdateScope.install(dp)
+        seen = []
+
+        @dp.message()
+        async def handler(message: types.Message, state: FSMContext, raw_state):
+            seen.append((raw_state, await state.get_state(), await state.get_data()))
+
+        update = types.Update.model_validate({"update_id": 1, "message": {
+            "message_id": 1, "date": 0, "chat": {"id": KEY.chat_id, "type": "private"},
+            "from": {"id": KEY.user_id, "is_bot": False, "first_name": "t"}, "text": "hi"}})
+        bot = Bot(token="1:test")
+        try:
+            await dp.feed_update(bot, update)
+        finally:
+            await bot.session.close()
+        assert seen == [("Checkout:phone", "Checkout:phone", {})]
+        # FSMContextMiddleware ning get_state() i ham scope ichida: bitta update — bitta o'qish
+        assert len(reads) == 1
+    asyncio.run(run())
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from aiogram import BaseMiddleware, types
+from aiogram.exceptions import TelegramBadRequest
+from ratelimit import TokenBucket
+
+# =====================================================================
+# FOYDALANUVCHI FLOOD NAZORATI VA CALLBACK BIRLASHTIRISH
+# =====================================================================
+# Dispatcher ga outer middleware sifatida ulanadi (message va callback_query):
+#   - bir xil callback (masalan, ➡️ ni ketma-ket bosish) `debounce` soniya ichida
+#     yoki oldingisi hali bajarilayotganda tashlab yuboriladi;
+#   - sahifa tugmalari (u_p_) ketma-ket bajariladi, navbatda kutayotganlardan
+#     faqat oxirgisi ishlaydi — oraliq sahifalar bazaga ham, Telegramga ham bormaydi;
+#   - har bir foydalanuvchi uchun token bucket (rate/s, burst), adminlar bundan ozod;
+#   - tashlangan callback arzon call.answer() bilan yopiladi (tugmadagi soat yo'qoladi);
+#   - "message is not modified" xatosi yutiladi.
+# Holat jarayon xotirasida: webhook rejimida har bir worker o'zinikini yuritadi.
+
+logger = logging.getLogger("SSS_Throttling")
+
+PAGE_PREFIX = "u_p_"
+LIMIT_TEXT = "⏳ Бир аз күтө туруңуз..."
+
+
+class _UserState:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.last_data = None
+        self.last_at = 0.0
+        self.inflight = set()
+        self.page_seq = 0
+        self.page_lock = asyncio.Lock()
+
+
+def is_not_modified(e):
+    return isinstance(e, TelegramBadRequest) and "message is not modified" in str(e)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, rate=2, burst=6, debounce=1.0, exempt=(), max_users=10000):
+        self.rate = rate
+        self.burst = burst
+        self.debounce = debounce
+        self.exempt = set(exempt)
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self.passed = 0
+        self.debounced = 0
+        self.coalesced = 0
+        self.limited = 0
+        self.not_modified = 0
+
+    def _user(self, user_id):
+        st = self._users.get(user_id)
+        if st is None:
+            st = self._users[user_id] = _UserState(TokenBucket(self.rate, self.burst) if self.rate > 0 else None)
+            # Navbatda yoki bajarilayotgan foydalanuvchilar chiqarib yuborilmaydi
+            while len(self._users) > self.max_users:
+                old_id, old = next(iter(self._users.items()))
+                if old.inflight or old.page_lock.locked(): break
+                del self._users[old_id]
+        else:
+            self._users.move_to_end(user_id)
+        return st
+
+    def _allow(self, st, user_id, now):
+        if st.bucket is None or user_id in self.exempt: return True
+        if st.bucket.delay(now) > 0: return False
+        st.bucket.take()
+        return True
+
+    async def _run(self, handler, event, data):
+        self.passed += 1
+        try:
+            return await handler(event, data)
+        except TelegramBadRequest as e:
+            # Xuddi shu sahifa qayta chizilmoqchi bo'ldi: foydalanuvchi uchun xato emas
+            if not is_not_modified(e): raise
+            self.not_modified += 1
+            if isinstance(event, types.CallbackQuery): await self._answer(event)
+
+    @staticmethod
+    async def _answer(call, text=None):
+        try:
+            await call.answer(text)
+        except TelegramBadRequest:
+            pass  # callback allaqachon javob olgan yoki eskirgan
+
+    async def __call__(self, handler, event, data):
+        user = getattr(event, "from_user", None)
+        if user is None: return await handler(event, data)
+        st = self._user(user.id)
+        now = time.monotonic()
+
+        if not isinstance(event, types.CallbackQuery):
+            if not self._allow(st, user.id, now):
+                self.limited += 1
+                return
+            return await self._run(handler, event, data)
+
+        cb = event.data or ""
+        if cb in st.inflight or (cb == st.last_data and now - st.last_at < self.debounce):
+            self.debounced += 1
+            return await self._answer(event)
+        if not self._allow(st, user.id, now):
+            self.limited += 1
+            return await self._answer(event, LIMIT_TEXT)
+        st.last_data, st.last_at = cb, now
+
+        st.inflight.add(cb)
+        try:
+            if not cb.startswith(PAGE_PREFIX):
+                return await self._run(handler, event, data)
+            st.page_seq += 1
+            seq = st.page_seq
+            async with st.page_lock:
+                # Kutayotgan paytda yangiroq sahifa bosildi: faqat o'sha ko'rsatiladi
+                if seq != st.page_seq:
+                    self.coalesced += 1
+                    return await self._answer(event)
+                return await self._run(handler, event, data)
+        finally:
+            st.inflight.discard(cb)
+
+    def stats(self):
+        return {
+            "passed": self.passed,
+            "debounced": self.debounced,
+            "coalesced": self.coalesced,
+            "limited": self.limited,
+            "not_modified": self.not_modified,
+            "tracked_users": len(self._users)
+        }
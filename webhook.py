@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+from aiohttp import web
+from aiogram import types
+from pymongo.errors import PyMongoError
+from resilience import DatabaseUnavailable
+
+# =====================================================================
+# WEBHOOK REJIMI (LONG POLLING O'RNIGA)
+# =====================================================================
+# Lokal tekshirish (RUN_MODE=webhook, WEBHOOK_BASE_URL bo'sh qoldiriladi):
+#   curl -X POST localhost:8080/webhook \
+#        -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \
+#        -H "Content-Type: application/json" -d @update.json
+#
+# Javob kodlari (Telegram 2xx bo'lmagan javobda update ni qayta yuboradi):
+#   - 200: update qayta ishlandi yoki qayta urinishdan foyda yo'q xato (handlerdagi bug —
+#     qayta yuborilsa ham yana yiqiladi va chatning keyingi update larini to'sib qo'yadi);
+#   - 503: vaqtinchalik xato — breaker ochiq (DatabaseUnavailable) yoki MongoDB xatosi;
+#     bot.py dagi dp.errors ushlamagan holatlargina shu yerga yetadi. Foydalanuvchiga
+#     "texnik nosozlik" deb javob berilgan update (errors handler) qayta yuborilmaydi.
+
+logger = logging.getLogger("SSS_Webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def is_retryable(e):
+    return isinstance(e, (DatabaseUnavailable, PyMongoError))
+
+
+def create_app(bot, dp, path, secret=None, drain_timeout=30):
+    app = web.Application()
+    app["draining"] = False
+    inflight = set()
+
+    async def handle_update(request):
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+        # To'xtash boshlangan: Telegram update ni qayta yuboradi (boshqa worker oladi)
+        if app["draining"]:
+            return web.Response(status=503)
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": bot})
+        except Exception as e:
+            logger.warning(f"Noto'g'ri update: {e}")
+            return web.Response(status=400)
+
+        task = asyncio.current_task()
+        inflight.add(task)
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            if is_retryable(e):
+                logger.warning(f"Update {update.update_id} vaqtinchalik xato, Telegram qayta yuboradi: {e}")
+                return web.Response(status=503)
+            logger.exception(f"Update {update.update_id} xatosi: {e}")
+        finally:
+            inflight.discard(task)
+        return web.Response()
+
+    async def on_shutdown(app):
+        app["draining"] = True
+        pending = [t for t in inflight if not t.done()]
+        if pending:
+            logger.info(f"{len(pending)} ta update tugashini kutyapmiz...")
+            await asyncio.wait(pending, timeout=drain_timeout)
+
+    async def on_cleanup(app):
+        await bot.session.close()
+        await dp.storage.close()
+
+    app.router.add_post(path, handle_update)
+    app.on_shutdown.append(on_shutdown)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+# Bir nechta worker jarayoni bitta portni SO_REUSEPORT orqali bo'lishadi.
+# target(worker_index) — bitta worker ni ishga tushiruvchi modul darajasidagi funksiya (spawn uchun).
+def run_workers(target, workers):
+    if workers <= 1:
+        return target(0)
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=target, args=(i,), name=f"webhook-worker-{i}") for i in range(workers)]
+    for p in procs: p.start()
+    logger.info(f"{workers} ta webhook worker ishga tushdi")
+
+    def stop(signum, frame):
+        for p in procs:
+            if p.is_alive(): p.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    # SIGINT (Ctrl+C) terminaldan barcha jarayonlarga o'zi yetib boradi
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for p in procs: p.join()